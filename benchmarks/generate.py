@@ -0,0 +1,305 @@
+import argparse
+import asyncio
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import column, func, inspect, insert, select, table, text
+
+# Synthetic dataset for scale tests, loaded into the configured database
+# (settings.config DATABASE_BACKEND) :
+#   python -m benchmarks.generate --scale 0.1
+#   python -m benchmarks.generate --count fiche_presence=5000000 --workers 4
+# Batched Core inserts (one executemany per batch), the batches of a table can be
+# spread over several processes (--workers, mostly useful with postgresql : SQLite
+# has a single writer). Every foreign key points to a generated row, the ids start
+# after the rows already in the table.
+
+WORDS = ["sécurité", "incendie", "secourisme", "management", "excel", "anglais", "électricité", "soudure", "habilitation", "conduite"]
+
+# Insertion order : the referenced tables first
+DEFAULT_COUNTS = {
+    "role": 5,
+    "user": 1000,
+    "formateur": 200,
+    "categorie": 50,
+    "tag": 200,
+    "formation": 2000,
+    "cours": 5000,
+    "entreprise": 10000,
+    "agent_entreprise": 200000,
+    "session": 5000,
+    "session_formation": 20000,
+    # one participant per session_formation (unique sessionFormationID)
+    "session_participant": 20000,
+    "fiche_presence": 2000000,
+    "historique": 2000000,
+}
+
+# Not mapped in models.py (postgresql.sql only), filled when the table exists
+formateur_table = table(
+    "formateur", column("id"), column("nom"), column("prenom"), column("phone"), column("email"), column("createdAt"),
+)
+
+
+def _models():
+    from database_sys import models
+    return {
+        "role": models.Role,
+        "user": models.User,
+        "formateur": formateur_table,
+        "categorie": models.Categorie,
+        "tag": models.Tag,
+        "formation": models.Formation,
+        "cours": models.Cours,
+        "entreprise": models.Entreprise,
+        "agent_entreprise": models.AgentEntreprise,
+        "session": models.Session,
+        "session_formation": models.SessionFormation,
+        "session_participant": models.SessionParticipant,
+        "fiche_presence": models.FichePresence,
+        "historique": models.Historique,
+    }
+
+
+class Dataset:
+    # Builds the rows, a batch only depends on (seed, table, first id) : the same
+    # data whatever the process that builds it.
+    def __init__(self, counts: dict, offsets: dict, seed: int, now: datetime):
+        self.counts = counts
+        self.offsets = offsets
+        self.seed = seed
+        self.now = now
+        self.first_day = now.date() - timedelta(days=3 * 365)
+
+    def ids(self, name: str):
+        return range(self.offsets[name] + 1, self.offsets[name] + self.counts[name] + 1)
+
+    def ref(self, rng: random.Random, name: str):
+        return self.offsets[name] + rng.randint(1, self.counts[name])
+
+    def nth(self, name: str, n: int):
+        # Deterministic reference, used when two rows must agree
+        return self.offsets[name] + n % self.counts[name] + 1
+
+    def word(self, i: int):
+        return WORDS[i % len(WORDS)]
+
+    def created_at(self, rng: random.Random):
+        return self.now - timedelta(seconds=rng.randint(0, 3 * 365 * 86400))
+
+    def session_start(self, session_id: int):
+        return self.first_day + timedelta(days=session_id * 7 % (3 * 365))
+
+    def session_of(self, session_formation_id: int):
+        return self.nth("session", session_formation_id * 31)
+
+    def agent_of(self, session_formation_id: int):
+        return self.nth("agent_entreprise", session_formation_id * 7919)
+
+    def rows(self, name: str, start: int, stop: int):
+        build = getattr(self, f"_{name}")
+        rng = random.Random(f"{self.seed}-{name}-{start}")
+        return [build(i, rng) for i in range(start, stop)]
+
+    def _role(self, i, rng):
+        return {"id": i, "libelle": f"role {i}", "createAt": self.now}
+
+    def _user(self, i, rng):
+        return {
+            "id": i, "username": f"user{i}", "nom": f"nom {i}", "prenom": f"prenom {i}", "phone": f"06{i:09d}",
+            "email": f"user{i}@example.com", "roleID": self.ref(rng, "role"), "status": 1, "createAt": self.created_at(rng),
+        }
+
+    def _formateur(self, i, rng):
+        return {"id": i, "nom": f"formateur {i}", "prenom": f"prenom {i}", "phone": f"05{i:09d}", "email": f"formateur{i}@example.com", "createdAt": self.now}
+
+    def _categorie(self, i, rng):
+        return {"id": i, "libelle": f"categorie {self.word(i)} {i}", "createAt": self.now}
+
+    def _tag(self, i, rng):
+        return {"id": i, "libelle": f"tag {self.word(i)} {i}", "createAt": self.now}
+
+    def _formation(self, i, rng):
+        return {
+            "id": i, "libelle": f"Formation {self.word(i)} {i}", "description": f"Formation {rng.choice(WORDS)} et {rng.choice(WORDS)}",
+            "imageUrl": "", "status": 1, "formateurID": self.ref(rng, "formateur"), "createdAt": self.created_at(rng),
+        }
+
+    def _cours(self, i, rng):
+        return {
+            "id": i, "libelle": f"Cours {self.word(i)} {i}", "categorieID": self.ref(rng, "categorie"),
+            "description": f"Cours de {rng.choice(WORDS)}", "imageUrl": "", "status": 1, "createdAt": self.created_at(rng),
+        }
+
+    def _entreprise(self, i, rng):
+        return {
+            "id": i, "libelle": f"Entreprise {i}", "reference": f"REF-{i:08d}", "nom_responsable": f"responsable {i}",
+            "email_responsable": f"contact{i}@example.com", "phone_responsable": f"04{i:09d}", "createdAt": self.created_at(rng),
+        }
+
+    def _agent_entreprise(self, i, rng):
+        return {
+            "id": i, "entrepriseID": self.ref(rng, "entreprise"), "nom": f"nom {i}", "prenom": f"prenom {i}",
+            "telephone": f"07{i:09d}", "email": f"agent{i}@example.com", "createdAt": self.created_at(rng),
+        }
+
+    def _session(self, i, rng):
+        from database_sys.validity import compute_date_validite
+        start = self.session_start(i)
+        end = start + timedelta(days=rng.randint(1, 10))
+        delay = rng.choice([1, 2, 3])
+        return {
+            "id": i, "libelle": f"Session {i}", "dateDebut": start, "dateFin": end,
+            "typeValidite": "annee", "delaiValidite": delay, "dateValidite": compute_date_validite(end, "annee", delay),
+            "nbreMaxEtudiant": rng.randint(5, 30), "status": 1, "createdAt": datetime.combine(start, datetime.min.time()),
+        }
+
+    def _session_formation(self, i, rng):
+        is_groupe = rng.random() < 0.5
+        return {
+            "id": i, "sessionID": self.session_of(i), "formationID": self.ref(rng, "formation"), "createdAt": self.now,
+            "isGroupe": is_groupe, "prixGroupe": rng.randint(100, 5000) * 100 if is_groupe else 0,
+            "isPerso": not is_groupe, "prixPerso": 0 if is_groupe else rng.randint(100, 2000) * 100,
+            "isReductionGroupe": False, "pourcentageGroupe": 0, "valeurReductionGroupe": 0,
+            "isReductionPerso": False, "pourcentagePerso": 0, "valeurReductionPerso": 0,
+        }
+
+    def _session_participant(self, i, rng):
+        session_formation_id = self.nth("session_formation", i - self.offsets["session_participant"] - 1)
+        return {
+            "id": i, "agentEntrepriseID": self.agent_of(session_formation_id), "sessionID": self.session_of(session_formation_id),
+            "sessionFormationID": session_formation_id, "isGroupe": True, "isPerso": False,
+        }
+
+    def _fiche_presence(self, i, rng):
+        # Signed by the participant of the session_formation, during the session
+        session_formation_id = self.ref(rng, "session_formation")
+        day = self.session_start(self.session_of(session_formation_id)) + timedelta(days=rng.randint(0, 10))
+        return {
+            "id": i, "agentEntrepriseID": self.agent_of(session_formation_id), "sessionformationID": session_formation_id,
+            "formateurID": self.ref(rng, "formateur"), "dateDebut": day, "dateFin": day, "signatureElectronique": "",
+            "createdAt": datetime.combine(day, datetime.min.time()),
+        }
+
+    def _historique(self, i, rng):
+        return {
+            "id": i, "userID": self.ref(rng, "user"), "description": f"{rng.choice(['creation', 'modification', 'suppression'])} {i}",
+            "typeOperation": rng.choice(["POST", "PUT", "DELETE"]), "createAt": self.created_at(rng),
+        }
+
+
+def insert_batch(dataset: Dataset, name: str, start: int, stop: int, engine=None):
+    # Runs in the worker processes too : the engine is created by the import there
+    if engine is None:
+        from database_sys.database import engine
+    rows = dataset.rows(name, start, stop)
+    with engine.begin() as connection:
+        connection.execute(insert(_models()[name]), rows)
+    return len(rows)
+
+
+def existing_offsets(engine, names):
+    offsets = {}
+    with engine.connect() as connection:
+        for name in names:
+            offsets[name] = connection.scalar(select(func.coalesce(func.max(column("id")), 0)).select_from(table(name))) or 0
+    return offsets
+
+
+def reset_sequences(engine, names):
+    # postgresql : the BIGSERIAL sequences did not see the explicit ids
+    with engine.begin() as connection:
+        for name in names:
+            connection.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('\"{name}\"', 'id'), (SELECT coalesce(max(id), 1) FROM \"{name}\"))"
+            ))
+
+
+def generate(engine, counts: dict, seed: int = 42, batch_size: int = 10000, workers: int = 1, verbose: bool = True):
+    # Loads `counts` rows per table, returns the Dataset (ids and offsets used).
+    # Without formateur table (SQLite, models.py) the formateurID are plain numbers.
+    existing_tables = set(inspect(engine).get_table_names())
+    offsets = existing_offsets(engine, [name for name in counts if name in existing_tables])
+    offsets = {name: offsets.get(name, 0) for name in counts}
+    dataset = Dataset(counts, offsets, seed, datetime.now())
+
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        for name in DEFAULT_COUNTS:
+            if name not in existing_tables:
+                continue
+            start_time = time.perf_counter()
+            ids = dataset.ids(name)
+            batches = [(start, min(start + batch_size, ids.stop)) for start in range(ids.start, ids.stop, batch_size)]
+            if executor is None:
+                inserted = sum(insert_batch(dataset, name, start, stop, engine) for start, stop in batches)
+            else:
+                inserted = sum(executor.map(insert_batch, *zip(*[(dataset, name, start, stop) for start, stop in batches])))
+            if verbose:
+                elapsed = time.perf_counter() - start_time
+                print(f"{name:<20} {inserted:>10} rows {elapsed:>8.1f}s {inserted / max(elapsed, 1e-9):>10.0f} rows/s")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if engine.dialect.name == "postgresql":
+        reset_sequences(engine, [name for name in DEFAULT_COUNTS if name in existing_tables])
+    return dataset
+
+
+async def rebuild_stats():
+    # The generated rows do not go through the API : session_stats is computed afterwards
+    from database_sys.crud import rebuild_session_stats
+    from database_sys.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        return await rebuild_session_stats(db)
+
+
+def parse_counts(scale: float, overrides: list):
+    counts = {name: max(int(count * scale), 1) for name, count in DEFAULT_COUNTS.items()}
+    for override in overrides:
+        name, _, value = override.partition("=")
+        if name not in counts or not value.isdigit():
+            raise SystemExit(f"--count {override} : table=nombre attendu, tables : {', '.join(DEFAULT_COUNTS)}")
+        counts[name] = int(value)
+    # unique sessionFormationID : at most one participant per session_formation
+    counts["session_participant"] = min(counts["session_participant"], counts["session_formation"])
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic dataset for scale tests")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the default counts")
+    parser.add_argument("--count", action="append", default=[], metavar="TABLE=N", help="rows of one table")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=1, help="processes building and inserting the batches")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from database_sys import models
+    from database_sys.database import engine
+    from database_sys.search import create_search_index
+    models.Base.metadata.create_all(bind=engine)
+    create_search_index(engine)
+
+    counts = parse_counts(args.scale, args.count)
+    start_time = time.perf_counter()
+    generate(engine, counts, args.seed, args.batch_size, args.workers)
+
+    async def finish():
+        from database_sys.database import async_engine
+        try:
+            return await rebuild_stats()
+        finally:
+            await async_engine.dispose()
+
+    print(f"session_stats : {asyncio.run(finish())} sessions")
+    print(f"done in {time.perf_counter() - start_time:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
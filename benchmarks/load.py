@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import subprocess
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+import httpx
+from benchmarks.generate import WORDS, generate, rebuild_stats
+from benchmarks.scenarios import SCENARIOS
+
+# In process load test of the API on a local SQLite database :
+#   python -m benchmarks.load --scenario mixed --concurrency 20 --duration 30
+# The app is driven through its ASGI interface (no server, no network), the
+# database is a fresh file seeded at start. The p50 / p95 / p99 latencies and the
+# throughput of every endpoint are written to benchmarks/results/ as JSON, to
+# compare two commits : --compare benchmarks/results/<previous>.json
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def load_app(database: Path):
+    # database_sys.database reads SQLITE_PATH when it is imported : override it first
+    from settings import config
+    config.DATABASE_BACKEND = "sqlite"
+    config.SQLITE_PATH = database
+    import main
+    return main
+
+
+def table_counts(rows: int):
+    # Rows seeded per table (benchmarks.generate)
+    session_formation = max(rows // 5, 5)
+    return {
+        "role": 3,
+        "user": max(rows // 10, 10),
+        "formateur": 20,
+        "categorie": 10,
+        "tag": 20,
+        "formation": rows,
+        "cours": rows,
+        "entreprise": max(rows // 20, 5),
+        "agent_entreprise": rows,
+        "session": max(rows // 10, 5),
+        "session_formation": session_formation,
+        "session_participant": session_formation,
+        "fiche_presence": rows * 2,
+        "historique": rows,
+    }
+
+
+class Context:
+    # Random values used by the scenario steps
+    def __init__(self, sizes: dict, rng: random.Random):
+        self.sizes = sizes
+        self.rng = rng
+        self.counter = itertools.count(1)
+
+    def pick(self, table: str):
+        return self.rng.randint(1, self.sizes[table])
+
+    def unique(self):
+        return f"{os.getpid()}-{next(self.counter)}"
+
+    def new_user(self):
+        key = self.unique()
+        return {
+            "username": f"bench{key}", "nom": "nom", "prenom": "prenom", "phone": f"bench{key}",
+            "email": f"bench{key}@example.com", "roleID": self.pick("role"), "user_status": 1,
+        }
+
+    def search_term(self):
+        return self.rng.choice(WORDS)[:self.rng.randint(3, 6)]
+
+
+def _value(value, ctx):
+    return value(ctx) if callable(value) else value
+
+
+def percentile(values: list, p: float):
+    # Nearest rank, values are sorted
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+async def drive(app, steps, ctx: Context, concurrency: int, duration: float, total_requests):
+    # `concurrency` virtual users sending requests back to back until the duration
+    # is over (or total_requests have been sent)
+    latencies = defaultdict(list)
+    errors = Counter()
+    weights = [step.weight for step in steps]
+    remaining = [total_requests]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        deadline = time.perf_counter() + duration
+
+        async def virtual_user():
+            while time.perf_counter() < deadline:
+                if remaining[0] is not None:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                step = ctx.rng.choices(steps, weights)[0]
+                start = time.perf_counter()
+                try:
+                    response = await client.request(
+                        step.method, _value(step.path, ctx), params=_value(step.params, ctx), data=_value(step.data, ctx),
+                    )
+                    failed = response.status_code >= 400
+                except Exception:
+                    failed = True
+                latencies[step.name].append((time.perf_counter() - start) * 1000)
+                if failed:
+                    errors[step.name] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[virtual_user() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def summarize(latencies: dict, errors: Counter, elapsed: float):
+    def stats(values, error_count):
+        values = sorted(values)
+        return {
+            "count": len(values),
+            "errors": error_count,
+            "rps": round(len(values) / elapsed, 1),
+            "mean_ms": round(sum(values) / len(values), 2),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "max_ms": round(values[-1], 2),
+        }
+
+    endpoints = {name: stats(values, errors[name]) for name, values in sorted(latencies.items())}
+    all_values = [value for values in latencies.values() for value in values]
+    return stats(all_values, sum(errors.values())), endpoints
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: dict, previous: dict = None):
+    header = f"{'endpoint':<45} {'count':>7} {'err':>5} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}"
+    if previous:
+        header += f" {'p95 before':>11} {'req/s before':>13}"
+    print(header)
+    rows = list(results["endpoints"].items()) + [("TOTAL", results["total"])]
+    for name, stats in rows:
+        line = f"{name:<45} {stats['count']:>7} {stats['errors']:>5} {stats['rps']:>8} {stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}"
+        if previous:
+            before = previous["total"] if name == "TOTAL" else previous["endpoints"].get(name)
+            if before:
+                line += f" {before['p95_ms']:>11} {before['rps']:>13}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In process load test of the API")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=10, help="virtual users")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--requests", type=int, default=None, help="stop after this number of requests")
+    parser.add_argument("--warmup", type=int, default=50, help="requests sent before measuring")
+    parser.add_argument("--rows", type=int, default=1000, help="size of the seeded tables")
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+    parser.add_argument("--database", default=str(RESULTS_DIR / "benchmark.db"))
+    parser.add_argument("--output", help="results file, default benchmarks/results/<scenario>-<commit>.json")
+    parser.add_argument("--compare", help="results of a previous run")
+    args = parser.parse_args()
+
+    database = Path(args.database)
+    database.parent.mkdir(parents=True, exist_ok=True)
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{database}{suffix}").unlink(missing_ok=True)
+
+    app_module = load_app(database)
+    app_module.create_database()
+    from database_sys.database import engine
+
+    counts = table_counts(args.rows)
+    start = time.perf_counter()
+    generate(engine, counts, args.seed, verbose=False)
+    print(f"seeded {sum(counts.values())} rows in {time.perf_counter() - start:.1f}s")
+
+    steps = SCENARIOS[args.scenario]
+    ctx = Context(counts, random.Random(args.seed))
+
+    async def run():
+        # ASGITransport does not send the lifespan events : startup / shutdown by hand
+        await app_module.app.router.startup()
+        try:
+            await rebuild_stats()
+            if args.warmup:
+                await drive(app_module.app, steps, ctx, args.concurrency, math.inf, args.warmup)
+            return await drive(app_module.app, steps, ctx, args.concurrency, args.duration, args.requests)
+        finally:
+            await app_module.app.router.shutdown()
+
+    latencies, errors, elapsed = asyncio.run(run())
+    total, endpoints = summarize(latencies, errors, elapsed)
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "scenario": args.scenario,
+        "concurrency": args.concurrency,
+        "duration_s": round(elapsed, 2),
+        "rows": args.rows,
+        "total": total,
+        "endpoints": endpoints,
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as compare_file:
+            previous = json.load(compare_file)
+    print_results(results, previous)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{args.scenario}-{commit or datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    with open(output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
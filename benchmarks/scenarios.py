@@ -0,0 +1,74 @@
+from collections import namedtuple
+
+# Load test scenarios, one per route group of main.py.
+# A scenario is a list of weighted steps, every virtual user picks its next step
+# at random according to the weights (benchmarks/load.py).
+#   name   : key of the step in the results ("GET /formations/{id}/")
+#   path, params, data : values or functions(ctx) -> value, ctx is a load.Context
+#   data   : form fields, the step is a write when it has some
+Step = namedtuple("Step", ["weight", "method", "name", "path", "params", "data"], defaults=[None, None])
+
+
+def _formation(ctx):
+    return ctx.pick("formation")
+
+
+def _session(ctx):
+    return ctx.pick("session")
+
+
+def _user(ctx):
+    return ctx.pick("user")
+
+
+SCENARIOS = {
+    "formations": [
+        Step(5, "GET", "GET /formations/", "/formations/"),
+        Step(2, "GET", "GET /formations/?formateurID=", "/formations/", lambda ctx: {"formateurID": ctx.pick("formateur")}),
+        Step(5, "GET", "GET /formations/{id}/", lambda ctx: f"/formations/{_formation(ctx)}/"),
+    ],
+    "cours": [
+        Step(5, "GET", "GET /cours/", "/cours/"),
+        Step(2, "GET", "GET /cours/?categorieID=", "/cours/", lambda ctx: {"categorieID": ctx.pick("categorie")}),
+        Step(5, "GET", "GET /cours/{id}/", lambda ctx: f"/cours/{ctx.pick('cours')}/"),
+    ],
+    "sessions": [
+        Step(3, "GET", "GET /sessions/", "/sessions/"),
+        Step(3, "GET", "GET /sessions/{id}/", lambda ctx: f"/sessions/{_session(ctx)}/"),
+        Step(3, "GET", "GET /sessions/{id}/full/", lambda ctx: f"/sessions/{_session(ctx)}/full/"),
+        Step(1, "GET", "GET /sessions/stats/", "/sessions/stats/"),
+        Step(3, "GET", "GET /sessions/{id}/stats/", lambda ctx: f"/sessions/{_session(ctx)}/stats/"),
+        Step(2, "GET", "GET /fiche_presences/?sessionformationID=", "/fiche_presences/", lambda ctx: {"sessionformationID": ctx.pick("session_formation")}),
+    ],
+    "references": [
+        Step(5, "GET", "GET /tags/", "/tags/"),
+        Step(5, "GET", "GET /categories/", "/categories/"),
+        Step(5, "GET", "GET /roles/", "/roles/"),
+        Step(3, "GET", "GET /tags/{id}/", lambda ctx: f"/tags/{ctx.pick('tag')}/"),
+        # Every write invalidates the cache of the table
+        Step(1, "POST", "POST /roles/", "/roles/", data=lambda ctx: {"libelle": f"role {ctx.unique()}"}),
+    ],
+    "users": [
+        Step(4, "GET", "GET /users/", "/users/"),
+        Step(4, "GET", "GET /users/{id}/", lambda ctx: f"/users/{_user(ctx)}/"),
+        Step(1, "POST", "POST /users/", "/users/", data=lambda ctx: ctx.new_user()),
+        Step(1, "PUT", "PUT /users/{id}/", lambda ctx: f"/users/{_user(ctx)}/", data=lambda ctx: {"nom": f"nom {ctx.unique()}"}),
+    ],
+    "historiques": [
+        Step(3, "GET", "GET /historiques/", "/historiques/"),
+        Step(2, "GET", "GET /historiques/?userID=", "/historiques/", lambda ctx: {"userID": _user(ctx)}),
+        Step(5, "POST", "POST /historiques/", "/historiques/", data=lambda ctx: {
+            "userID": _user(ctx), "description": f"operation {ctx.unique()}", "typeOperation": "benchmark",
+        }),
+    ],
+    "entreprises": [
+        Step(5, "GET", "GET /entreprises/", "/entreprises/"),
+        Step(5, "GET", "GET /entreprises/{id}/", lambda ctx: f"/entreprises/{ctx.pick('entreprise')}/"),
+    ],
+    "search": [
+        Step(1, "GET", "GET /search/?q=", "/search/", lambda ctx: {"q": ctx.search_term()}),
+    ],
+}
+
+# Everything at once, reads and writes mixed
+SCENARIOS["mixed"] = [step for steps in SCENARIOS.values() for step in steps]
@@ -0,0 +1,90 @@
+import argparse
+import json
+import time
+from datetime import datetime
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+from database_sys import models
+from database_sys.schemas import FormationOut
+
+# Serialization cost of a list endpoint (GET /formations/), without the database :
+#   jsonable_encoder : ORM rows -> jsonable_encoder -> JSONResponse (no response_model, before)
+#   response_model   : ORM rows -> FormationOut (pydantic-core) -> ORJSONResponse (now)
+#   dump_json        : ORM rows -> FormationOut -> JSON bytes in one call (reference cache)
+# python -m benchmarks.serialization --rows 10000 --repeat 5
+
+
+def make_rows(count: int):
+    today_date = datetime.now()
+    return [
+        models.Formation(
+            id=i,
+            libelle=f"Formation {i}",
+            description="Description de la formation " * 4,
+            imageUrl=f"/medias/store/ab/cd/{i:064x}.png",
+            status=1,
+            formateurID=i % 50 + 1,
+            createdAt=today_date,
+            updatedAt=None,
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def with_jsonable_encoder(rows):
+    return JSONResponse(content=jsonable_encoder(rows)).body
+
+
+adapter = TypeAdapter(List[FormationOut])
+
+
+def with_response_model(rows):
+    # What FastAPI does for a route with response_model
+    content = adapter.dump_python(adapter.validate_python(rows, from_attributes=True), mode="json")
+    return ORJSONResponse(content=content).body
+
+
+def with_dump_json(rows):
+    return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+
+def measure(func, rows, repeat: int):
+    # Best of `repeat` runs, in milliseconds
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(rows)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialization cost per 10k rows")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    # Same document whatever the path
+    assert json.loads(with_jsonable_encoder(rows)) == json.loads(with_response_model(rows)) == json.loads(with_dump_json(rows))
+
+    results = {}
+    for name, func in (("jsonable_encoder", with_jsonable_encoder), ("response_model", with_response_model), ("dump_json", with_dump_json)):
+        elapsed = measure(func, rows, args.repeat)
+        results[name] = {"ms": round(elapsed, 2), "ms_per_10k_rows": round(elapsed * 10000 / args.rows, 2)}
+        print(f"{name:<18} {results[name]['ms_per_10k_rows']:>10} ms / 10k rows")
+
+    baseline = results["jsonable_encoder"]["ms"]
+    for name in ("response_model", "dump_json"):
+        print(f"{name} : x{baseline / results[name]['ms']:.1f}")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"rows": args.rows, "repeat": args.repeat, "results": results}, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
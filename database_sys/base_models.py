@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 from pydantic import BaseModel
 from typing import Optional, Union
 from fastapi import  File, UploadFile
@@ -48,7 +48,7 @@ class SessionBase(BaseModel):
     dateFin : int
     typeValidite : str
     delaiValidite : int
-    dateValidite : str
+    dateValidite : Optional[date] = None
     nbreMaxEtudiant : int
     status : int
     createAt : datetime
@@ -119,6 +119,21 @@ class FichePresenceBase(BaseModel):
     createAt : datetime 
     updatedAt : datetime 
 
+class SessionParticipantBulkItem(SessionParticipantBase):
+    # one row of POST /session_participants/bulk/, with an id : update of that participant
+    id : Optional[int] = None
+
+class FichePresenceBulkItem(BaseModel):
+    # one row of POST /fiche_presences/bulk/, the signature is the url of an already uploaded file
+    # (media row). With an id : update of that fiche
+    id : Optional[int] = None
+    agentEntrepriseID : int
+    sessionformationID : int
+    formateurID : int
+    dateDebut : date
+    dateFin : date
+    signatureElectronique : str
+
 class UserBase(BaseModel):
     username : str
     nom : str
@@ -0,0 +1,439 @@
+import json
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from fastapi import UploadFile
+from sqlalchemy import Integer, bindparam, case, cast, delete, func, insert, select, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from database_sys import models
+from settings.config import EXPORT_CHUNK_SIZE
+from utils.manage_file import save_upload_file
+
+###################################### GENERIC ######################################
+async def get_all(db: AsyncSession, model):
+    return (await db.scalars(select(model))).all()
+
+###################################### MEDIAS ######################################
+# The files are shared between rows (content addressed), media.refCount counts
+# the rows using each file. The changes are committed with the caller's commit.
+
+def _insert(db: AsyncSession):
+    if db.bind.dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
+
+
+async def save_media(db: AsyncSession, upload_file: UploadFile):
+    file_url, digest, size = await save_upload_file(upload_file)
+    if not file_url:
+        return ""
+
+    today_date = datetime.now()
+    # Single upsert : safe when the same file is uploaded by two requests at once
+    insert = _insert(db)
+    query = insert(models.Media).values(path=file_url, hash=digest, size=size, refCount=1, createAt=today_date)
+    query = query.on_conflict_do_update(
+        index_elements=[models.Media.path],
+        set_={"refCount": models.Media.refCount + 1, "updatedAt": today_date},
+    )
+    await db.execute(query)
+
+    return file_url
+
+
+async def release_media(db: AsyncSession, file_url):
+    if not file_url:
+        return
+
+    await db.execute(
+        update(models.Media)
+        .where(models.Media.path==file_url, models.Media.refCount > 0)
+        .values(refCount=models.Media.refCount - 1, updatedAt=datetime.now())
+    )
+
+
+async def add_media_references(db: AsyncSession, file_urls: list, sign: int = 1):
+    # refCount of several files (bulk imports) in one executemany, an url can repeat.
+    # sign=1 : references taken, sign=-1 : released (never below 0)
+    counts = Counter(file_url for file_url in file_urls if file_url)
+    if not counts:
+        return
+    table = models.Media.__table__
+    ref_count = table.c.refCount + bindparam("delta")
+    await db.execute(
+        update(table)
+        .where(table.c.path==bindparam("media_path"))
+        .values(refCount=case((ref_count < 0, 0), else_=ref_count), updatedAt=bindparam("now")),
+        [{"media_path": file_url, "delta": sign * count, "now": datetime.now()} for file_url, count in counts.items()],
+    )
+
+
+async def get_image_urls(db: AsyncSession):
+    # Every formation / cours image, used to render the variants of the existing images
+    query = select(models.Formation.imageUrl).union(select(models.Cours.imageUrl))
+    return [file_url for file_url in await db.scalars(query) if file_url]
+
+
+async def get_referenced_media(db: AsyncSession):
+    # Counter {url: number of rows} of every url stored in a media column, read in
+    # one streamed pass (yield_per)
+    query = union_all(
+        select(models.Formation.imageUrl),
+        select(models.Cours.imageUrl),
+        select(models.FichePresence.signatureElectronique),
+    ).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    referenced = Counter()
+    result = await db.stream(query)
+    async for file_urls in result.scalars().partitions():
+        referenced.update(file_url for file_url in file_urls if file_url)
+    return referenced
+
+
+async def get_media_ref_counts(db: AsyncSession):
+    # {url: refCount} of every media row, streamed
+    query = select(models.Media.path, models.Media.refCount).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    ref_counts = {}
+    result = await db.stream(query)
+    async for rows in result.partitions():
+        ref_counts.update(rows)
+    return ref_counts
+
+
+async def fix_media_ref_counts(db: AsyncSession, fixes: list):
+    # fixes : (url, refCount read, number of rows found). Only applied when refCount
+    # did not change since it was read : a write made meanwhile is not overwritten
+    if not fixes:
+        return
+    table = models.Media.__table__
+    await db.execute(
+        update(table)
+        .where(table.c.path==bindparam("media_path"), table.c.refCount==bindparam("seen"))
+        .values(refCount=bindparam("count"), updatedAt=bindparam("now")),
+        [{"media_path": file_url, "seen": seen, "count": count, "now": datetime.now()} for file_url, seen, count in fixes],
+    )
+    await db.commit()
+
+
+async def delete_media_rows(db: AsyncSession, file_urls: list):
+    # Rows of the files removed by the media GC, still unreferenced
+    for start in range(0, len(file_urls), EXPORT_CHUNK_SIZE):
+        await db.execute(
+            delete(models.Media)
+            .where(models.Media.path.in_(file_urls[start:start + EXPORT_CHUNK_SIZE]), models.Media.refCount==0)
+        )
+    await db.commit()
+
+
+###################################### BULK ######################################
+async def check_references(db: AsyncSession, valid: dict, references: dict, errors: list):
+    # references : {column: referenced model}. One "WHERE id IN (...)" query per
+    # referenced table for the whole batch, the rows pointing to a missing id
+    # are moved from valid to errors.
+    row_errors = {}
+    for column, model in references.items():
+        ids = {values[column] for values in valid.values()}
+        found = set((await db.scalars(select(model.id).where(model.id.in_(ids)))).all())
+        for index, values in valid.items():
+            if values[column] not in found:
+                row_errors.setdefault(index, []).append(f"{column}: {model.__tablename__} {values[column]} n'existe pas")
+
+    for index, messages in row_errors.items():
+        del valid[index]
+        errors.append({"row": index, "errors": messages})
+    errors.sort(key=lambda error: error["row"])
+
+
+async def check_media(db: AsyncSession, valid: dict, columns: tuple, errors: list):
+    # Same as check_references for the media urls : a row can only point to an
+    # uploaded file (media row), one query per column for the whole batch
+    row_errors = {}
+    for column in columns:
+        file_urls = {values[column] for values in valid.values() if values[column]}
+        found = set((await db.scalars(select(models.Media.path).where(models.Media.path.in_(file_urls)))).all())
+        for index, values in valid.items():
+            if values[column] and values[column] not in found:
+                row_errors.setdefault(index, []).append(f"{column}: le fichier {values[column]} n'existe pas")
+
+    for index, messages in row_errors.items():
+        del valid[index]
+        errors.append({"row": index, "errors": messages})
+    errors.sort(key=lambda error: error["row"])
+
+
+async def get_rows_by_id(db: AsyncSession, model, ids):
+    # {id: object} of the rows updated by a bulk import
+    return {row.id: row for row in await db.scalars(select(model).where(model.id.in_(set(ids))))}
+
+
+async def bulk_insert(db: AsyncSession, model, rows: list):
+    # A single executemany for the whole batch, committed by the caller
+    await db.execute(insert(model), rows)
+
+
+async def bulk_update(db: AsyncSession, model, rows: list):
+    # Update by primary key ("id" in every row), one executemany, committed by the caller
+    await db.execute(update(model), rows)
+
+
+###################################### SESSIONS ######################################
+async def get_session_full(db: AsyncSession, session_id: int):
+    # The session with its formations (+ formation, fiches de presence) and its
+    # participants (+ agent, entreprise) : one query per level, 7 queries whatever
+    # the number of participants.
+    formations = selectinload(models.Session.formations)
+    query = (
+        select(models.Session)
+        .where(models.Session.id==session_id)
+        .options(
+            formations.selectinload(models.SessionFormation.formation),
+            formations.selectinload(models.SessionFormation.fiches_presence),
+            selectinload(models.Session.participants)
+            .selectinload(models.SessionParticipant.agent)
+            .selectinload(models.AgentEntreprise.entreprise),
+        )
+    )
+    return await db.scalar(query)
+
+
+###################################### SESSION STATS ######################################
+STATS_COLUMNS = ("nbreParticipants", "nbreParticipantsGroupe", "nbreParticipantsPerso", "nbreFichesPresence", "nbreJoursPresence", "chiffreAffaires")
+
+
+def _field(row, name):
+    # The writes give dicts (bulk imports) or ORM objects (handlers)
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def participant_price(session_formation, is_groupe: bool):
+    # Price paid by a participant, reduction in percent then in value.
+    # Same rule as _price_expression (rebuild)
+    if is_groupe:
+        price, reduction = session_formation.prixGroupe, session_formation.isReductionGroupe
+        percent, value = session_formation.pourcentageGroupe, session_formation.valeurReductionGroupe
+    else:
+        price, reduction = session_formation.prixPerso, session_formation.isReductionPerso
+        percent, value = session_formation.pourcentagePerso, session_formation.valeurReductionPerso
+    if reduction:
+        return price - price * percent // 100 - value
+    return price
+
+
+def _price_expression(is_groupe: bool):
+    sf = models.SessionFormation
+    if is_groupe:
+        price, reduction, percent, value = sf.prixGroupe, sf.isReductionGroupe, sf.pourcentageGroupe, sf.valeurReductionGroupe
+    else:
+        price, reduction, percent, value = sf.prixPerso, sf.isReductionPerso, sf.pourcentagePerso, sf.valeurReductionPerso
+    return case((reduction, price - price * percent // 100 - value), else_=price)
+
+
+async def _add_session_stats(db: AsyncSession, deltas: dict):
+    # deltas : {sessionID: Counter(column -> delta)}, one upsert per session
+    today_date = datetime.now()
+    insert = _insert(db)
+    for session_id, values in deltas.items():
+        query = insert(models.SessionStats).values(sessionID=session_id, updatedAt=today_date, **values)
+        query = query.on_conflict_do_update(
+            index_elements=[models.SessionStats.sessionID],
+            set_=dict(
+                {column: getattr(models.SessionStats, column) + query.excluded[column] for column in values},
+                updatedAt=today_date,
+            ),
+        )
+        await db.execute(query)
+
+
+async def _session_formations(db: AsyncSession, ids):
+    query = select(models.SessionFormation).where(models.SessionFormation.id.in_(set(ids)))
+    return {session_formation.id: session_formation for session_formation in await db.scalars(query)}
+
+
+async def update_participant_stats(db: AsyncSession, participants: list, sign: int = 1):
+    # sign=1 : participants added, sign=-1 : removed. Called before the commit of the write
+    session_formations = await _session_formations(db, [_field(row, "sessionFormationID") for row in participants])
+    deltas = defaultdict(Counter)
+    for row in participants:
+        is_groupe = _field(row, "isGroupe")
+        delta = deltas[_field(row, "sessionID")]
+        delta["nbreParticipants"] += sign
+        delta["nbreParticipantsGroupe" if is_groupe else "nbreParticipantsPerso"] += sign
+        session_formation = session_formations.get(_field(row, "sessionFormationID"))
+        if session_formation is not None:
+            delta["chiffreAffaires"] += sign * participant_price(session_formation, is_groupe)
+    await _add_session_stats(db, deltas)
+
+
+async def update_presence_stats(db: AsyncSession, fiches: list, sign: int = 1):
+    # Same as update_participant_stats for the fiches de presence
+    session_formations = await _session_formations(db, [_field(row, "sessionformationID") for row in fiches])
+    deltas = defaultdict(Counter)
+    for row in fiches:
+        session_formation = session_formations.get(_field(row, "sessionformationID"))
+        if session_formation is None:
+            continue
+        delta = deltas[session_formation.sessionID]
+        delta["nbreFichesPresence"] += sign
+        delta["nbreJoursPresence"] += sign * ((_as_date(_field(row, "dateFin")) - _as_date(_field(row, "dateDebut"))).days + 1)
+    await _add_session_stats(db, deltas)
+
+
+async def rebuild_session_stats(db: AsyncSession):
+    # Whole table computed again with two GROUP BY (after imports made outside of
+    # the API, or to fix a drift). Returns the number of sessions.
+    sp, sf, fp = models.SessionParticipant, models.SessionFormation, models.FichePresence
+    if db.bind.dialect.name == "postgresql":
+        days = fp.dateFin - fp.dateDebut + 1
+    else:
+        days = cast(func.julianday(fp.dateFin) - func.julianday(fp.dateDebut) + 1, Integer)
+
+    stats = defaultdict(lambda: dict.fromkeys(STATS_COLUMNS, 0))
+    participants = (
+        select(
+            sp.sessionID,
+            func.count(),
+            func.sum(case((sp.isGroupe, 1), else_=0)),
+            func.sum(case((sp.isGroupe, 0), else_=1)),
+            func.sum(case((sp.isGroupe, _price_expression(True)), else_=_price_expression(False))),
+        )
+        .outerjoin(sf, sf.id==sp.sessionFormationID)
+        .group_by(sp.sessionID)
+    )
+    for session_id, count, groupe, perso, revenue in await db.execute(participants):
+        stats[session_id].update(nbreParticipants=count, nbreParticipantsGroupe=groupe, nbreParticipantsPerso=perso, chiffreAffaires=revenue or 0)
+
+    presences = select(sf.sessionID, func.count(), func.sum(days)).join(sf, sf.id==fp.sessionformationID).group_by(sf.sessionID)
+    for session_id, count, total_days in await db.execute(presences):
+        stats[session_id].update(nbreFichesPresence=count, nbreJoursPresence=total_days or 0)
+
+    today_date = datetime.now()
+    await db.execute(delete(models.SessionStats))
+    if stats:
+        await db.execute(insert(models.SessionStats), [dict(values, sessionID=session_id, updatedAt=today_date) for session_id, values in stats.items()])
+    await db.commit()
+    return len(stats)
+
+
+async def get_sessions_stats(db: AsyncSession, session_id: int = None):
+    # One row per session (0 when nothing has been recorded yet), read by primary key
+    query = (
+        select(
+            models.Session.id.label("sessionID"),
+            models.Session.libelle,
+            *[func.coalesce(getattr(models.SessionStats, column), 0).label(column) for column in STATS_COLUMNS],
+        )
+        .outerjoin(models.SessionStats, models.SessionStats.sessionID==models.Session.id)
+        .order_by(models.Session.id)
+    )
+    if session_id is not None:
+        query = query.where(models.Session.id==session_id)
+    return (await db.execute(query)).mappings().all()
+
+
+###################################### CERTIFICATS ######################################
+async def get_certificate_rows(db: AsyncSession, session_id: int):
+    # Everything printed on the certificates of a session in a single query
+    query = (
+        select(
+            models.SessionParticipant.id.label("participantID"),
+            models.Session.id.label("sessionID"),
+            models.AgentEntreprise.nom,
+            models.AgentEntreprise.prenom,
+            models.Formation.libelle.label("formation"),
+            models.Session.libelle.label("session"),
+            models.Session.dateDebut,
+            models.Session.dateFin,
+            models.Session.dateValidite,
+        )
+        .join(models.Session, models.Session.id==models.SessionParticipant.sessionID)
+        .join(models.AgentEntreprise, models.AgentEntreprise.id==models.SessionParticipant.agentEntrepriseID)
+        .join(models.SessionFormation, models.SessionFormation.id==models.SessionParticipant.sessionFormationID)
+        .join(models.Formation, models.Formation.id==models.SessionFormation.formationID)
+        .where(models.SessionParticipant.sessionID==session_id)
+        .order_by(models.SessionParticipant.id)
+    )
+    return [dict(row) for row in (await db.execute(query)).mappings()]
+
+
+###################################### JOBS ######################################
+JOB_PENDING = "en_attente"
+JOB_RUNNING = "en_cours"
+JOB_DONE = "termine"
+JOB_FAILED = "erreur"
+
+
+async def create_job(db: AsyncSession, job_type: str, payload: dict):
+    db_job = models.Job(
+        typeJob=job_type,
+        payload=json.dumps(payload),
+        status=JOB_PENDING,
+        attempts=0,
+        createAt=datetime.now(),
+    )
+    db.add(db_job)
+    await db.commit()
+    await db.refresh(db_job)
+    return db_job
+
+
+async def claim_job(db: AsyncSession):
+    # Takes the oldest pending job in a single UPDATE ... RETURNING, two workers
+    # can never get the same job (SKIP LOCKED on postgresql, the database lock on sqlite)
+    pending = select(models.Job.id).where(models.Job.status==JOB_PENDING).order_by(models.Job.id).limit(1)
+    if db.bind.dialect.name == "postgresql":
+        pending = pending.with_for_update(skip_locked=True)
+
+    job_id = await db.scalar(
+        update(models.Job)
+        .where(models.Job.id==pending.scalar_subquery())
+        .values(status=JOB_RUNNING, startedAt=datetime.now(), attempts=models.Job.attempts + 1)
+        .returning(models.Job.id)
+    )
+    await db.commit()
+    if job_id is None:
+        return None
+    return await db.get(models.Job, job_id)
+
+
+def _claimed(db_job):
+    # The attempt number is the owner token : a job requeued by requeue_stale_jobs
+    # and claimed again belongs to the new attempt, not to the old worker
+    return models.Job.id==db_job.id, models.Job.status==JOB_RUNNING, models.Job.attempts==db_job.attempts
+
+
+async def heartbeat_job(db: AsyncSession, db_job):
+    # startedAt refreshed while the job runs, False when the job is no longer ours
+    refreshed = await db.execute(update(models.Job).where(*_claimed(db_job)).values(startedAt=datetime.now()))
+    await db.commit()
+    return refreshed.rowcount == 1
+
+
+async def finish_job(db: AsyncSession, db_job, result=None, error=None):
+    # False when the job was requeued meanwhile : the result is dropped
+    finished = await db.execute(
+        update(models.Job).where(*_claimed(db_job))
+        .values(
+            status=JOB_FAILED if error else JOB_DONE,
+            result=json.dumps(result) if result is not None else None,
+            error=error,
+            finishedAt=datetime.now(),
+        )
+    )
+    await db.commit()
+    return finished.rowcount == 1
+
+
+async def requeue_stale_jobs(db: AsyncSession, timeout: int, max_attempts: int):
+    # Jobs left "en_cours" by a worker that died : retried until max_attempts
+    limit = datetime.now() - timedelta(seconds=timeout)
+    stale = (models.Job.status==JOB_RUNNING, models.Job.startedAt < limit)
+    await db.execute(update(models.Job).where(*stale, models.Job.attempts < max_attempts).values(status=JOB_PENDING))
+    await db.execute(
+        update(models.Job).where(*stale, models.Job.attempts >= max_attempts)
+        .values(status=JOB_FAILED, error="Délai dépassé", finishedAt=datetime.now())
+    )
+    await db.commit()
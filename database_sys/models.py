@@ -56,6 +56,9 @@ class AgentEntreprise(Base):
     email = Column(Text)
     createdAt = Column(TIMESTAMP(timezone=False), nullable=False)
     updatedAt = Column(TIMESTAMP(timezone=False))
+
+    entreprise = relationship("Entreprise", primaryjoin="foreign(AgentEntreprise.entrepriseID) == Entreprise.id", viewonly=True, lazy="raise")
+
     __table_args__ = (
         Index('agent_entreprise_entrepriseid_index', 'entrepriseID'),
         UniqueConstraint('telephone', name='agent_entreprise_telephone_unique'),
@@ -91,6 +94,16 @@ class Session(Base):
     createdAt = Column(TIMESTAMP(timezone=False), nullable=False)
     updatedAt = Column(TIMESTAMP(timezone=False), nullable=True)
 
+    # The foreign keys are not declared on the columns, the joins are explicit.
+    # lazy="raise" : the relations are only available when loaded with selectinload()
+    formations = relationship("SessionFormation", primaryjoin="Session.id == foreign(SessionFormation.sessionID)", viewonly=True, lazy="raise")
+    participants = relationship("SessionParticipant", primaryjoin="Session.id == foreign(SessionParticipant.sessionID)", viewonly=True, lazy="raise")
+
+    __table_args__ = (
+        # Expiry queries by date range (database_sys.validity)
+        Index('session_datevalidite_index', 'dateValidite'),
+    )
+
 class Entreprise(Base):
     __tablename__ = 'entreprise'
     id = Column(BigInteger, autoincrement=True, primary_key=True)
@@ -113,6 +126,9 @@ class SessionParticipant(Base):
     sessionFormationID = Column(BigInteger, nullable=False)
     isGroupe = Column(Boolean, nullable=False)
     isPerso = Column(Boolean, nullable=False)
+
+    agent = relationship("AgentEntreprise", primaryjoin="foreign(SessionParticipant.agentEntrepriseID) == AgentEntreprise.id", viewonly=True, lazy="raise")
+
     __table_args__ = (
         Index('session_participant_agententrepriseid_index', 'agentEntrepriseID'),
         Index('session_participant_sessionid_index', 'sessionID'),
@@ -136,6 +152,10 @@ class SessionFormation(Base):
     isReductionPerso = Column(Boolean, nullable=False)
     pourcentagePerso = Column(Integer, nullable=False)
     valeurReductionPerso = Column(Integer, nullable=False)
+
+    formation = relationship("Formation", primaryjoin="foreign(SessionFormation.formationID) == Formation.id", viewonly=True, lazy="raise")
+    fiches_presence = relationship("FichePresence", primaryjoin="SessionFormation.id == foreign(FichePresence.sessionformationID)", viewonly=True, lazy="raise")
+
     __table_args__ = (
         Index('session_formation_sessionid_index', 'sessionID'),
         Index('session_formation_formationid_index', 'formationID'),
@@ -280,4 +300,58 @@ class Historique(Base):
     createAt = Column(DateTime, nullable=False)
     updatedAt = Column(DateTime, nullable=True)
 
-    __table_args__ = (Index('historique_userid_index', 'userID'),)
\ No newline at end of file
+    # Partitioned by month on postgresql, see database_sys/partitions.py.
+    # AUTOINCREMENT on sqlite : the ids of the rows moved to the monthly tables are never reused
+    __table_args__ = (
+        Index('historique_userid_index', 'userID'),
+        Index('historique_createat_index', 'createAt'),
+        {'sqlite_autoincrement': True},
+    )
+
+class Media(Base):
+    __tablename__ = 'media'
+
+    # One row per stored file (content addressed, see utils.manage_file)
+    # refCount : number of rows (imageUrl, signatureElectronique) using the file
+    id = Column(Integer, primary_key=True)
+    path = Column(String, nullable=False, unique=True)
+    hash = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    refCount = Column(Integer, nullable=False, default=0)
+    createAt = Column(DateTime, nullable=False)
+    updatedAt = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index('media_hash_index', 'hash'),)
+
+class Job(Base):
+    __tablename__ = 'job'
+
+    # Background work queue, consumed by worker.py (see utils.jobs)
+    # status : en_attente -> en_cours -> termine | erreur
+    id = Column(Integer, primary_key=True)
+    typeJob = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="en_attente")
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    createAt = Column(DateTime, nullable=False)
+    startedAt = Column(DateTime, nullable=True)
+    finishedAt = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index('job_status_index', 'status', 'id'),)
+
+class SessionStats(Base):
+    __tablename__ = 'session_stats'
+
+    # Counters of a session, updated in the same transaction as the participant /
+    # fiche de presence writes (see crud.update_participant_stats), rebuilt from
+    # scratch by the "session_stats" job
+    sessionID = Column(BigInteger, primary_key=True, autoincrement=False)
+    nbreParticipants = Column(Integer, nullable=False, default=0)
+    nbreParticipantsGroupe = Column(Integer, nullable=False, default=0)
+    nbreParticipantsPerso = Column(Integer, nullable=False, default=0)
+    nbreFichesPresence = Column(Integer, nullable=False, default=0)
+    nbreJoursPresence = Column(Integer, nullable=False, default=0)
+    chiffreAffaires = Column(BigInteger, nullable=False, default=0)
+    updatedAt = Column(DateTime, nullable=True)
\ No newline at end of file
@@ -0,0 +1,340 @@
+import gzip
+import json
+import os
+import re
+from datetime import date, datetime, time, timedelta
+from fastapi import HTTPException, Request, Response, status
+from sqlalchemy import Column, Index, MetaData, Table, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import visitors
+from database_sys import models
+from database_sys.database import async_engine
+from settings.config import (
+    ARCHIVE_DIR, EXPORT_CHUNK_SIZE, HISTORIQUE_HOT_MONTHS, HISTORIQUE_PARTITIONS_AHEAD, HISTORIQUE_RETENTION_MONTHS,
+)
+from utils.filters import filtered_query
+from utils.pagination import Page, paginate
+
+# Storage of "historique" by month.
+#   PostgreSQL : "historique" is partitioned by range of "createAt" (postgresql.sql),
+#                one partition historique_YYYY_MM per month, created in advance.
+#   SQLite     : "historique" keeps the last HISTORIQUE_HOT_MONTHS months, the older
+#                months are moved to monthly tables historique_YYYY_MM.
+# A query by date range (?since=&until=) only reads the partitions / tables of
+# the months it covers. The months older than HISTORIQUE_RETENTION_MONTHS are
+# written to ARCHIVE_DIR (gzip NDJSON) and dropped by the "archive_historique" job.
+# The reads by id and the exports go through every table (historique_tables).
+
+PARTITION_NAME = re.compile(r"^historique_(\d{4})_(\d{2})$")
+
+historique_table = models.Historique.__table__
+
+
+def month_start(day: date):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date):
+    return f"historique_{month:%Y_%m}"
+
+
+def monthly_table(name: str):
+    # Same columns as historique (SQLite monthly tables)
+    table = Table(name, MetaData(), *[column._copy() for column in historique_table.columns])
+    Index(f"{name}_userid_index", table.c.userID)
+    Index(f"{name}_createat_index", table.c.createAt)
+    return table
+
+
+def _partitions(connection):
+    # {month: table name} of the monthly partitions / tables
+    if connection.dialect.name == "postgresql":
+        names = connection.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "WHERE parent.relname = 'historique'"
+        )).scalars()
+    else:
+        names = connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'historique_%'")).scalars()
+    months = {}
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months[date(int(match[1]), int(match[2]), 1)] = name
+    return months
+
+
+def _is_partitioned(connection):
+    return connection.dialect.name == "postgresql" and connection.execute(text(
+        "SELECT 1 FROM pg_partitioned_table JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid "
+        "WHERE pg_class.relname = 'historique'"
+    )).first() is not None
+
+
+def _sqlite_autoincrement(connection):
+    # historique created without AUTOINCREMENT : SQLite gives max(id) + 1, the ids of
+    # the rows moved to the monthly tables come back once historique is empty.
+    # Rebuilt with AUTOINCREMENT, the sequence starts after the largest archived id
+    sql = connection.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'historique'")).scalar()
+    if sql is None or "AUTOINCREMENT" in sql.upper():
+        return
+    columns = ", ".join(f'"{column.name}"' for column in historique_table.columns)
+    connection.execute(text('ALTER TABLE "historique" RENAME TO "historique_rebuild"'))
+    for index in historique_table.indexes:
+        connection.execute(text(f'DROP INDEX IF EXISTS "{index.name}"'))
+    historique_table.create(connection)
+    connection.execute(text(f'INSERT INTO "historique" ({columns}) SELECT {columns} FROM "historique_rebuild"'))
+    connection.execute(text('DROP TABLE "historique_rebuild"'))
+
+    last_id = max([
+        connection.scalar(select(func.max(table.c.id))) or 0
+        for table in [monthly_table(name) for name in _partitions(connection).values()] + [historique_table]
+    ])
+    connection.execute(text("DELETE FROM sqlite_sequence WHERE name = 'historique'"))
+    connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('historique', :seq)"), {"seq": last_id})
+
+
+def _create_partitions(connection, today: date):
+    if connection.dialect.name != "postgresql":
+        _sqlite_autoincrement(connection)
+        # Tables created before the index was added to the model
+        connection.execute(text('CREATE INDEX IF NOT EXISTS historique_createat_index ON historique ("createAt")'))
+        return
+    if not _is_partitioned(connection):
+        return
+    # One creator at a time (startup of the api, workers), released at commit
+    connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('historique_partitions'))"))
+    existing = _partitions(connection)
+    month = month_start(today)
+    ahead = {add_months(month, offset) for offset in range(HISTORIQUE_PARTITIONS_AHEAD + 1)}
+    # Months written to historique_default while their partition did not exist : a
+    # partition can not be created over rows of the default one, they are moved to it
+    stray = {
+        month_start(value) for value in
+        connection.execute(text('SELECT DISTINCT date_trunc(\'month\', "createAt") FROM "historique_default"')).scalars()
+    }
+    for start in sorted((ahead | stray) - set(existing)):
+        name = partition_name(start)
+        bounds = f"FROM ('{start}') TO ('{add_months(start, 1)}')"
+        if start not in stray:
+            connection.execute(text(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "historique" FOR VALUES {bounds}'))
+            continue
+        in_month = '"createAt" >= :start AND "createAt" < :end'
+        month_range = {"start": start, "end": add_months(start, 1)}
+        connection.execute(text(f'CREATE TABLE "{name}" (LIKE "historique" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+        connection.execute(text(f'INSERT INTO "{name}" SELECT * FROM "historique_default" WHERE {in_month}'), month_range)
+        connection.execute(text(f'DELETE FROM "historique_default" WHERE {in_month}'), month_range)
+        # The indexes and the primary key of historique are created on the partition
+        connection.execute(text(f'ALTER TABLE "historique" ATTACH PARTITION "{name}" FOR VALUES {bounds}'))
+
+
+def create_historique_partitions(engine):
+    # Called at startup, after create_all. Idempotent.
+    with engine.begin() as connection:
+        _create_partitions(connection, date.today())
+
+
+async def ensure_historique_partitions():
+    # Same from the worker, every HISTORIQUE_PARTITIONS_INTERVAL : the months
+    # ahead exist even when the api is not restarted and nothing is archived
+    async with async_engine.begin() as connection:
+        await connection.run_sync(_create_partitions, date.today())
+
+
+def _month_criteria(table, month: date):
+    start = datetime.combine(month, time.min)
+    end = datetime.combine(add_months(month, 1), time.min)
+    return [table.c.createAt >= start, table.c.createAt < end]
+
+
+def adapt_clause(clause, table):
+    # The same filters on a monthly table
+    def replace(element):
+        if isinstance(element, Column) and element.table is historique_table:
+            return table.c[element.name]
+        return None
+    return visitors.replacement_traverse(clause, {}, replace)
+
+
+async def _write_archive(connection, table, month: date):
+    # gzip NDJSON of one month, written next to its final name then renamed.
+    # No file for an empty month : (None, 0)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    file_path = os.path.join(ARCHIVE_DIR, f"{partition_name(month)}.ndjson.gz")
+    query = select(table).where(*_month_criteria(table, month)).order_by(table.c.id).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    count = 0
+    result = await connection.stream(query)
+    with gzip.open(f"{file_path}.tmp", "wt", encoding="utf-8") as archive:
+        async for rows in result.mappings().partitions():
+            archive.write("".join(json.dumps(dict(row), default=str) + "\n" for row in rows))
+            count += len(rows)
+    if not count:
+        os.remove(f"{file_path}.tmp")
+        return None, 0
+    os.replace(f"{file_path}.tmp", file_path)
+    return file_path, count
+
+
+async def _oldest_month(table, before: date):
+    # Month of the oldest row of table older than before, None when there is none :
+    # the empty months are skipped
+    async with async_engine.connect() as connection:
+        oldest = await connection.scalar(
+            select(func.min(table.c.createAt)).where(table.c.createAt < datetime.combine(before, time.min))
+        )
+    return month_start(oldest) if oldest else None
+
+
+async def archive_historique(today: date = None):
+    # Job "archive_historique" (utils/jobs.py), returns what has been moved
+    today = today or date.today()
+    hot_limit = add_months(month_start(today), -HISTORIQUE_HOT_MONTHS)
+    retention_limit = add_months(month_start(today), -HISTORIQUE_RETENTION_MONTHS)
+    summary = {"moved": {}, "archived": {}}
+
+    async with async_engine.begin() as connection:
+        await connection.run_sync(_create_partitions, today)
+        is_sqlite = connection.dialect.name == "sqlite"
+        partitioned = await connection.run_sync(_is_partitioned)
+
+    if is_sqlite:
+        # Old months still in historique -> monthly tables, one transaction per month
+        # that has rows
+        while (current := await _oldest_month(historique_table, hot_limit)) is not None:
+            table = monthly_table(partition_name(current))
+            columns = [column.name for column in historique_table.columns]
+            async with async_engine.begin() as connection:
+                await connection.run_sync(table.metadata.create_all)
+                moved = await connection.execute(
+                    table.insert().from_select(columns, select(historique_table).where(*_month_criteria(historique_table, current)))
+                )
+                await connection.execute(historique_table.delete().where(*_month_criteria(historique_table, current)))
+            summary["moved"][f"{current:%Y-%m}"] = moved.rowcount
+
+    # Months past the retention -> ARCHIVE_DIR, then dropped
+    async with async_engine.connect() as connection:
+        partitions = await connection.run_sync(_partitions)
+    for current, name in sorted(partitions.items()):
+        if current >= retention_limit:
+            continue
+        async with async_engine.begin() as connection:
+            file_path, count = await _write_archive(connection, monthly_table(name), current)
+            if partitioned:
+                await connection.execute(text(f'ALTER TABLE "historique" DETACH PARTITION "{name}"'))
+            await connection.execute(text(f'DROP TABLE "{name}"'))
+        if count:
+            summary["archived"][f"{current:%Y-%m}"] = {"file": file_path, "rows": count}
+
+    if not is_sqlite and not partitioned:
+        # historique created by create_all (not partitioned) : archived and deleted by month
+        while (current := await _oldest_month(historique_table, retention_limit)) is not None:
+            async with async_engine.begin() as connection:
+                file_path, count = await _write_archive(connection, historique_table, current)
+                await connection.execute(historique_table.delete().where(*_month_criteria(historique_table, current)))
+            summary["archived"][f"{current:%Y-%m}"] = {"file": file_path, "rows": count}
+
+    return summary
+
+
+async def historique_tables(connection):
+    # Tables holding the historique rows, oldest ids first : on SQLite the monthly
+    # tables then historique. PostgreSQL reads its partitions through historique
+    tables = [historique_table]
+    if connection.dialect.name == "sqlite":
+        months = await connection.run_sync(_partitions)
+        tables[:0] = [monthly_table(name) for month, name in sorted(months.items())]
+    return tables
+
+
+async def _find_historique(db: AsyncSession, historique_id: int):
+    # (table, row) of an entry wherever it is stored, the recent ones first.
+    # (None, None) when it does not exist
+    for table in reversed(await historique_tables(await db.connection())):
+        row = (await db.execute(select(table).where(table.c.id==historique_id))).first()
+        if row is not None:
+            return table, row
+    return None, None
+
+
+async def get_historique(db: AsyncSession, historique_id: int):
+    return (await _find_historique(db, historique_id))[1]
+
+
+async def update_historique(db: AsyncSession, historique_id: int, values: dict):
+    # Returns the updated row, None when the entry does not exist
+    table, row = await _find_historique(db, historique_id)
+    if table is None:
+        return None
+    await db.execute(table.update().where(table.c.id==historique_id).values(**values))
+    await db.commit()
+    return (await db.execute(select(table).where(table.c.id==historique_id))).first()
+
+
+async def delete_historique(db: AsyncSession, historique_id: int):
+    table, row = await _find_historique(db, historique_id)
+    if table is None:
+        return False
+    await db.execute(table.delete().where(table.c.id==historique_id))
+    await db.commit()
+    return True
+
+
+async def paginate_historique(db: AsyncSession, request: Request, page: Page, response: Response, since: date = None, until: date = None):
+    # GET /historiques/ : keyset pagination (utils.pagination) limited to [since, until]
+    query = filtered_query(models.Historique, request)
+    if since:
+        query = query.where(models.Historique.createAt >= datetime.combine(since, time.min))
+    if until:
+        query = query.where(models.Historique.createAt < datetime.combine(until + timedelta(days=1), time.min))
+
+    # PostgreSQL prunes the partitions itself, SQLite only has to read historique
+    # when no archived month is in the range
+    months = {}
+    if db.bind.dialect.name == "sqlite":
+        months = await (await db.connection()).run_sync(_partitions)
+        months = {
+            month: name for month, name in months.items()
+            if (since is None or add_months(month, 1) > since) and (until is None or month <= until)
+        }
+    if not months:
+        return await paginate(db, models.Historique, page, response, query)
+
+    # SQLite with archived months : the monthly tables (oldest ids) then historique
+    if page.sort not in (None, "id", "-id"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Le tri des historiques archivés se fait uniquement sur 'id' !")
+    descending = page.sort == "-id"
+    try:
+        last_id = int(page.after) if page.after is not None else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Curseur de pagination invalide !")
+
+    sources = [monthly_table(name) for month, name in sorted(months.items())] + [historique_table]
+    if descending:
+        sources.reverse()
+
+    rows, total = [], 0
+    for table in sources:
+        source_query = select(table)
+        if query.whereclause is not None:
+            source_query = source_query.where(adapt_clause(query.whereclause, table))
+        if page.with_total:
+            total += await db.scalar(select(func.count()).select_from(source_query.subquery()))
+        if len(rows) > page.limit:
+            continue
+        if last_id is not None:
+            source_query = source_query.where(table.c.id < last_id if descending else table.c.id > last_id)
+        order = table.c.id.desc() if descending else table.c.id
+        rows += (await db.execute(source_query.order_by(order).limit(page.limit + 1 - len(rows)))).all()
+
+    if page.with_total:
+        response.headers["X-Total-Count"] = str(total)
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return rows
@@ -0,0 +1,227 @@
+from datetime import date, datetime
+from pydantic import BaseModel, ConfigDict
+from typing import Generic, List, Optional, TypeVar
+
+# Output schemas (response_model of the routes). They are built from the ORM
+# objects (from_attributes) and serialized by pydantic-core, FastAPI does not
+# fall back to jsonable_encoder for these routes.
+# The input schemas are in base_models.py
+
+T = TypeVar("T")
+
+
+class OrmBase(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+
+class DataOut(BaseModel, Generic[T]):
+    # {"data": ...} returned by the create / update routes
+    data: T
+
+
+class FormationOut(OrmBase):
+    id : int
+    libelle : str
+    description : Optional[str] = None
+    imageUrl : Optional[str] = None
+    status : int
+    formateurID : int
+    createdAt : datetime
+    updatedAt : Optional[datetime] = None
+
+
+class CoursOut(OrmBase):
+    id : int
+    libelle : str
+    categorieID : int
+    description : Optional[str] = None
+    imageUrl : Optional[str] = None
+    status : int
+    createdAt : datetime
+    updatedAt : Optional[datetime] = None
+
+
+class SessionOut(OrmBase):
+    id : int
+    libelle : str
+    dateDebut : date
+    dateFin : date
+    typeValidite : str
+    delaiValidite : int
+    dateValidite : date
+    nbreMaxEtudiant : int
+    status : int
+    createdAt : datetime
+    updatedAt : Optional[datetime] = None
+
+
+class EntrepriseOut(OrmBase):
+    id : int
+    libelle : str
+    reference : str
+    nom_responsable : str
+    email_responsable : Optional[str] = None
+    phone_responsable : Optional[str] = None
+    createdAt : datetime
+    updatedAt : Optional[datetime] = None
+
+
+class AgentEntrepriseOut(OrmBase):
+    id : int
+    entrepriseID : int
+    nom : str
+    prenom : str
+    telephone : str
+    email : Optional[str] = None
+    createdAt : datetime
+    updatedAt : Optional[datetime] = None
+
+
+class FichePresenceOut(OrmBase):
+    id : int
+    agentEntrepriseID : int
+    sessionformationID : int
+    formateurID : int
+    dateDebut : date
+    dateFin : date
+    signatureElectronique : str
+    createdAt : datetime
+    updatedAt : Optional[datetime] = None
+
+
+class SessionParticipantOut(OrmBase):
+    id : int
+    agentEntrepriseID : int
+    sessionID : int
+    sessionFormationID : int
+    isGroupe : bool
+    isPerso : bool
+
+
+class SessionFormationOut(OrmBase):
+    id : int
+    sessionID : int
+    formationID : int
+    isGroupe : bool
+    prixGroupe : int
+    isPerso : bool
+    prixPerso : int
+    isReductionGroupe : bool
+    pourcentageGroupe : int
+    valeurReductionGroupe : int
+    isReductionPerso : bool
+    pourcentagePerso : int
+    valeurReductionPerso : int
+    createdAt : datetime
+    updatedAt : Optional[datetime] = None
+
+
+class TagOut(OrmBase):
+    id : int
+    libelle : str
+    createAt : datetime
+    updatedAt : Optional[datetime] = None
+
+
+class CategorieOut(OrmBase):
+    id : int
+    libelle : str
+    createAt : datetime
+    updatedAt : Optional[datetime] = None
+
+
+class RoleOut(OrmBase):
+    id : int
+    libelle : str
+    createAt : datetime
+    updatedAt : Optional[datetime] = None
+
+
+class UserOut(OrmBase):
+    id : int
+    username : str
+    nom : str
+    prenom : str
+    phone : str
+    email : str
+    roleID : int
+    status : int
+    createAt : datetime
+    updatedAt : Optional[datetime] = None
+
+
+class HistoriqueOut(OrmBase):
+    id : int
+    userID : int
+    description : str
+    typeOperation : str
+    createAt : datetime
+    updatedAt : Optional[datetime] = None
+
+
+class JobOut(OrmBase):
+    id : int
+    typeJob : str
+    payload : str
+    status : str
+    result : Optional[str] = None
+    error : Optional[str] = None
+    attempts : int
+    createAt : datetime
+    startedAt : Optional[datetime] = None
+    finishedAt : Optional[datetime] = None
+
+
+class SearchResultOut(BaseModel):
+    type : str
+    id : int
+    libelle : str
+    rank : float
+
+
+class SessionStatsOut(BaseModel):
+    # GET /sessions/stats/ (see crud.get_sessions_stats)
+    sessionID : int
+    libelle : str
+    nbreParticipants : int
+    nbreParticipantsGroupe : int
+    nbreParticipantsPerso : int
+    nbreFichesPresence : int
+    nbreJoursPresence : int
+    chiffreAffaires : int
+
+
+class CertificatExpirationOut(BaseModel):
+    # GET /certificats/expirations/ (see database_sys/validity.py)
+    participantID : int
+    sessionID : int
+    agentEntrepriseID : int
+    nom : str
+    prenom : str
+    entrepriseID : int
+    entreprise : str
+    formationID : int
+    formation : str
+    session : str
+    dateFin : date
+    dateValidite : date
+    joursRestants : int
+
+
+# GET /sessions/{session_id}/full/ (see crud.get_session_full)
+class AgentEntrepriseFullOut(AgentEntrepriseOut):
+    entreprise : Optional[EntrepriseOut] = None
+
+
+class SessionParticipantFullOut(SessionParticipantOut):
+    agent : Optional[AgentEntrepriseFullOut] = None
+
+
+class SessionFormationFullOut(SessionFormationOut):
+    formation : Optional[FormationOut] = None
+    fiches_presence : List[FichePresenceOut] = []
+
+
+class SessionFullOut(SessionOut):
+    formations : List[SessionFormationFullOut] = []
+    participants : List[SessionParticipantFullOut] = []
@@ -0,0 +1,96 @@
+import re
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Full text search over formations, cours and entreprises.
+#   SQLite     : FTS5 table "search_index" kept up to date by triggers, the rowid
+#                encodes the row : id * 4 + SEARCH_TYPES code
+#   PostgreSQL : GIN indexes on the tsvector of each table (kept up to date by postgres)
+
+# type : (code, table, title column, body expression), {row} is the trigger row prefix ("new.")
+SEARCH_TYPES = {
+    "formation": (1, "formation", "libelle", "coalesce({row}description, '')"),
+    "cours": (2, "cours", "libelle", "coalesce({row}description, '')"),
+    "entreprise": (3, "entreprise", "libelle", "{row}reference"),
+}
+SEARCH_CODES = {code: name for name, (code, *_) in SEARCH_TYPES.items()}
+
+
+def _sqlite_statements():
+    yield (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "title, body, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    for name, (code, table, title, body) in SEARCH_TYPES.items():
+        insert = f"INSERT INTO search_index(rowid, title, body) VALUES (new.id * 4 + {code}, new.{title}, {body.format(row='new.')});"
+        delete = f"DELETE FROM search_index WHERE rowid = old.id * 4 + {code};"
+        yield f"CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN {insert} END"
+        yield f"CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE ON {table} BEGIN {delete} {insert} END"
+        yield f"CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN {delete} END"
+
+
+def _postgresql_statements():
+    for name, (code, table, title, body) in SEARCH_TYPES.items():
+        yield f"CREATE INDEX IF NOT EXISTS {table}_search_index ON {table} USING GIN ({_tsvector(title, body)})"
+
+
+def _tsvector(title, body):
+    return f"to_tsvector('french', {title} || ' ' || {body.format(row='')})"
+
+
+def create_search_index(engine):
+    # Called at startup, after create_all. Idempotent.
+    with engine.begin() as connection:
+        if engine.dialect.name == "postgresql":
+            for statement in _postgresql_statements():
+                connection.execute(text(statement))
+            return
+
+        exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'search_index'")).first()
+        for statement in _sqlite_statements():
+            connection.execute(text(statement))
+        if not exists:
+            # First start : index the rows that are already there
+            for name, (code, table, title, body) in SEARCH_TYPES.items():
+                connection.execute(text(
+                    f"INSERT INTO search_index(rowid, title, body) SELECT id * 4 + {code}, {title}, {body.format(row='')} FROM {table}"
+                ))
+
+
+def _terms(q: str):
+    return re.findall(r"\w+", q.lower())
+
+
+async def search(db: AsyncSession, q: str, search_type=None, limit: int = 20):
+    # Every word must match, the last one as a prefix (search as you type)
+    terms = _terms(q)
+    if not terms:
+        return []
+    types = [search_type] if search_type else list(SEARCH_TYPES)
+
+    if db.bind.dialect.name == "postgresql":
+        tsquery = " & ".join(f"'{term}':*" for term in terms)
+        selects = []
+        for name in types:
+            code, table, title, body = SEARCH_TYPES[name]
+            vector = _tsvector(title, body)
+            selects.append(
+                f"SELECT '{name}' AS type, id, {title} AS libelle, ts_rank({vector}, query) AS rank "
+                f"FROM {table}, to_tsquery('french', :q) query WHERE {vector} @@ query"
+            )
+        sql = " UNION ALL ".join(selects) + " ORDER BY rank DESC LIMIT :limit"
+        rows = (await db.execute(text(sql), {"q": tsquery, "limit": limit})).mappings()
+        return [dict(row) for row in rows]
+
+    match = " ".join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+    codes = ", ".join(str(SEARCH_TYPES[name][0]) for name in types)
+    # bm25 : lower is better, the title weighs 10 times the body
+    sql = (
+        "SELECT rowid, title, bm25(search_index, 10.0, 1.0) AS rank FROM search_index "
+        f"WHERE search_index MATCH :match AND rowid % 4 IN ({codes}) ORDER BY rank LIMIT :limit"
+    )
+    rows = (await db.execute(text(sql), {"match": match, "limit": limit})).mappings()
+    return [
+        {"type": SEARCH_CODES[row["rowid"] % 4], "id": row["rowid"] // 4, "libelle": row["title"], "rank": -row["rank"]}
+        for row in rows
+    ]
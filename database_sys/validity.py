@@ -0,0 +1,196 @@
+import calendar
+import unicodedata
+from datetime import date, timedelta
+from fastapi import HTTPException, Response, status
+from sqlalchemy import Date, Integer, Interval, and_, case, cast, distinct, exists, func, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from database_sys import models
+from utils.pagination import Page
+
+# Validity of the certificates of a session, computed by the server :
+#   dateValidite = dateFin + delaiValidite jours / mois / annees
+# A month added to the 31st gives the last day of the shorter months (31/01 + 1 mois
+# -> 28/02 or 29/02), the same as the PostgreSQL interval arithmetic.
+# The same rule exists as a SQL expression (date_validite_expression) : the
+# "session_validite" job recomputes every session in a single UPDATE.
+# session.dateValidite is indexed : the expiry queries read the sessions of a date
+# range, then their participants (session_participant_sessionid_index).
+
+TYPES_VALIDITE = ("jour", "mois", "annee")
+# Spellings found in the rows written before the validation
+TYPE_ALIASES = {
+    "jour": "jour", "jours": "jour",
+    "mois": "mois",
+    "annee": "annee", "annees": "annee", "an": "annee", "ans": "annee",
+}
+
+
+def normalize_type_validite(value: str):
+    # "Année", "ANS", "jours" -> "annee", "annee", "jour". None when unknown
+    key = unicodedata.normalize("NFKD", value or "").encode("ascii", "ignore").decode().strip().lower()
+    return TYPE_ALIASES.get(key)
+
+
+def check_type_validite(value: str):
+    type_validite = normalize_type_validite(value)
+    if type_validite is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Type de validité inconnu (jour, mois ou annee) !")
+    return type_validite
+
+
+def add_months(day: date, months: int):
+    index = day.year * 12 + day.month - 1 + months
+    year, month = index // 12, index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def compute_date_validite(date_fin: date, type_validite: str, delai_validite: int):
+    type_validite = check_type_validite(type_validite)
+    if delai_validite is None or delai_validite < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Le délai de validité doit être positif !")
+    if type_validite == "jour":
+        return date_fin + timedelta(days=delai_validite)
+    if type_validite == "mois":
+        return add_months(date_fin, delai_validite)
+    return add_months(date_fin, 12 * delai_validite)
+
+
+def _months_expression(dialect: str, months):
+    date_fin = models.Session.dateFin
+    if dialect == "postgresql":
+        return cast(date_fin + func.make_interval(0, months, type_=Interval), Date)
+    # SQLite does not clamp ('2024-01-31', '+1 months' -> '2024-03-02') : the same
+    # day in the first day of the target month, at most its last day
+    month = func.date(date_fin, "start of month", func.printf("%+d months", months))
+    day = func.date(month, func.printf("%+d days", cast(func.strftime("%d", date_fin), Integer) - 1))
+    return func.min(day, func.date(month, "+1 month", "-1 day"))
+
+
+def date_validite_expression(dialect: str):
+    # compute_date_validite in SQL, for the rows whose typeValidite is in TYPES_VALIDITE
+    session = models.Session
+    if dialect == "postgresql":
+        days = session.dateFin + session.delaiValidite
+    else:
+        days = func.date(session.dateFin, func.printf("%+d days", session.delaiValidite))
+    return case(
+        (session.typeValidite == "jour", days),
+        (session.typeValidite == "mois", _months_expression(dialect, session.delaiValidite)),
+        else_=_months_expression(dialect, 12 * session.delaiValidite),
+    )
+
+
+def create_validity_index(engine):
+    # Called at startup, after create_all (tables created before the index was added to the model)
+    with engine.begin() as connection:
+        connection.execute(text('CREATE INDEX IF NOT EXISTS session_datevalidite_index ON session ("dateValidite")'))
+
+
+async def recompute_dates_validite(db: AsyncSession, session_ids: list = None):
+    # Job "session_validite" (utils/jobs.py) : after a change of the rule or of the
+    # imported rows. Returns the number of sessions changed and the unknown types
+    # (their sessions are left as they are)
+    session = models.Session
+    criteria = [session.id.in_(session_ids)] if session_ids else []
+
+    # Canonical spelling first : a few distinct values, one UPDATE per spelling
+    invalid = []
+    for value in (await db.scalars(select(distinct(session.typeValidite)).where(*criteria))).all():
+        type_validite = normalize_type_validite(value)
+        if type_validite is None:
+            invalid.append(value)
+        elif type_validite != value:
+            await db.execute(
+                update(session).where(session.typeValidite==value, *criteria)
+                .values(typeValidite=type_validite).execution_options(synchronize_session=False)
+            )
+
+    # Then every session at once, only the rows whose date changes are written
+    expression = date_validite_expression(db.bind.dialect.name)
+    result = await db.execute(
+        update(session)
+        .where(session.typeValidite.in_(TYPES_VALIDITE), session.delaiValidite >= 0, session.dateValidite.is_distinct_from(expression), *criteria)
+        .values(dateValidite=expression)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return {"updated": result.rowcount, "invalid": invalid}
+
+
+###################################### EXPIRATIONS ######################################
+def _parse_cursor(cursor: str):
+    # "dateValidite,participantID"
+    try:
+        value, last_id = cursor.rsplit(",", 1)
+        return date.fromisoformat(value), int(last_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Curseur de pagination invalide !")
+
+
+async def get_certificate_expirations(
+    db: AsyncSession, page: Page, response: Response,
+    start: date = None, end: date = None, entreprise_id: int = None,
+):
+    # Certificates whose dateValidite is in [start, end], sorted by dateValidite.
+    # Only the last certificate of an agent for a formation : the agents who took
+    # the formation again in a later session are not listed.
+    if page.sort not in (None, "dateValidite"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Le tri des expirations se fait uniquement sur 'dateValidite' !")
+
+    participant, session, session_formation = models.SessionParticipant, models.Session, models.SessionFormation
+    later_participant, later_session, later_formation = aliased(participant), aliased(session), aliased(session_formation)
+    renewed = exists().where(
+        later_participant.agentEntrepriseID==participant.agentEntrepriseID,
+        later_session.id==later_participant.sessionID,
+        later_formation.id==later_participant.sessionFormationID,
+        later_formation.formationID==session_formation.formationID,
+        later_session.dateValidite > session.dateValidite,
+    )
+    query = (
+        select(
+            participant.id.label("participantID"),
+            session.id.label("sessionID"),
+            models.AgentEntreprise.id.label("agentEntrepriseID"),
+            models.AgentEntreprise.nom,
+            models.AgentEntreprise.prenom,
+            models.Entreprise.id.label("entrepriseID"),
+            models.Entreprise.libelle.label("entreprise"),
+            models.Formation.id.label("formationID"),
+            models.Formation.libelle.label("formation"),
+            session.libelle.label("session"),
+            session.dateFin,
+            session.dateValidite,
+        )
+        .join(participant, participant.sessionID==session.id)
+        .join(models.AgentEntreprise, models.AgentEntreprise.id==participant.agentEntrepriseID)
+        .join(models.Entreprise, models.Entreprise.id==models.AgentEntreprise.entrepriseID)
+        .join(session_formation, session_formation.id==participant.sessionFormationID)
+        .join(models.Formation, models.Formation.id==session_formation.formationID)
+        .where(~renewed)
+    )
+    if start is not None:
+        query = query.where(session.dateValidite >= start)
+    if end is not None:
+        query = query.where(session.dateValidite <= end)
+    if entreprise_id is not None:
+        query = query.where(models.AgentEntreprise.entrepriseID==entreprise_id)
+
+    if page.with_total:
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
+        response.headers["X-Total-Count"] = str(total)
+
+    # Keyset pagination on (dateValidite, participantID), see utils.pagination
+    if page.after is not None:
+        value, last_id = _parse_cursor(page.after)
+        query = query.where(or_(session.dateValidite > value, and_(session.dateValidite==value, participant.id > last_id)))
+
+    rows = [dict(row) for row in (await db.execute(query.order_by(session.dateValidite, participant.id).limit(page.limit + 1))).mappings()]
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        response.headers["X-Next-Cursor"] = f"{rows[-1]['dateValidite']},{rows[-1]['participantID']}"
+
+    today = date.today()
+    for row in rows:
+        row["joursRestants"] = (row["dateValidite"] - today).days
+    return rows
@@ -1,38 +1,76 @@
 import datetime
-from datetime import date
-from typing import Annotated, Union
-from fastapi import Depends, FastAPI, File, HTTPException, UploadFile, Form, status
+from datetime import date, timedelta
+from typing import Annotated, List, Literal, Union
+from fastapi import Depends, FastAPI, File, HTTPException, UploadFile, Form, Query, Request, Response, status
 from database_sys import models
-from database_sys.database import engine, SessionLocal
-from sqlalchemy.orm import Session
+from database_sys.database import engine, async_engine, AsyncSessionLocal
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.responses import FileResponse
 from database_sys.base_models import *
+from database_sys.schemas import *
 from settings.config import MEDIA_ROOT
-from fastapi.staticfiles import StaticFiles
 from utils.manage_file import *
-from fastapi.responses import JSONResponse
+from database_sys.crud import create_job, get_all, get_session_full, save_media, release_media
+from database_sys.crud import get_sessions_stats, update_participant_stats, update_presence_stats
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
+from utils.pagination import Page, paginate
+from utils.filters import filtered_query
+from utils.export import export_table
+from utils.cache import cached_json_response, reference_cache
+from utils.bulk import bulk_import
+from database_sys.search import SEARCH_TYPES, create_search_index, search
+from database_sys.partitions import create_historique_partitions, delete_historique, get_historique, paginate_historique, update_historique
+from database_sys.validity import check_type_validite, compute_date_validite, create_validity_index, get_certificate_expirations
+from settings.config import MAX_PAGE_SIZE, MEDIA_GC_MODE
+from utils.metrics import instrument_engine, metrics, metrics_middleware
+from utils.audit import audit_log, audit_middleware
+from utils.images import is_stored_image, media_path, pick_variant
+from utils.media import media_response, safe_media_path
 
 #####################################################################
-app = FastAPI()
+# orjson renders the response_model output (see database_sys/schemas.py)
+app = FastAPI(default_response_class=ORJSONResponse)
 
-models.Base.metadata.create_all(bind=engine)
 
-# Mount the directory for static files
-app.mount("/medias", StaticFiles(directory=MEDIA_ROOT), name="media")
+def create_database():
+    # Tables and indexes, idempotent. Run at startup and not at import : importing
+    # main (tests, benchmarks) leaves the database file as it is
+    models.Base.metadata.create_all(bind=engine)
+    create_search_index(engine)
+    create_historique_partitions(engine)
+    create_validity_index(engine)
+
+# Latency and SQL statements of every request (Server-Timing header, GET /metrics)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+app.middleware("http")(metrics_middleware)
+# Every create / update / delete is recorded in historique (batched, see utils/audit.py)
+app.middleware("http")(audit_middleware)
+
+@app.on_event("startup")
+async def start_app():
+    create_database()
+    audit_log.start()
+
+@app.on_event("shutdown")
+async def close_database():
+    await audit_log.stop()
+    # Close the pooled connections, the aiosqlite threads would keep the process alive
+    await async_engine.dispose()
+
 
 class Item(BaseModel):
     name: str
     price: float
     is_offer: Union[bool, None] = None
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
         
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+page_dependency = Annotated[Page, Depends(Page)]
 #####################################################################
 
 
@@ -41,22 +79,22 @@ async def read_root():
     return {"Hello": "World"}
 
 ###################################### FORMATIONS ######################################
-@app.get("/formations/")
-async def get_all_formations(db: db_dependency):
+@app.get("/formations/", response_model=List[FormationOut])
+async def get_all_formations(db: db_dependency, request: Request, page: page_dependency, response: Response):
     
-    result = db.query(models.Formation).all()
+    result = await paginate(db, models.Formation, page, response, filtered_query(models.Formation, request))
     
-    if not result:
+    if not result and page.after is None:
         raise HTTPException(status_code=404, detail="Aucune formation n'a été ajoutée !")
     return result
 
-@app.get("/formations/{formation_id}/")
+@app.get("/formations/{formation_id}/", response_model=FormationOut)
 async def get_formation(
     db: db_dependency, 
     formation_id: int,
     ):
     
-    result = db.query(models.Formation).filter(models.Formation.id==formation_id).first()
+    result = await db.get(models.Formation, formation_id)
     
     if not result:
         raise HTTPException(status_code=404, detail="La formation n'existe pas !")
@@ -69,23 +107,24 @@ async def delete_formation(
     formation_id: int,
     ):
     
-    result = db.query(models.Formation).filter(models.Formation.id==formation_id).first()
+    result = await db.get(models.Formation, formation_id)
     
     if not result:
         raise HTTPException(status_code=404, detail="La formation n'existe pas !")
     # print("before delete")
     
     try:
-        db.query(models.Formation).filter(models.Formation.id==formation_id).delete()
+        await release_media(db, result.imageUrl)
+        await db.execute(delete(models.Formation).where(models.Formation.id==formation_id))
         # print("delete")
-        db.commit()
+        await db.commit()
     except Exception as e:
         return e
     
     return JSONResponse(status_code=status.HTTP_204_NO_CONTENT, content={"message": "Formation supprimée !"})
 
 
-@app.post("/formations/")
+@app.post("/formations/", response_model=DataOut[FormationOut])
 async def create_formation(
     db: db_dependency,
     formation: FormationBase, 
@@ -97,9 +136,8 @@ async def create_formation(
     ):
     # print(formation)
     if formation.imageUrl:
-        upload_to = "formations"
         # Save the uploaded file and get the URL
-        url = await save_upload_file(formation.imageUrl, upload_to)
+        url = await save_media(db, formation.imageUrl)
     else:
         url = ""
     today_date = datetime.now()
@@ -116,8 +154,11 @@ async def create_formation(
     try:
         # Save the Formation object to the database
         db.add(db_formation)
-        db.commit()
-        db.refresh()
+        await db.commit()
+        await db.refresh(db_formation)
+        if url:
+            # Resized copies rendered by the background worker (utils/images.py)
+            await create_job(db, "image_variants", {"urls": [url]})
 
         return {"data": db_formation}
     except Exception as e:
@@ -125,7 +166,7 @@ async def create_formation(
         return e
 
 
-@app.put("/formations/{formation_id}/")
+@app.put("/formations/{formation_id}/", response_model=DataOut[FormationOut])
 async def update_formation(
     db: db_dependency, 
     formation_id: int,
@@ -136,13 +177,12 @@ async def update_formation(
     imageUrl: Optional[UploadFile] = File(None),
     ):
     
-    db_formation = db.query(models.Formation).filter(models.Formation.id==formation_id).first()
+    db_formation = await db.get(models.Formation, formation_id)
     
     if db_formation:
-        upload_to = "formations"
         if imageUrl:
             # Save the uploaded file and get the URL
-            url = await save_upload_file(imageUrl, upload_to)
+            url = await save_media(db, imageUrl)
         else:
             url = ""
 
@@ -153,6 +193,7 @@ async def update_formation(
         if description:
             db_formation.description=description
         if url:
+            await release_media(db, db_formation.imageUrl)
             db_formation.imageUrl=url
         if status:
             db_formation.status=status
@@ -163,8 +204,11 @@ async def update_formation(
 
         try:
             # Save the Formation object to the database
-            db.commit()
-            db.refresh()
+            await db.commit()
+            await db.refresh(db_formation)
+            if url:
+                # Resized copies rendered by the background worker (utils/images.py)
+                await create_job(db, "image_variants", {"urls": [url]})
             
             return {"data": db_formation,}
         except Exception as e:
@@ -176,22 +220,22 @@ async def update_formation(
 
 
 ###################################### COURS ######################################
-@app.get("/cours/")
-async def get_all_courses(db: db_dependency):
+@app.get("/cours/", response_model=List[CoursOut])
+async def get_all_courses(db: db_dependency, request: Request, page: page_dependency, response: Response):
     
-    result = db.query(models.Cours).all()
+    result = await paginate(db, models.Cours, page, response, filtered_query(models.Cours, request))
     
-    if not result:
+    if not result and page.after is None:
         raise HTTPException(status_code=404, detail="Aucun cours n'a été ajoutée !")
     return result
 
-@app.get("/cours/{cours_id}/")
+@app.get("/cours/{cours_id}/", response_model=CoursOut)
 async def get_course(
     db: db_dependency, 
     cours_id: int,
     ):
     
-    result = db.query(models.Cours).filter(models.Cours.id==cours_id).first()
+    result = await db.get(models.Cours, cours_id)
     
     if not result:
         raise HTTPException(status_code=404, detail="Le cours n'existe pas !")
@@ -204,23 +248,24 @@ async def delete_course(
     cours_id: int,
     ):
     
-    result = db.query(models.Cours).filter(models.Cours.id==cours_id).first()
+    result = await db.get(models.Cours, cours_id)
     
     if not result:
         raise HTTPException(status_code=404, detail="Le cours n'existe pas !")
     # print("before delete")
     
     try:
-        db.query(models.Cours).filter(models.Cours.id==cours_id).delete()
+        await release_media(db, result.imageUrl)
+        await db.execute(delete(models.Cours).where(models.Cours.id==cours_id))
         # print("delete")
-        db.commit()
+        await db.commit()
     except Exception as e:
         return e
     
     return JSONResponse(status_code=status.HTTP_204_NO_CONTENT, content={"message": "Cours supprimé !"})
 
 
-@app.post("/cours/")
+@app.post("/cours/", response_model=DataOut[CoursOut])
 async def create_course(
     db: db_dependency, 
     libelle: str = Form(...),
@@ -230,9 +275,8 @@ async def create_course(
     imageUrl: UploadFile = File(...)
     ):
     
-    upload_to = "cours"
     # Save the uploaded file and get the URL
-    url = await save_upload_file(imageUrl, upload_to)
+    url = await save_media(db, imageUrl)
 
     today_date = datetime.now()
     # print("the image url :", url)
@@ -247,15 +291,18 @@ async def create_course(
     try:
         # Save the Formation object to the database
         db.add(db_cours)
-        db.commit()
-        db.refresh()
+        await db.commit()
+        await db.refresh(db_cours)
+        if url:
+            # Resized copies rendered by the background worker (utils/images.py)
+            await create_job(db, "image_variants", {"urls": [url]})
 
         return {"data": db_cours}
     except Exception as e:
         return e
 
 
-@app.put("/cours/{cours_id}/")
+@app.put("/cours/{cours_id}/", response_model=DataOut[CoursOut])
 async def update_course(
     db: db_dependency, 
     cours_id: int,
@@ -266,13 +313,12 @@ async def update_course(
     imageUrl: Optional[UploadFile] = File(None),
     ):
     
-    db_course = db.query(models.Cours).filter(models.Cours.id==cours_id).first()
+    db_course = await db.get(models.Cours, cours_id)
     
     if db_course:
-        upload_to = "cours"
         if imageUrl:
             # Save the uploaded file and get the URL
-            url = await save_upload_file(imageUrl, upload_to)
+            url = await save_media(db, imageUrl)
         else:
             url = ""
 
@@ -283,6 +329,7 @@ async def update_course(
         if description:
             db_course.description=description
         if url:
+            await release_media(db, db_course.imageUrl)
             db_course.imageUrl=url
         if status:
             db_course.status=status
@@ -293,8 +340,11 @@ async def update_course(
 
         try:
             # Save the Formation object to the database
-            db.commit()
-            db.refresh()
+            await db.commit()
+            await db.refresh(db_course)
+            if url:
+                # Resized copies rendered by the background worker (utils/images.py)
+                await create_job(db, "image_variants", {"urls": [url]})
             
             return {"data": db_course,}
         except Exception as e:
@@ -306,22 +356,51 @@ async def update_course(
 
 
 ###################################### SESSIONS ######################################
-@app.get("/sessions/")
-async def get_all_sessions(db: db_dependency):
+@app.get("/sessions/", response_model=List[SessionOut])
+async def get_all_sessions(db: db_dependency, request: Request, page: page_dependency, response: Response):
     
-    result = db.query(models.Session).all()
+    result = await paginate(db, models.Session, page, response, filtered_query(models.Session, request))
     
-    if not result:
+    if not result and page.after is None:
         raise HTTPException(status_code=404, detail="Aucune session n'a été ajoutée !")
     return result
 
-@app.get("/sessions/{session_id}/")
+@app.get("/sessions/stats/", response_model=List[SessionStatsOut])
+async def get_all_sessions_stats(db: db_dependency):
+    # Read from session_stats (kept up to date by the participant / presence writes)
+    return await get_sessions_stats(db)
+
+@app.post("/sessions/stats/rebuild/", response_model=DataOut[JobOut], status_code=status.HTTP_202_ACCEPTED)
+async def rebuild_sessions_stats(db: db_dependency):
+    # Recomputed from session_participant and fiche_presence by the background worker
+    db_job = await create_job(db, "session_stats", {})
+    return {"data": db_job}
+
+@app.post("/sessions/validite/recompute/", response_model=DataOut[JobOut], status_code=status.HTTP_202_ACCEPTED)
+async def recompute_sessions_validite(db: db_dependency, sessionID: Optional[List[int]] = Query(None)):
+    # dateValidite of the given sessions (all when none) recomputed in one UPDATE by the background worker
+    db_job = await create_job(db, "session_validite", {"sessionIDs": sessionID})
+    return {"data": db_job}
+
+@app.get("/sessions/{session_id}/stats/", response_model=SessionStatsOut)
+async def get_session_stats(
+    db: db_dependency, 
+    session_id: int,
+    ):
+    
+    result = await get_sessions_stats(db, session_id)
+    
+    if not result:
+        raise HTTPException(status_code=404, detail="La session n'existe pas !")
+    return result[0]
+
+@app.get("/sessions/{session_id}/", response_model=SessionOut)
 async def get_session(
     db: db_dependency, 
     session_id: int,
     ):
     
-    result = db.query(models.Session).filter(models.Session.id==session_id).first()
+    result = await db.get(models.Session, session_id)
     
     if not result:
         raise HTTPException(status_code=404, detail="La session n'existe pas !")
@@ -334,23 +413,24 @@ async def delete_session(
     session_id: int,
     ):
     
-    result = db.query(models.Session).filter(models.Session.id==session_id).first()
+    result = await db.get(models.Session, session_id)
     
     if not result:
         raise HTTPException(status_code=404, detail="La session n'existe pas !")
     # print("before delete")
     
     try:
-        db.query(models.Session).filter(models.Session.id==session_id).delete()
+        await db.execute(delete(models.SessionStats).where(models.SessionStats.sessionID==session_id))
+        await db.execute(delete(models.Session).where(models.Session.id==session_id))
         # print("delete")
-        db.commit()
+        await db.commit()
     except Exception as e:
         return e
     
     return JSONResponse(status_code=status.HTTP_204_NO_CONTENT, content={"message": "Session supprimée !"})
 
 
-@app.post("/sessions/")
+@app.post("/sessions/", response_model=DataOut[SessionOut], status_code=status.HTTP_201_CREATED)
 async def create_session(
     db: db_dependency, 
     libelle: str = Form(...),
@@ -359,11 +439,13 @@ async def create_session(
     session_status: int = Form(...),
     typeValidite: str = Form(...),
     delaiValidite: int = Form(...),
-    dateValidite: str = Form(...),
     nbreMaxEtudiant: int = Form(...),
     ): 
 
     today_date = datetime.now()
+    # dateValidite is computed from dateFin (database_sys/validity.py), not sent by the client
+    dateValidite = compute_date_validite(dateFin, typeValidite, delaiValidite)
+    typeValidite = check_type_validite(typeValidite)
     # print("the image url :", url)
     db_session = models.Session(
         libelle=libelle,
@@ -379,30 +461,29 @@ async def create_session(
     try:
         # Save the Session object to the database
         db.add(db_session)
-        db.commit()
-        db.refresh()
+        await db.commit()
+        await db.refresh(db_session)
 
-        return JSONResponse(status_code=status.HTTP_201_CREATED, content={"data": db_session})
+        return {"data": db_session}
     except Exception as e:
         print(e)
         return e
 
 
-@app.put("/sessions/{session_id}/")
+@app.put("/sessions/{session_id}/", response_model=DataOut[SessionOut])
 async def update_session(
     db: db_dependency, 
     session_id: int,
     libelle: Optional[str] = Form(None),
-    dateDebut: Optional[datetime] = Form(None),
-    dateFin: Optional[datetime] = Form(None),
+    dateDebut: Optional[date] = Form(None),
+    dateFin: Optional[date] = Form(None),
     status: Optional[int] = Form(None),
     typeValidite: Optional[str] = Form(None),
     delaiValidite: Optional[int] = Form(None),
-    dateValidite: Optional[str] = Form(None),
     nbreMaxEtudiant: Optional[int] = Form(None),
     ):
     
-    db_session = db.query(models.Session).filter(models.Session.id==session_id).first()
+    db_session = await db.get(models.Session, session_id)
     
     if db_session:
         
@@ -418,11 +499,11 @@ async def update_session(
         if status:
             db_session.status=status
         if typeValidite:
-            db_session.typeValidite=typeValidite
-        if delaiValidite:
+            db_session.typeValidite=check_type_validite(typeValidite)
+        if delaiValidite is not None:
             db_session.delaiValidite=delaiValidite
-        if dateValidite:
-            db_session.dateValidite=dateValidite
+        if dateFin or typeValidite or delaiValidite is not None:
+            db_session.dateValidite=compute_date_validite(db_session.dateFin, db_session.typeValidite, db_session.delaiValidite)
         if nbreMaxEtudiant:
             db_session.nbreMaxEtudiant=nbreMaxEtudiant
         
@@ -430,17 +511,87 @@ async def update_session(
 
         try:
             # Save the Formation object to the database
-            db.commit()
-            db.refresh()
+            await db.commit()
+            await db.refresh(db_session)
             
             return {"data": db_session,}
         except Exception as e:
             return e
     else:
         raise HTTPException(status_code=404, detail="La session n'existe pas !")
+
+
+@app.get("/sessions/{session_id}/full/", response_model=SessionFullOut)
+async def get_session_full_graph(
+    db: db_dependency, 
+    session_id: int,
+    ):
+    
+    result = await get_session_full(db, session_id)
+    
+    if not result:
+        raise HTTPException(status_code=404, detail="La session n'existe pas !")
+    return result
+
+
+@app.post("/sessions/{session_id}/certificats/", response_model=DataOut[JobOut], status_code=status.HTTP_202_ACCEPTED)
+async def generate_session_certificates(
+    db: db_dependency, 
+    session_id: int,
+    ):
+    
+    result = await db.get(models.Session, session_id)
+    
+    if not result:
+        raise HTTPException(status_code=404, detail="La session n'existe pas !")
+    
+    # Rendered by the background worker, follow it with GET /jobs/{job_id}/
+    db_job = await create_job(db, "certificats", {"sessionID": session_id})
+    return {"data": db_job}
     
 ###########################################################################################
 
+###################################### CERTIFICATS ######################################
+@app.get("/certificats/expirations/", response_model=List[CertificatExpirationOut])
+async def get_certificate_expirations_list(
+    db: db_dependency,
+    page: page_dependency,
+    response: Response,
+    days: int = Query(30, ge=0),
+    entrepriseID: Optional[int] = None,
+    ):
+    # Certificates expiring in the next `days` days, read by the dateValidite index
+    today = date.today()
+    return await get_certificate_expirations(db, page, response, today, today + timedelta(days=days), entrepriseID)
+
+@app.get("/entreprises/{entreprise_id}/certificats/expires/", response_model=List[CertificatExpirationOut])
+async def get_enterprise_expired_certificates(db: db_dependency, entreprise_id: int, page: page_dependency, response: Response):
+    # Agents of the entreprise whose last certificate of a formation has expired
+    result = await db.get(models.Entreprise, entreprise_id)
+    if not result:
+        raise HTTPException(status_code=404, detail="L'entreprise n'existe pas !")
+    return await get_certificate_expirations(db, page, response, end=date.today() - timedelta(days=1), entreprise_id=entreprise_id)
+
+###########################################################################################
+
+###################################### SESSION PARTICIPANT ######################################
+@app.post("/session_participants/bulk/")
+async def bulk_create_session_participants(db: db_dependency, request: Request, partial: bool = False):
+    # JSON array of SessionParticipantBulkItem or CSV upload ("file"), written in one transaction.
+    # Rows without id are created, rows with an id update that participant
+    return await bulk_import(
+        db, request, SessionParticipantBulkItem, models.SessionParticipant,
+        references={
+            "agentEntrepriseID": models.AgentEntreprise,
+            "sessionID": models.Session,
+            "sessionFormationID": models.SessionFormation,
+        },
+        partial=partial,
+        update_stats=update_participant_stats,
+    )
+
+###########################################################################################
+
 ###################################### FORMATION COURS ######################################
 # @app.get("/formation/{formation_id}/courses/")
 # async def get_all_course_by_formation(db: db_dependency, formation_id: int):
@@ -487,7 +638,7 @@ async def update_session(
 # @app.put("/formation/{formation_id}/set_course")
 # async def update_course_in_formation(db: db_dependency, formation_id:int, course_id: Optional[int] = Form(None), formateur_id: Optional[int] = Form(None)):
         
-#         db_session = db.query(models.FormationCours).filter(models.FormationCours.id==formation_id).first()
+#         db_session = db.get(models.FormationCours, formation_id)
         
 #         if course_id:
 #             db_session.coursID = course_id
@@ -513,14 +664,14 @@ async def update_session(
 #     formation_id: int,
 #     ):
     
-#     result = db.query(models.FormationCours).filter(models.FormationCours.id==formation_id).first()
+#     result = db.get(models.FormationCours, formation_id)
     
 #     if not result:
 #         raise HTTPException(status_code=404, detail="La formation n'existe pas !")
 #     # print("before delete")
     
 #     try:
-#         db.query(models.FormationCours).filter(models.FormationCours.id==formation_id).delete()
+#         db.execute(delete(models.FormationCours).where(models.FormationCours.id==formation_id))
 #         # print("delete")
 #         db.commit()
 #     except Exception as e:
@@ -531,24 +682,24 @@ async def update_session(
 ###########################################################################################
 
 ######################################## TAG ########################################
-@app.get("/tags/")
-async def get_all_tags(db: db_dependency):
-    result = db.query(models.Tag).all()
+@app.get("/tags/", response_model=List[TagOut])
+async def get_all_tags(db: db_dependency, request: Request):
+    result = await cached_json_response(request, "tags", "all", lambda: get_all(db, models.Tag), List[TagOut])
     if result:
         return result
     else:
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"data": {'message': "Aucun tag"}})
 
-@app.get("/tags/{tag_id}/")
-async def get_tag(db: db_dependency, tag_id: int): 
+@app.get("/tags/{tag_id}/", response_model=TagOut)
+async def get_tag(db: db_dependency, request: Request, tag_id: int): 
 
-    result = db.query(models.Tag).filter(models.Tag.id==tag_id).first()
+    result = await cached_json_response(request, "tags", tag_id, lambda: db.get(models.Tag, tag_id), TagOut)
     if result:
         return result
     else:
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"data": {'message': "le tag n'existe pas !"}})
 
-@app.post("/tags/")
+@app.post("/tags/", response_model=TagOut)
 async def create_tag(db: db_dependency, 
     libelle: str = Form(...),
     ): 
@@ -561,8 +712,9 @@ async def create_tag(db: db_dependency,
     try:
         # Save  object to the database
         db.add(db_tag)
-        db.commit()
-        db.refresh(db_tag)
+        await db.commit()
+        reference_cache.invalidate("tags")
+        await db.refresh(db_tag)
 
         return db_tag 
     except Exception as e:
@@ -570,14 +722,14 @@ async def create_tag(db: db_dependency,
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content="Une erreur s'est produits lors de la creation du tag !")
 
 
-@app.put("/tags/{tag_id}/")
+@app.put("/tags/{tag_id}/", response_model=TagOut)
 async def update_tag(
     db: db_dependency,
     tag_id: int, 
     libelle: str = Form(),
     ): 
 
-    db_tag = db.query(models.Tag).filter(models.Tag.id==tag_id).first()
+    db_tag = await db.get(models.Tag, tag_id)
     today_date = datetime.now()
 
     if db_tag:
@@ -588,8 +740,9 @@ async def update_tag(
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content="le tag n'existe pas !")
     try:
         # Save  object to the database
-        db.commit()
-        db.refresh(db_tag)
+        await db.commit()
+        reference_cache.invalidate("tags")
+        await db.refresh(db_tag)
 
         return db_tag
     except Exception as e:
@@ -600,16 +753,17 @@ async def update_tag(
 @app.delete("/tags/{tag_id}/")
 async def delete_tag(db: db_dependency, tag_id: int): 
 
-    result = db.query(models.Tag).filter(models.Tag.id==tag_id).first()
+    result = await db.get(models.Tag, tag_id)
     
     if not result:
         raise HTTPException(status_code=404, detail="Le tag n'existe pas !")
     # print("before delete")
     
     try:
-        db.query(models.Tag).filter(models.Tag.id==tag_id).delete()
+        await db.execute(delete(models.Tag).where(models.Tag.id==tag_id))
         # print("delete")
-        db.commit()
+        await db.commit()
+        reference_cache.invalidate("tags")
         return JSONResponse(status_code=status.HTTP_200_OK, content="Le tag à été supprimé !")
         
     except Exception as e:
@@ -619,24 +773,24 @@ async def delete_tag(db: db_dependency, tag_id: int):
 ############################################################################################
 
 ######################################## CATEGORIE ########################################
-@app.get("/categories/")
-async def get_all_categories(db: db_dependency):
-    result = db.query(models.Categorie).all()
+@app.get("/categories/", response_model=List[CategorieOut])
+async def get_all_categories(db: db_dependency, request: Request):
+    result = await cached_json_response(request, "categories", "all", lambda: get_all(db, models.Categorie), List[CategorieOut])
     if result:
         return result
     else:
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"data": {'message': "Aucune catégorie"}})
 
-@app.get("/categories/{cat_id}/")
-async def get_category(db: db_dependency, cat_id: int): 
+@app.get("/categories/{cat_id}/", response_model=CategorieOut)
+async def get_category(db: db_dependency, request: Request, cat_id: int): 
 
-    result = db.query(models.Categorie).filter(models.Categorie.id==cat_id).first()
+    result = await cached_json_response(request, "categories", cat_id, lambda: db.get(models.Categorie, cat_id), CategorieOut)
     if result:
         return result
     else:
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"data": {'message': "la catégorie n'existe pas !"}})
 
-@app.post("/categories/")
+@app.post("/categories/", response_model=CategorieOut)
 async def create_category(db: db_dependency, 
     libelle: str = Form(...),
     ): 
@@ -649,8 +803,9 @@ async def create_category(db: db_dependency,
     try:
         # Save  object to the database
         db.add(db_cat)
-        db.commit()
-        db.refresh(db_cat)
+        await db.commit()
+        reference_cache.invalidate("categories")
+        await db.refresh(db_cat)
 
         return db_cat 
     except Exception as e:
@@ -658,14 +813,14 @@ async def create_category(db: db_dependency,
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content="Une erreur s'est produits lors de la creation de la catégorie !")
 
 
-@app.put("/categories/{cat_id}/")
+@app.put("/categories/{cat_id}/", response_model=CategorieOut)
 async def update_category(
     db: db_dependency,
     cat_id: int, 
     libelle: str = Form(),
     ): 
 
-    db_tag = db.query(models.Categorie).filter(models.Categorie.id==cat_id).first()
+    db_tag = await db.get(models.Categorie, cat_id)
     today_date = datetime.now()
 
     if db_tag:
@@ -676,8 +831,9 @@ async def update_category(
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content="la catégorie n'existe pas !")
     try:
         # Save  object to the database
-        db.commit()
-        db.refresh(db_tag)
+        await db.commit()
+        reference_cache.invalidate("categories")
+        await db.refresh(db_tag)
 
         return db_tag
     except Exception as e:
@@ -688,16 +844,17 @@ async def update_category(
 @app.delete("/categories/{cat_id}/")
 async def delete_category(db: db_dependency, cat_id: int): 
 
-    result = db.query(models.Categorie).filter(models.Categorie.id==cat_id).first()
+    result = await db.get(models.Categorie, cat_id)
     
     if not result:
         raise HTTPException(status_code=404, detail="La categorie n'existe pas !")
     # print("before delete")
     
     try:
-        db.query(models.Categorie).filter(models.Categorie.id==cat_id).delete()
+        await db.execute(delete(models.Categorie).where(models.Categorie.id==cat_id))
         # print("delete")
-        db.commit()
+        await db.commit()
+        reference_cache.invalidate("categories")
         return JSONResponse(status_code=status.HTTP_200_OK, content="La catégorie à été supprimé !")
         
     except Exception as e:
@@ -707,22 +864,49 @@ async def delete_category(db: db_dependency, cat_id: int):
 ############################################################################################
 
 ###################################### FICHE PRESENCE ######################################
-@app.get("/fiche_presences/")
-async def get_all_attendance_sheet(db: db_dependency):
+@app.get("/fiche_presences/", response_model=List[FichePresenceOut])
+async def get_all_attendance_sheet(db: db_dependency, request: Request, page: page_dependency, response: Response):
     
-    result = db.query(models.FichePresence).all()
+    result = await paginate(db, models.FichePresence, page, response, filtered_query(models.FichePresence, request))
     
-    if not result:
+    if not result and page.after is None:
         raise HTTPException(status_code=404, detail="Aucune fiche de présence n'a été ajoutée !")
     return result
 
-@app.get("/fiche_presences/{sheet_id}/")
+@app.get("/fiche_presences/export/")
+async def export_attendance_sheets(request: Request, export_format: Literal["ndjson", "csv"] = "ndjson"):
+    return export_table(models.FichePresence, export_format, request)
+
+@app.post("/fiche_presences/export/", response_model=DataOut[JobOut], status_code=status.HTTP_202_ACCEPTED)
+async def export_attendance_sheets_to_file(db: db_dependency, export_format: Literal["ndjson", "csv"] = "ndjson"):
+    # Written in MEDIA_ROOT by the background worker, follow it with GET /jobs/{job_id}/
+    db_job = await create_job(db, "export", {"table": "fiche_presence", "format": export_format})
+    return {"data": db_job}
+
+@app.post("/fiche_presences/bulk/")
+async def bulk_create_attendance_sheets(db: db_dependency, request: Request, partial: bool = False):
+    # JSON array of FichePresenceBulkItem or CSV upload ("file"), written in one transaction.
+    # Rows without id are created, rows with an id update that fiche. The signatures
+    # must be uploaded files (media rows), their refCount is taken in the same transaction
+    return await bulk_import(
+        db, request, FichePresenceBulkItem, models.FichePresence,
+        references={
+            "agentEntrepriseID": models.AgentEntreprise,
+            "sessionformationID": models.SessionFormation,
+        },
+        partial=partial,
+        update_stats=update_presence_stats,
+        media_columns=("signatureElectronique",),
+        createdAt=datetime.now(),
+    )
+
+@app.get("/fiche_presences/{sheet_id}/", response_model=FichePresenceOut)
 async def get_attendance_sheet(
     db: db_dependency, 
     sheet_id: int,
     ):
     
-    result = db.query(models.FichePresence).filter(models.FichePresence.id==sheet_id).first()
+    result = await db.get(models.FichePresence, sheet_id)
     
     if not result:
         raise HTTPException(status_code=404, detail="La fiche de présence n'existe pas !")
@@ -735,23 +919,25 @@ async def delete_attendance_sheet(
     sheet_id: int,
     ):
     
-    result = db.query(models.FichePresence).filter(models.FichePresence.id==sheet_id).first()
+    result = await db.get(models.FichePresence, sheet_id)
     
     if not result:
         raise HTTPException(status_code=404, detail="La fiche de présence n'existe pas !")
     # print("before delete")
     
     try:
-        db.query(models.FichePresence).filter(models.FichePresence.id==sheet_id).delete()
+        await release_media(db, result.signatureElectronique)
+        await update_presence_stats(db, [result], sign=-1)
+        await db.execute(delete(models.FichePresence).where(models.FichePresence.id==sheet_id))
         # print("delete")
-        db.commit()
+        await db.commit()
     except Exception as e:
         return e
     
     return JSONResponse(status_code=status.HTTP_204_NO_CONTENT, content={"message": "La fiche de présence à été supprimée !"})
 
 
-@app.post("/fiche_presences/{sheet_id}/")
+@app.post("/fiche_presences/{sheet_id}/", response_model=DataOut[FichePresenceOut])
 async def create_attendance_sheet(
     db: db_dependency, 
     agentEntrepriseID: int = Form(...),
@@ -762,9 +948,8 @@ async def create_attendance_sheet(
     signatureElectronique: UploadFile = File(...),
     ):
 
-    upload_to = "formateur/signatures"
     # Save the uploaded file and get the URL
-    url = await save_upload_file(signatureElectronique, upload_to)
+    url = await save_media(db, signatureElectronique)
     
     today_date = datetime.now()
     # print("the image url :", url)
@@ -780,15 +965,16 @@ async def create_attendance_sheet(
     try:
         # Save the Formation object to the database
         db.add(db_attendance)
-        db.commit()
-        db.refresh()
+        await update_presence_stats(db, [db_attendance])
+        await db.commit()
+        await db.refresh(db_attendance)
 
         return {"data": db_attendance}
     except Exception as e:
         return e
 
 
-@app.put("/fiche_presences/{sheet_id}/")
+@app.put("/fiche_presences/{sheet_id}/", response_model=DataOut[FichePresenceOut])
 async def update_attendance_sheet(
     db: db_dependency, 
     sheet_id: int,
@@ -800,13 +986,14 @@ async def update_attendance_sheet(
     signatureElectronique: Optional[UploadFile] = File(None),
     ):
     
-    db_attendance_sheet = db.query(models.FichePresence).filter(models.FichePresence.id==sheet_id).first()
+    db_attendance_sheet = await db.get(models.FichePresence, sheet_id)
     
     if db_attendance_sheet:
-        upload_to = "formations"
+        # The old values are taken out of the session stats, the new ones added back
+        await update_presence_stats(db, [db_attendance_sheet], sign=-1)
         if signatureElectronique:
             # Save the uploaded file and get the URL
-            url = await save_upload_file(signatureElectronique, upload_to)
+            url = await save_media(db, signatureElectronique)
         else:
             url = ""
 
@@ -817,7 +1004,8 @@ async def update_attendance_sheet(
         if sessionformationID:
             db_attendance_sheet.sessionformationID=sessionformationID
         if url:
-            db_attendance_sheet.imageUrl=url
+            await release_media(db, db_attendance_sheet.signatureElectronique)
+            db_attendance_sheet.signatureElectronique=url
         if dateDebut:
             db_attendance_sheet.dateDebut=dateDebut
         if dateFin:
@@ -829,8 +1017,9 @@ async def update_attendance_sheet(
 
         try:
             # Save the Formation object to the database
-            db.commit()
-            db.refresh()
+            await update_presence_stats(db, [db_attendance_sheet])
+            await db.commit()
+            await db.refresh(db_attendance_sheet)
             
             return {"data": db_attendance_sheet,}
         except Exception as e:
@@ -841,25 +1030,25 @@ async def update_attendance_sheet(
 ############################################################################################
 
 ########################################### USER ###########################################
-@app.get("/users/")
-async def get_all_user(db: db_dependency): 
+@app.get("/users/", response_model=List[UserOut])
+async def get_all_user(db: db_dependency, request: Request, page: page_dependency, response: Response): 
 
-    result = db.query(models.User).all()
-    if result:
+    result = await paginate(db, models.User, page, response, filtered_query(models.User, request))
+    if result or page.after is not None:
         return result
     else:
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"data": {'message': "Aucun utilisateur"}})
 
-@app.get("/users/{user_id}/")
+@app.get("/users/{user_id}/", response_model=UserOut)
 async def get_user(db: db_dependency, user_id: int): 
 
-    result = db.query(models.User).filter(models.User.id==user_id).first()
+    result = await db.get(models.User, user_id)
     if result:
         return result
     else:
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"data": {'message': "l'utilisateur n'existe pas !"}})
 
-@app.post("/users/")
+@app.post("/users/", response_model=UserOut)
 async def create_user(db: db_dependency, 
     username: str = Form(...),
     nom: str = Form(...),
@@ -884,15 +1073,15 @@ async def create_user(db: db_dependency,
     try:
         # Save  object to the database
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
 
         return db_user
     except Exception as e:
         print(e)
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content="Une erreur s'est produits lors de la creation de l'utilisateur !")
 
-@app.put("/users/{user_id}/")
+@app.put("/users/{user_id}/", response_model=UserOut)
 async def update_user(
     db: db_dependency,
     user_id: int, 
@@ -905,7 +1094,7 @@ async def update_user(
     user_status: Optional[int] = Form(None),
     ): 
 
-    db_user = db.query(models.User).filter(models.User.id==user_id).first()
+    db_user = await db.get(models.User, user_id)
     today_date = datetime.now()
 
     if db_user:
@@ -929,8 +1118,8 @@ async def update_user(
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content="l'utilisateur n'existe pas !")
     try:
         # Save  object to the database
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
 
         return db_user
     except Exception as e:
@@ -941,16 +1130,16 @@ async def update_user(
 @app.delete("/users/{user_id}/")
 async def delete_user(db: db_dependency, user_id: int): 
 
-    result = db.query(models.User).filter(models.User.id==user_id).first()
+    result = await db.get(models.User, user_id)
     
     if not result:
         raise HTTPException(status_code=404, detail="L'utilisateur n'existe pas !")
     # print("before delete")
     
     try:
-        db.query(models.User).filter(models.User.id==user_id).delete()
+        await db.execute(delete(models.User).where(models.User.id==user_id))
         # print("delete")
-        db.commit()
+        await db.commit()
         return JSONResponse(status_code=status.HTTP_200_OK, content="L'utilisateur à été supprimé !")
         
     except Exception as e:
@@ -960,24 +1149,24 @@ async def delete_user(db: db_dependency, user_id: int):
 ###########################################################################################################################
 
 ############################################## ROLE ##############################################
-@app.get("/roles/")
-async def get_all_roles(db: db_dependency):
-    result = db.query(models.Role).all()
+@app.get("/roles/", response_model=List[RoleOut])
+async def get_all_roles(db: db_dependency, request: Request):
+    result = await cached_json_response(request, "roles", "all", lambda: get_all(db, models.Role), List[RoleOut])
     if result:
         return result
     else:
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"data": {'message': "Aucun role"}})
 
-@app.get("/roles/{role_id}/")
-async def get_role(db: db_dependency, role_id: int): 
+@app.get("/roles/{role_id}/", response_model=RoleOut)
+async def get_role(db: db_dependency, request: Request, role_id: int): 
 
-    result = db.query(models.Role).filter(models.Role.id==role_id).first()
+    result = await cached_json_response(request, "roles", role_id, lambda: db.get(models.Role, role_id), RoleOut)
     if result:
         return result
     else:
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"data": {'message': "le role n'existe pas !"}})
 
-@app.post("/roles/")
+@app.post("/roles/", response_model=RoleOut)
 async def create_role(db: db_dependency, 
     libelle: str = Form(...),
     ): 
@@ -990,8 +1179,9 @@ async def create_role(db: db_dependency,
     try:
         # Save  object to the database
         db.add(db_role)
-        db.commit()
-        db.refresh(db_role)
+        await db.commit()
+        reference_cache.invalidate("roles")
+        await db.refresh(db_role)
 
         return db_role 
     except Exception as e:
@@ -999,14 +1189,14 @@ async def create_role(db: db_dependency,
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content="Une erreur s'est produits lors de la creation du role !")
 
 
-@app.put("/roles/{role_id}/")
+@app.put("/roles/{role_id}/", response_model=RoleOut)
 async def update_role(
     db: db_dependency,
     role_id: int, 
     libelle: str = Form(),
     ): 
 
-    db_role = db.query(models.Role).filter(models.Role.id==role_id).first()
+    db_role = await db.get(models.Role, role_id)
     today_date = datetime.now()
 
     if db_role:
@@ -1017,8 +1207,9 @@ async def update_role(
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content="le role n'existe pas !")
     try:
         # Save  object to the database
-        db.commit()
-        db.refresh(db_role)
+        await db.commit()
+        reference_cache.invalidate("roles")
+        await db.refresh(db_role)
 
         return db_role
     except Exception as e:
@@ -1029,16 +1220,17 @@ async def update_role(
 @app.delete("/roles/{role_id}/")
 async def delete_role(db: db_dependency, role_id: int): 
 
-    result = db.query(models.Role).filter(models.Role.id==role_id).first()
+    result = await db.get(models.Role, role_id)
     
     if not result:
         raise HTTPException(status_code=404, detail="Le role n'existe pas !")
     # print("before delete")
     
     try:
-        db.query(models.Role).filter(models.Role.id==role_id).delete()
+        await db.execute(delete(models.Role).where(models.Role.id==role_id))
         # print("delete")
-        db.commit()
+        await db.commit()
+        reference_cache.invalidate("roles")
         return JSONResponse(status_code=status.HTTP_200_OK, content="Le role à été supprimé !")
         
     except Exception as e:
@@ -1048,24 +1240,41 @@ async def delete_role(db: db_dependency, role_id: int):
 #######################################################################################################################
 
 ################################################## HISTORIQUE ##################################################
-@app.get("/historiques/")
-async def get_all_history(db: db_dependency):
-    result = db.query(models.Historique).all()
-    if result:
+@app.get("/historiques/", response_model=List[HistoriqueOut])
+async def get_all_history(db: db_dependency, request: Request, page: page_dependency, response: Response, since: Union[date, None] = None, until: Union[date, None] = None):
+    # since / until (included) : only the months of the range are read (see database_sys/partitions.py)
+    result = await paginate_historique(db, request, page, response, since, until)
+    if result or page.after is not None:
         return result
     else:
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"data": {'message': "Aucun historique"}})
 
-@app.get("/historiques/{historique_id}/")
-async def get_history(db: db_dependency, history_id: int): 
-
-    result = db.query(models.Historique).filter(models.Historique.id==history_id).first()
+@app.get("/historiques/export/")
+async def export_history(request: Request, export_format: Literal["ndjson", "csv"] = "ndjson"):
+    return export_table(models.Historique, export_format, request)
+
+@app.post("/historiques/export/", response_model=DataOut[JobOut], status_code=status.HTTP_202_ACCEPTED)
+async def export_history_to_file(db: db_dependency, export_format: Literal["ndjson", "csv"] = "ndjson"):
+    # Written in MEDIA_ROOT by the background worker, follow it with GET /jobs/{job_id}/
+    db_job = await create_job(db, "export", {"table": "historique", "format": export_format})
+    return {"data": db_job}
+
+@app.post("/historiques/archive/", response_model=DataOut[JobOut], status_code=status.HTTP_202_ACCEPTED)
+async def archive_history(db: db_dependency):
+    # Old months moved / written to ARCHIVE_DIR by the background worker, follow it with GET /jobs/{job_id}/
+    db_job = await create_job(db, "archive_historique", {})
+    return {"data": db_job}
+
+@app.get("/historiques/{historique_id}/", response_model=HistoriqueOut)
+async def get_history(db: db_dependency, historique_id: int): 
+    # Also found in the monthly tables (SQLite, see database_sys/partitions.py)
+    result = await get_historique(db, historique_id)
     if result:
         return result
     else:
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"data": {'message': "l'historique n'existe pas !"}})
 
-@app.post("/historiques/")
+@app.post("/historiques/", response_model=HistoriqueOut)
 async def create_history(db: db_dependency, 
     userID: int = Form(...),
     description: str = Form(...),
@@ -1082,8 +1291,8 @@ async def create_history(db: db_dependency,
     try:
         # Save  object to the database
         db.add(db_history)
-        db.commit()
-        db.refresh(db_history)
+        await db.commit()
+        await db.refresh(db_history)
 
         return db_history 
     except Exception as e:
@@ -1091,7 +1300,7 @@ async def create_history(db: db_dependency,
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content="Une erreur s'est produits lors de la creation de l'historique !")
 
 
-@app.put("/history/{history_id}/")
+@app.put("/history/{history_id}/", response_model=HistoriqueOut)
 async def update_history(
     db: db_dependency,
     history_id: int, 
@@ -1100,24 +1309,19 @@ async def update_history(
     typeOperation: Optional[str] = Form(None),
     ): 
 
-    db_history = db.query(models.Historique).filter(models.Historique.id==history_id).first()
     today_date = datetime.now()
-
-    if db_history:
-        if userID:
-            db_history.userID=userID        
-        if description:
-            db_history.description=description        
-        if typeOperation:
-            db_history.typeOperation=typeOperation        
-        db_history.updatedAt=today_date
-    else:
-        return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content="l'historique n'existe pas !")
+    values = {"updatedAt": today_date}
+    if userID:
+        values["userID"]=userID
+    if description:
+        values["description"]=description
+    if typeOperation:
+        values["typeOperation"]=typeOperation
     try:
-        # Save  object to the database
-        db.commit()
-        db.refresh(db_history)
-
+        # Updated in the table that holds it (historique or a SQLite monthly table)
+        db_history = await update_historique(db, history_id, values)
+        if db_history is None:
+            return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content="l'historique n'existe pas !")
         return db_history
     except Exception as e:
         print(e)
@@ -1127,45 +1331,39 @@ async def update_history(
 @app.delete("/history/{history_id}/")
 async def delete_role(db: db_dependency, history_id: int): 
 
-    result = db.query(models.Historique).filter(models.Historique.id==history_id).first()
-    
-    if not result:
-        raise HTTPException(status_code=404, detail="L'historique n'existe pas !")
-    # print("before delete")
-    
     try:
-        db.query(models.Historique).filter(models.Historique.id==history_id).delete()
-        # print("delete")
-        db.commit()
-        return JSONResponse(status_code=status.HTTP_200_OK, content="L'historique à été supprimé !")
-        
+        # Deleted from the table that holds it (historique or a SQLite monthly table)
+        deleted = await delete_historique(db, history_id)
     except Exception as e:
         print(e)
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content="Une erreur s'est produite lors de la suppression de l'historique.")
+    if not deleted:
+        raise HTTPException(status_code=404, detail="L'historique n'existe pas !")
+    return JSONResponse(status_code=status.HTTP_200_OK, content="L'historique à été supprimé !")
 
 ############################################################################################################
 
 
 ########################################### ENTREPRISE ###########################################
-@app.get("/entreprises/")
-async def get_all_enterprise(db: db_dependency): 
+@app.get("/entreprises/", response_model=List[EntrepriseOut])
+async def get_all_enterprise(db: db_dependency, request: Request, page: page_dependency, response: Response): 
 
-    result = db.query(models.Entreprise).all()
-    if result:
+    result = await paginate(db, models.Entreprise, page, response, filtered_query(models.Entreprise, request))
+    if result or page.after is not None:
         return result
     else:
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"data": {'message': "Aucune entreprise"}})
 
-@app.get("/entreprises/{entreprise_id}/")
+@app.get("/entreprises/{entreprise_id}/", response_model=EntrepriseOut)
 async def get_enterprise(db: db_dependency, entreprise_id: int): 
 
-    result = db.query(models.Entreprise).filter(models.Entreprise.id==entreprise_id).first()
+    result = await db.get(models.Entreprise, entreprise_id)
     if result:
         return result
     else:
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"data": {'message': "l'entreprise n'existe pas !"}})
 
-@app.post("/entreprises/")
+@app.post("/entreprises/", response_model=DataOut[EntrepriseOut], status_code=status.HTTP_201_CREATED)
 async def create_user(db: db_dependency, 
     libelle: str = Form(...),
     reference: str = Form(...),
@@ -1186,15 +1384,15 @@ async def create_user(db: db_dependency,
     try:
         # Save  object to the database
         db.add(db_enterprise)
-        db.commit()
-        db.refresh(db_enterprise)
+        await db.commit()
+        await db.refresh(db_enterprise)
 
-        return JSONResponse(status_code=status.HTTP_201_CREATED, content={"data": db_enterprise})
+        return {"data": db_enterprise}
     except Exception as e:
         print(e)
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content="Une erreur s'est produits lors de la creation de l'entreprise !")
 
-@app.put("/entreprises/{entreprise_id}/")
+@app.put("/entreprises/{entreprise_id}/", response_model=EntrepriseOut)
 async def update_user(
     db: db_dependency,
     entreprise_id: int, 
@@ -1205,7 +1403,7 @@ async def update_user(
     phone_responsable: Optional[str] = Form(None),
     ): 
 
-    db_enterprise = db.query(models.Entreprise).filter(models.Entreprise.id==entreprise_id).first()
+    db_enterprise = await db.get(models.Entreprise, entreprise_id)
     today_date = datetime.now()
 
     if db_enterprise:
@@ -1225,8 +1423,8 @@ async def update_user(
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content="l'entreprise n'existe pas !")
     try:
         # Save  object to the database
-        db.commit()
-        db.refresh(db_enterprise)
+        await db.commit()
+        await db.refresh(db_enterprise)
 
         return db_enterprise
     except Exception as e:
@@ -1237,16 +1435,16 @@ async def update_user(
 @app.delete("/entreprises/{entreprise_id}/")
 async def delete_enterprise(db: db_dependency, entreprise_id: int): 
 
-    result = db.query(models.Entreprise).filter(models.Entreprise.id==entreprise_id).first()
+    result = await db.get(models.Entreprise, entreprise_id)
     
     if not result:
         raise HTTPException(status_code=404, detail="L'entreprise n'existe pas !")
     # print("before delete")
     
     try:
-        db.query(models.Entreprise).filter(models.Entreprise.id==entreprise_id).delete()
+        await db.execute(delete(models.Entreprise).where(models.Entreprise.id==entreprise_id))
         # print("delete")
-        db.commit()
+        await db.commit()
         return JSONResponse(status_code=status.HTTP_200_OK, content="L'entreprise à été supprimé !")
         
     except Exception as e:
@@ -1255,6 +1453,82 @@ async def delete_enterprise(db: db_dependency, entreprise_id: int):
 
 ###########################################################################################################################
 
+########################################### JOBS ###########################################
+@app.get("/jobs/", response_model=List[JobOut])
+async def get_all_jobs(db: db_dependency, request: Request, page: page_dependency, response: Response):
+    result = await paginate(db, models.Job, page, response, filtered_query(models.Job, request))
+    if result or page.after is not None:
+        return result
+    else:
+        return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"data": {'message': "Aucune tâche"}})
+
+@app.get("/jobs/{job_id}/", response_model=JobOut)
+async def get_job(db: db_dependency, job_id: int):
+
+    result = await db.get(models.Job, job_id)
+    if result:
+        return result
+    else:
+        return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"data": {'message': "la tâche n'existe pas !"}})
+
+###########################################################################################################################
+
+########################################### RECHERCHE ###########################################
+@app.get("/search/", response_model=List[SearchResultOut])
+async def search_all(db: db_dependency, q: str, type: Union[Literal[tuple(SEARCH_TYPES)], None] = None, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE)):
+    # Formations, cours and entreprises matching every word of q, best matches first.
+    # q is reduced to quoted words (database_sys/search.py) : any text is a valid search
+    return await search(db, q, type, limit)
+
+###########################################################################################################################
+
+########################################### MEDIAS ###########################################
+@app.api_route("/medias/{file_path:path}", methods=["GET", "HEAD"])
+async def get_media(request: Request, file_path: str, w: Optional[int] = Query(None, ge=1)):
+    # Files of MEDIA_ROOT with ETag, Range and long lived caching (see utils/media.py).
+    # ?w= on an uploaded image : displayed width in pixels, answered with the smallest
+    # resized copy at least that wide (WebP if accepted, else JPEG), the original when there is none
+    relative_path = safe_media_path(file_path)
+    if relative_path is None:
+        raise HTTPException(status_code=404, detail="Le fichier n'existe pas !")
+    if w is None or not is_stored_image(relative_path):
+        return await media_response(request, relative_path)
+
+    variant = await pick_variant(relative_path, w, request.headers.get("accept", ""))
+    if variant is None:
+        # Variant not rendered yet (or wider than the original) : not cached for long
+        return await media_response(request, relative_path, headers={"Vary": "Accept", "Cache-Control": "no-cache"})
+    return await media_response(request, variant, headers={"Vary": "Accept"})
+
+@app.post("/medias/gc/", response_model=DataOut[JobOut], status_code=status.HTTP_202_ACCEPTED)
+async def collect_orphan_medias(db: db_dependency, mode: Literal["quarantine", "delete"] = MEDIA_GC_MODE, dry_run: bool = False):
+    # Files no row points to anymore (see utils/media_gc.py), the result of the job
+    # gives the number of orphans and the bytes reclaimed. dry_run : only listed
+    db_job = await create_job(db, "media_gc", {"mode": mode, "dry_run": dry_run})
+    return {"data": db_job}
+
+@app.api_route("/images/{file_path:path}", methods=["GET", "HEAD"])
+async def get_image(request: Request, file_path: str, w: Optional[int] = Query(None, ge=1)):
+    # Same as /medias/, file_path : imageUrl of a formation / cours, with or without "medias/"
+    return await get_media(request, media_path(file_path), w)
+
+@app.post("/images/variants/", response_model=DataOut[JobOut], status_code=status.HTTP_202_ACCEPTED)
+async def render_all_image_variants(db: db_dependency):
+    # Resized copies of every formation / cours image (images uploaded before the
+    # variants existed, new IMAGE_VARIANT_WIDTHS), follow it with GET /jobs/{job_id}/
+    db_job = await create_job(db, "image_variants", {})
+    return {"data": db_job}
+
+###########################################################################################################################
+
+########################################### MONITORING ###########################################
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text format (see utils/metrics.py)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+###########################################################################################################################
+
 
 
 
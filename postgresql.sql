@@ -72,6 +72,7 @@ CREATE TABLE "session"(
     "createdAt" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL,
     "updatedAt" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL
 );
+CREATE INDEX "session_datevalidite_index" ON "session"("dateValidite");
 
 CREATE TABLE "entreprise"(
     "id" BIGSERIAL PRIMARY KEY,
@@ -197,11 +198,58 @@ CREATE TABLE "role"(
     "updatedAt" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL
 );
 
+-- Partitioned by month : the partitions historique_YYYY_MM are created by the
+-- application (database_sys/partitions.py), the primary key must contain "createAt"
 CREATE TABLE "historique"(
-    "id" BIGSERIAL PRIMARY KEY,
+    "id" BIGSERIAL,
     "userID" BIGINT NOT NULL,
     "description" TEXT NOT NULL,
     "typeOperation" TEXT NOT NULL,
     "createAt" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL,
-    "updatedAt" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL
+    "updatedAt" TIMESTAMP(0) WITHOUT TIME ZONE NULL,
+    PRIMARY KEY("id", "createAt")
+) PARTITION BY RANGE ("createAt");
+CREATE TABLE "historique_default" PARTITION OF "historique" DEFAULT;
+CREATE INDEX "historique_userid_index" ON "historique"("userID");
+CREATE INDEX "historique_createat_index" ON "historique"("createAt");
+
+CREATE TABLE "media"(
+    "id" BIGSERIAL PRIMARY KEY,
+    "path" TEXT NOT NULL,
+    "hash" TEXT NOT NULL,
+    "size" BIGINT NOT NULL,
+    "refCount" INTEGER NOT NULL DEFAULT '0',
+    "createAt" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL,
+    "updatedAt" TIMESTAMP(0) WITHOUT TIME ZONE NULL
+);
+ALTER TABLE "media" ADD CONSTRAINT "media_path_unique" UNIQUE("path");
+CREATE INDEX "media_hash_index" ON "media"("hash");
+
+CREATE TABLE "job"(
+    "id" BIGSERIAL PRIMARY KEY,
+    "typeJob" TEXT NOT NULL,
+    "payload" TEXT NOT NULL,
+    "status" TEXT NOT NULL DEFAULT 'en_attente',
+    "result" TEXT NULL,
+    "error" TEXT NULL,
+    "attempts" INTEGER NOT NULL DEFAULT '0',
+    "createAt" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL,
+    "startedAt" TIMESTAMP(0) WITHOUT TIME ZONE NULL,
+    "finishedAt" TIMESTAMP(0) WITHOUT TIME ZONE NULL
+);
+CREATE INDEX "job_status_index" ON "job"("status", "id");
+
+CREATE INDEX "formation_search_index" ON "formation" USING GIN (to_tsvector('french', "libelle" || ' ' || coalesce("description", '')));
+CREATE INDEX "cours_search_index" ON "cours" USING GIN (to_tsvector('french', "libelle" || ' ' || coalesce("description", '')));
+CREATE INDEX "entreprise_search_index" ON "entreprise" USING GIN (to_tsvector('french', "libelle" || ' ' || "reference"));
+
+CREATE TABLE "session_stats"(
+    "sessionID" BIGINT PRIMARY KEY,
+    "nbreParticipants" INTEGER NOT NULL DEFAULT '0',
+    "nbreParticipantsGroupe" INTEGER NOT NULL DEFAULT '0',
+    "nbreParticipantsPerso" INTEGER NOT NULL DEFAULT '0',
+    "nbreFichesPresence" INTEGER NOT NULL DEFAULT '0',
+    "nbreJoursPresence" INTEGER NOT NULL DEFAULT '0',
+    "chiffreAffaires" BIGINT NOT NULL DEFAULT '0',
+    "updatedAt" TIMESTAMP(0) WITHOUT TIME ZONE NULL
 );
@@ -12,6 +12,49 @@ BASE_URL = DEV_SERVER_URL
 MEDIA_ROOT = BASE_DIR / "mediafiles/"
 # print(MEDIA_ROOT)
 MEDIA_URL = "medias/"
+# Uploads are stored by content hash under MEDIA_STORE (see utils.storage)
+MEDIA_STORE = "store"
+MEDIA_TMP = "tmp"
+# Storage backend of the media (utils.storage) : "filesystem" (MEDIA_ROOT) or "s3" (MEDIA_S3).
+# With "s3", every API replica and worker sees the same files. Local stand-in :
+#   docker run -p 9000:9000 minio/minio server /data   (or: moto_server -p 9000)
+MEDIA_STORAGE = "filesystem"
+MEDIA_S3 = {
+    'BUCKET': "formation-medias",
+    'ENDPOINT_URL': "http://localhost:9000",  # None for AWS
+    'ACCESS_KEY': "minioadmin",
+    'SECRET_KEY': "minioadmin",
+    'REGION': "us-east-1",
+    'PART_SIZE': 8 * 1024 * 1024,  # bytes per part of the multipart uploads (5 MB minimum)
+    'PRESIGNED_EXPIRY': 3600,  # seconds, GET /medias/ redirects to presigned URLs
+}
+# GET /medias/... (utils.media) : the content addressed files up to MEDIA_CACHE_MAX_FILE_SIZE
+# bytes are kept in memory, MEDIA_CACHE_SIZE bytes per worker
+MEDIA_CACHE_SIZE = 64 * 1024 * 1024
+MEDIA_CACHE_MAX_FILE_SIZE = 256 * 1024
+MEDIA_CACHE_MAX_AGE = 365 * 24 * 3600  # seconds, Cache-Control of the content addressed files
+# Orphan files collector ("media_gc" job, utils.media_gc)
+MEDIA_QUARANTINE = "quarantine"
+MEDIA_GC_MODE = "quarantine"  # "quarantine" : moved to MEDIA_ROOT / MEDIA_QUARANTINE, "delete" : removed
+MEDIA_GC_GRACE_PERIOD = 3600  # seconds, younger files are kept (upload not committed yet)
+MEDIA_GC_QUARANTINE_DAYS = 30  # days before a quarantined file is removed
+
+############################ CERTIFICATES CONFIG ############################
+# The PDF are written in MEDIA_ROOT / CERTIFICATE_DIR / <session id> / <participant id>.pdf
+CERTIFICATE_DIR = "certificats"
+CERTIFICATE_WORKERS = None  # processes rendering the PDF, None = number of CPU
+CERTIFICATE_BATCH_SIZE = 50  # certificates per task sent to a process
+# Uploads are copied by chunks of UPLOAD_CHUNK_SIZE bytes and refused above MAX_UPLOAD_SIZE bytes
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_SIZE = 200 * 1024 * 1024
+
+############################ IMAGES CONFIG ############################
+# Resized copies of the formation / cours images (utils.images), written in
+# MEDIA_ROOT / IMAGE_VARIANT_DIR by the "image_variants" job, served by GET /medias/...?w=
+IMAGE_VARIANT_DIR = "variants"
+IMAGE_VARIANT_WIDTHS = (160, 320, 640, 1280)  # pixels, ascending
+IMAGE_VARIANT_QUALITY = 80  # WebP / JPEG quality
+IMAGE_WORKERS = None  # processes resizing the images, None = number of CPU
 
 ############################ DATABASE CONFIG ############################
 DATABASE = {
@@ -22,4 +65,63 @@ DATABASE = {
     'HOST': "localhost",
     'PORT': "5432"
     
-}
\ No newline at end of file
+}
+
+# "sqlite" : local file SQLITE_PATH, "postgresql" : the DATABASE server above
+DATABASE_BACKEND = "sqlite"
+SQLITE_PATH = BASE_DIR / "sql_app.db"
+
+# Connection pool, size it from the number of uvicorn workers :
+# every worker opens up to SIZE + MAX_OVERFLOW connections
+DATABASE_POOL = {
+    'SIZE': 5,
+    'MAX_OVERFLOW': 10,
+    'TIMEOUT': 30,  # seconds waiting for a free connection
+    'RECYCLE': 1800,  # seconds before a connection is replaced
+    'PRE_PING': True,
+    'STATEMENT_TIMEOUT': 30000,  # milliseconds, postgresql only
+}
+
+############################ PAGINATION CONFIG ############################
+# Keyset pagination of the list endpoints (?limit=&after=)
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+############################ EXPORT / IMPORT CONFIG ############################
+# Rows fetched per round trip by the streaming exports (NDJSON / CSV)
+EXPORT_CHUNK_SIZE = 1000
+# Max number of rows accepted by the bulk import endpoints
+BULK_MAX_ROWS = 5000
+
+############################ CACHE CONFIG ############################
+# In process cache of the reference tables (tags, categories, roles)
+REFERENCE_CACHE_TTL = 300  # seconds
+REFERENCE_CACHE_SIZE = 256  # entries
+
+############################ JOBS CONFIG ############################
+# Background jobs stored in the "job" table and run by worker.py
+JOB_POLL_INTERVAL = 1  # seconds between two polls when the queue is empty
+JOB_HEARTBEAT_INTERVAL = 30  # seconds between two startedAt refreshes of a running job
+JOB_TIMEOUT = 300  # seconds without heartbeat before a running job is considered lost
+JOB_MAX_ATTEMPTS = 3
+EXPORT_DIR = "exports"  # export jobs write in MEDIA_ROOT / EXPORT_DIR
+
+############################ MONITORING CONFIG ############################
+# Request and SQL metrics (utils.metrics), exposed on GET /metrics
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+N_PLUS_ONE_THRESHOLD = 10  # same statement run this many times in one request
+
+############################ AUDIT CONFIG ############################
+# Writes recorded in "historique" by utils.audit, inserted by batches
+AUDIT_FLUSH_INTERVAL = 2  # seconds between two inserts
+AUDIT_BATCH_SIZE = 500  # entries waiting that trigger an insert before the interval
+AUDIT_MAX_BUFFER = 10000  # entries kept in memory when the database is not reachable
+AUDIT_DEFAULT_USER_ID = 1  # userID of the requests without X-User-ID header
+
+############################ HISTORIQUE CONFIG ############################
+# Storage of "historique" by month (database_sys.partitions)
+HISTORIQUE_HOT_MONTHS = 3  # SQLite : older months are moved to the monthly tables historique_YYYY_MM
+HISTORIQUE_PARTITIONS_AHEAD = 2  # postgresql : monthly partitions created in advance
+HISTORIQUE_PARTITIONS_INTERVAL = 3600  # postgresql : seconds between two checks of the partitions by worker.py
+HISTORIQUE_RETENTION_MONTHS = 12  # older months are written to ARCHIVE_DIR and dropped
+ARCHIVE_DIR = BASE_DIR / "archives"  # gzip NDJSON, one file per month (not served)
\ No newline at end of file
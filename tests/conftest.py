@@ -0,0 +1,104 @@
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+import pytest
+
+# The settings are module constants read when the modules are imported : the
+# test database and media directory are set before main is imported.
+#   python -m pytest
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+TMP_DIR = Path(tempfile.mkdtemp(prefix="certificat_tests_"))
+
+from settings import config
+config.DATABASE_BACKEND = "sqlite"
+config.SQLITE_PATH = TMP_DIR / "test.db"
+config.MEDIA_ROOT = TMP_DIR / "mediafiles"
+config.ARCHIVE_DIR = TMP_DIR / "archives"
+config.MEDIA_STORAGE = "filesystem"
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+import main
+from benchmarks.generate import generate, parse_counts, rebuild_stats
+from database_sys import models
+from database_sys.database import engine
+from database_sys.partitions import PARTITION_NAME
+from utils.cache import reference_cache
+from utils.jobs import run_next_job
+from utils.media import media_cache
+
+
+@pytest.fixture(scope="session")
+def client():
+    # Startup (tables, indexes) and shutdown run once for the whole session
+    with TestClient(main.app) as test_client:
+        yield test_client
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def run(client):
+    # Runs a coroutine function on the event loop of the application
+    # (the pooled connections belong to that loop)
+    def call(func, *args, **kwargs):
+        return client.portal.call(lambda: func(*args, **kwargs))
+    return call
+
+
+@pytest.fixture
+def run_jobs(run):
+    # Runs the queued jobs like worker.py, returns how many ran
+    def call():
+        count = 0
+        while run(run_next_job):
+            count += 1
+        return count
+    return call
+
+
+@pytest.fixture
+def dataset(client, run):
+    # Small synthetic dataset (benchmarks.generate), every foreign key is valid,
+    # session_stats computed like after benchmarks/generate.py
+    data = generate(engine, parse_counts(0.001, []), verbose=False)
+    run(rebuild_stats)
+    return data
+
+
+@pytest.fixture
+def create_fiche(client, dataset):
+    # POST /fiche_presences/0/ with a signature file, the other fields default to
+    # the first agent / session formation of the dataset. Returns the response
+    def call(content, **data):
+        return client.post(
+            "/fiche_presences/0/",
+            data=dict({
+                "agentEntrepriseID": dataset.nth("agent_entreprise", 0),
+                "sessionformationID": dataset.nth("session_formation", 0),
+                "formateurID": 1,
+                "dateDebut": "2026-01-05T08:00:00",
+                "dateFin": "2026-01-05T17:00:00",
+            }, **data),
+            files={"signatureElectronique": ("signature.png", content, "image/png")},
+        )
+    return call
+
+
+@pytest.fixture(autouse=True)
+def clean_database(client, run):
+    yield
+    run(main.audit_log.flush)
+    main.audit_log.buffer.clear()
+    with engine.begin() as connection:
+        for table in reversed(models.Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+        for name in connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'")).scalars().all():
+            if PARTITION_NAME.match(name):
+                connection.execute(text(f'DROP TABLE "{name}"'))
+    reference_cache.entries.clear()
+    media_cache.entries.clear()
+    media_cache.size = 0
+    shutil.rmtree(config.MEDIA_ROOT, ignore_errors=True)
+    shutil.rmtree(config.ARCHIVE_DIR, ignore_errors=True)
@@ -0,0 +1,52 @@
+import asyncio
+from sqlalchemy import select
+import main
+from database_sys import models
+from database_sys.database import engine
+from utils.audit import AuditLog
+
+
+def audit_rows():
+    with engine.connect() as connection:
+        return [(row.userID, row.typeOperation, row.description) for row in connection.execute(select(models.Historique).order_by(models.Historique.id))]
+
+
+def test_writes_are_recorded_with_their_resource(client, run):
+    tag_id = client.post("/tags/", data={"libelle": "python"}).json()["id"]
+    client.put(f"/tags/{tag_id}/", data={"libelle": "sql"}, headers={"X-User-ID": "7"})
+    client.delete(f"/tags/{tag_id}/")
+    client.delete("/tags/999/")
+    client.get("/tags/")
+    run(main.audit_log.flush)
+
+    assert audit_rows() == [
+        (1, "creation", f"tags id={tag_id} (POST /tags/, 200)"),
+        (7, "modification", f"tags tag_id={tag_id} (PUT /tags/{{tag_id}}/, 200)"),
+        (1, "suppression", f"tags tag_id={tag_id} (DELETE /tags/{{tag_id}}/, 200)"),
+    ]
+
+
+def test_created_id_of_a_wrapped_answer(client, run):
+    # {"data": {...}} answers : the id is found, the body reaches the client unchanged
+    response = client.post("/sessions/", data={
+        "libelle": "Habilitation", "dateDebut": "2026-01-05", "dateFin": "2026-01-06",
+        "session_status": 1, "typeValidite": "annee", "delaiValidite": 1, "nbreMaxEtudiant": 10,
+    })
+    session = response.json()["data"]
+    assert session["libelle"] == "Habilitation" and int(response.headers["content-length"]) == len(response.content)
+    client.post("/session_participants/bulk/", json=[])
+    run(main.audit_log.flush)
+    assert audit_rows() == [(1, "creation", f"sessions id={session['id']} (POST /sessions/, 201)")]
+
+
+def test_restart_on_another_event_loop():
+    # uvicorn --reload, the test clients : one event loop per start
+    audit_log = AuditLog(flush_interval=0.01)
+    async def start_and_stop():
+        audit_log.start()
+        await asyncio.sleep(0.03)
+        await audit_log.stop()
+    asyncio.run(start_and_stop())
+    asyncio.run(start_and_stop())
+    audit_log.record(1, "creation", "pas démarré")
+    assert len(audit_log.buffer) == 1
@@ -0,0 +1,129 @@
+from sqlalchemy import func, insert, select
+from database_sys import models
+from database_sys.database import engine
+from utils import bulk
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"signature" * 100
+OTHER_PNG = b"\x89PNG\r\n\x1a\n" + b"autre signature" * 100
+
+
+def ref_count(file_url):
+    with engine.connect() as connection:
+        return connection.scalar(select(models.Media.refCount).where(models.Media.path==file_url))
+
+
+def fiche_count():
+    with engine.connect() as connection:
+        return connection.scalar(select(func.count()).select_from(models.FichePresence))
+
+
+def fiche(dataset, n, signature, **values):
+    return dict({
+        "agentEntrepriseID": dataset.nth("agent_entreprise", n),
+        "sessionformationID": dataset.nth("session_formation", n),
+        "formateurID": 1,
+        "dateDebut": "2026-02-01",
+        "dateFin": "2026-02-03",
+        "signatureElectronique": signature,
+    }, **values)
+
+
+def assert_stats_match_rebuild(client, run_jobs):
+    incremental = client.get("/sessions/stats/").json()
+    client.post("/sessions/stats/rebuild/")
+    run_jobs()
+    assert client.get("/sessions/stats/").json() == incremental
+
+
+def test_signatures_must_be_uploaded_files(client, dataset, create_fiche):
+    url = create_fiche(PNG).json()["data"]["signatureElectronique"]
+    before = fiche_count()
+    rows = [fiche(dataset, 1, url), fiche(dataset, 2, "medias/store/00/00/inconnu.png")]
+
+    response = client.post("/fiche_presences/bulk/", json=rows)
+    assert response.status_code == 422
+    assert [error["row"] for error in response.json()["errors"]] == [1]
+    assert fiche_count() == before and ref_count(url) == 1
+
+    response = client.post("/fiche_presences/bulk/?partial=true", json=rows)
+    assert response.json()["inserted"] == 1
+    assert fiche_count() == before + 1
+    assert ref_count(url) == 2
+
+
+def test_bulk_references_are_released_on_delete(client, dataset, run_jobs, create_fiche):
+    url = create_fiche(PNG).json()["data"]["signatureElectronique"]
+    response = client.post("/fiche_presences/bulk/", json=[fiche(dataset, 1, url), fiche(dataset, 2, url), fiche(dataset, 3, "")])
+    assert response.status_code == 201 and response.json()["inserted"] == 3
+    assert ref_count(url) == 3
+
+    with engine.connect() as connection:
+        fiche_id = connection.scalar(select(func.max(models.FichePresence.id)).where(models.FichePresence.signatureElectronique==url))
+    client.delete(f"/fiche_presences/{fiche_id}/")
+    assert ref_count(url) == 2
+    assert_stats_match_rebuild(client, run_jobs)
+
+
+def test_bulk_update_by_id(client, dataset, run_jobs, create_fiche):
+    url = create_fiche(PNG).json()["data"]["signatureElectronique"]
+    other_url = create_fiche(OTHER_PNG).json()["data"]["signatureElectronique"]
+    client.post("/fiche_presences/bulk/", json=[fiche(dataset, 1, url), fiche(dataset, 2, url)])
+    with engine.connect() as connection:
+        first, second = connection.scalars(
+            select(models.FichePresence.id).where(models.FichePresence.signatureElectronique==url).order_by(models.FichePresence.id.desc()).limit(2)
+        ).all()
+    assert (ref_count(url), ref_count(other_url)) == (3, 1)
+
+    rows = [
+        fiche(dataset, 5, other_url, id=first, dateFin="2026-02-10"),
+        fiche(dataset, 6, url),
+    ]
+    response = client.post("/fiche_presences/bulk/", json=rows)
+    assert response.json() == {"inserted": 1, "updated": 1, "errors": []}
+    assert (ref_count(url), ref_count(other_url)) == (3, 2)
+    updated = client.get(f"/fiche_presences/{first}/").json()
+    assert updated["dateFin"].startswith("2026-02-10") and updated["signatureElectronique"] == other_url
+    assert_stats_match_rebuild(client, run_jobs)
+
+    # Unknown id, same id twice : rejected, nothing written
+    response = client.post("/fiche_presences/bulk/", json=[fiche(dataset, 1, url, id=10 ** 9), fiche(dataset, 1, url, id=second), fiche(dataset, 1, url, id=second)])
+    assert response.status_code == 422
+    assert [error["row"] for error in response.json()["errors"]] == [0, 2]
+
+
+def test_participants_csv(client, dataset, run_jobs):
+    # Every generated session_formation has its participant : two new ones
+    with engine.begin() as connection:
+        template = connection.execute(select(models.SessionFormation).limit(1)).mappings().one()
+        for _ in range(2):
+            connection.execute(insert(models.SessionFormation), dict(template, id=None))
+        used = set(connection.scalars(select(models.SessionParticipant.sessionFormationID)))
+        free = [row for row in connection.execute(select(models.SessionFormation.id, models.SessionFormation.sessionID)) if row.id not in used]
+    agent = dataset.nth("agent_entreprise", 0)
+    lines = ["id,agentEntrepriseID,sessionID,sessionFormationID,isGroupe,isPerso"]
+    lines += [f",{agent},{session_id},{session_formation_id},true,false" for session_formation_id, session_id in free[:2]]
+    response = client.post("/session_participants/bulk/", files={"file": ("participants.csv", "\n".join(lines).encode(), "text/csv")})
+    assert response.status_code == 201 and response.json()["inserted"] == 2
+
+    with engine.connect() as connection:
+        participant = connection.execute(select(models.SessionParticipant).where(models.SessionParticipant.sessionFormationID==free[0][0])).one()
+    lines = ["id,agentEntrepriseID,sessionID,sessionFormationID,isGroupe,isPerso", f"{participant.id},{agent},{free[0][1]},{free[0][0]},false,true"]
+    response = client.post("/session_participants/bulk/", files={"file": ("participants.csv", "\n".join(lines).encode(), "text/csv")})
+    assert response.json()["updated"] == 1
+    assert_stats_match_rebuild(client, run_jobs)
+
+
+def test_csv_row_limit(client, monkeypatch):
+    monkeypatch.setattr(bulk, "BULK_MAX_ROWS", 3)
+    header = b"id,agentEntrepriseID,sessionID,sessionFormationID,isGroupe,isPerso\n"
+    line = b",1,1,1,true,false\n"
+    def post(content):
+        return client.post("/session_participants/bulk/", files={"file": ("participants.csv", content, "text/csv")})
+
+    # Stopped at the 4th row : the bytes after it (not UTF-8) are never decoded
+    response = post(header + line * 4 + line * 2000 + b"\xff\xfe")
+    assert response.status_code == 413 and response.json()["detail"] == "3 lignes maximum par import !"
+    # Read up to the end : the same bytes within the limit are refused
+    assert post(header + line + b"\xff\xfe").status_code == 400
+    # At the limit : read, then validated (unknown references)
+    assert post(header + line * 3).status_code == 422
@@ -0,0 +1,48 @@
+import time
+from utils.cache import TTLCache, etag_matches
+
+
+def test_etag_matches_exactly():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"x", W/"abc" , "y"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    # Prefix, infix, unquoted : not the same entity tag
+    assert not etag_matches('"abcd"', '"abc"')
+    assert not etag_matches('"zabcz"', '"abc"')
+    assert not etag_matches("abc", '"abc"')
+    assert not etag_matches(None, '"abc"')
+    assert not etag_matches("", '"abc"')
+
+
+def test_ttl_cache_expiry_and_invalidation():
+    cache = TTLCache(ttl=60, maxsize=2)
+    cache.set(("tags", 1), "a")
+    cache.set(("tags", 2), "b")
+    cache.get(("tags", 1))
+    cache.set(("roles", 1), "c")
+    # Least recently used entry dropped
+    assert cache.get(("tags", 2)) is None
+    cache.invalidate("tags")
+    assert cache.get(("tags", 1)) is None and cache.get(("roles", 1)) == "c"
+
+    cache = TTLCache(ttl=0)
+    cache.set(("tags", 1), "a")
+    time.sleep(0.01)
+    assert cache.get(("tags", 1)) is None
+
+
+def test_tags_etag_and_invalidation(client):
+    client.post("/tags/", data={"libelle": "python"})
+    response = client.get("/tags/")
+    etag = response.headers["etag"]
+    assert response.status_code == 200 and response.json()[0]["libelle"] == "python"
+
+    assert client.get("/tags/", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/tags/", headers={"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+    assert client.get("/tags/", headers={"If-None-Match": etag[:-2] + '"'}).status_code == 200
+
+    # A write drops the cached body : new content, new ETag
+    client.post("/tags/", data={"libelle": "sql"})
+    response = client.get("/tags/", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and len(response.json()) == 2
+    assert response.headers["etag"] != etag
@@ -0,0 +1,52 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from sqlalchemy import func, select
+from database_sys import models
+from database_sys.database import engine
+from settings import config
+from utils import certificate
+
+
+@pytest.fixture
+def executor():
+    # Threads instead of the spawned processes : same settings.config as the tests
+    pool = ThreadPoolExecutor(max_workers=2)
+    previous = certificate.set_executor(pool)
+    yield pool
+    certificate.set_executor(previous)
+    pool.shutdown()
+
+
+def test_one_pdf_per_participant(client, dataset, run_jobs, executor, monkeypatch):
+    # Batches of 2 : several tasks for one session
+    monkeypatch.setattr(certificate, "CERTIFICATE_BATCH_SIZE", 2)
+    with engine.connect() as connection:
+        session_id, count = connection.execute(
+            select(models.SessionParticipant.sessionID, func.count())
+            .group_by(models.SessionParticipant.sessionID).order_by(func.count().desc()).limit(1)
+        ).one()
+        participants = list(connection.scalars(select(models.SessionParticipant.id).where(models.SessionParticipant.sessionID==session_id).order_by(models.SessionParticipant.id)))
+    assert count > 2
+
+    job_id = client.post(f"/sessions/{session_id}/certificats/").json()["data"]["id"]
+    assert run_jobs() == 1
+    job = client.get(f"/jobs/{job_id}/").json()
+    assert job["status"] == "termine"
+    result = json.loads(job["result"])
+    assert result == [
+        {"participantID": participant_id, "url": f"{config.MEDIA_URL}{config.CERTIFICATE_DIR}/{session_id}/{participant_id}.pdf"}
+        for participant_id in participants
+    ]
+
+    directory = os.path.join(config.MEDIA_ROOT, config.CERTIFICATE_DIR, str(session_id))
+    assert sorted(os.listdir(directory)) == sorted(f"{participant_id}.pdf" for participant_id in participants)
+    with open(os.path.join(directory, f"{participants[0]}.pdf"), "rb") as pdf_file:
+        assert pdf_file.read(5) == b"%PDF-"
+    # The certificates are served like the other media
+    assert client.get("/" + result[0]["url"]).headers["content-type"] == "application/pdf"
+
+
+def test_unknown_session(client):
+    assert client.post("/sessions/999999/certificats/").status_code == 404
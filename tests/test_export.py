@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from sqlalchemy import insert
+from database_sys import models
+from database_sys.database import engine
+from settings import config
+from utils import export
+
+COLUMNS = [column.name for column in models.FichePresence.__table__.columns]
+
+
+def fiches(count):
+    # Agents 1 and 2 in turn, more rows than one yield_per chunk
+    rows = [
+        {
+            "id": fiche_id, "agentEntrepriseID": fiche_id % 2 + 1, "sessionformationID": 1, "formateurID": 1,
+            "dateDebut": date(2026, 1, 5), "dateFin": date(2026, 1, 6), "signatureElectronique": "", "createdAt": datetime(2026, 1, 5, 8),
+        }
+        for fiche_id in range(1, count + 1)
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(models.FichePresence), rows)
+    return rows
+
+
+def test_ndjson_export(client, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_CHUNK_SIZE", 100)
+    fiches(250)
+    response = client.get("/fiche_presences/export/")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-disposition"] == 'attachment; filename="fiche_presence.ndjson"'
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == list(range(1, 251))
+    assert list(lines[0]) == COLUMNS and lines[0]["dateDebut"] == "2026-01-05"
+
+    # Filters of the list endpoint
+    lines = client.get("/fiche_presences/export/?agentEntrepriseID=1").text.splitlines()
+    assert [json.loads(line)["id"] for line in lines] == list(range(2, 251, 2))
+    assert client.get("/fiche_presences/export/?dateDebut=2026-01-05").status_code == 400
+
+
+def test_csv_export(client):
+    fiches(config.EXPORT_CHUNK_SIZE * 2 + 5)
+    rows = list(csv.reader(io.StringIO(client.get("/fiche_presences/export/?export_format=csv").text)))
+    assert rows[0] == COLUMNS
+    assert len(rows) == config.EXPORT_CHUNK_SIZE * 2 + 6
+    assert [row[0] for row in rows[1:3]] == ["1", "2"]
+
+    rows = list(csv.reader(io.StringIO(client.get("/fiche_presences/export/?export_format=csv&agentEntrepriseID=2,9").text)))
+    assert len(rows) == config.EXPORT_CHUNK_SIZE + 4 and {row[1] for row in rows[1:]} == {"2"}
+    # Header only when nothing matches
+    assert client.get("/fiche_presences/export/?export_format=csv&agentEntrepriseID=9").text.splitlines() == [",".join(COLUMNS)]
@@ -0,0 +1,135 @@
+import gzip
+import json
+import os
+from datetime import date, datetime
+import pytest
+from sqlalchemy import insert, text
+from database_sys import models
+from database_sys.database import engine
+from database_sys.partitions import add_months, archive_historique, create_historique_partitions, month_start, monthly_table, partition_name
+from settings import config
+
+TODAY = date(2026, 10, 18)
+
+
+def month_ago(months: int):
+    return datetime.combine(add_months(month_start(TODAY), -months), datetime.min.time()).replace(day=10)
+
+
+@pytest.fixture
+def entries(client):
+    # 2 rows past the retention, 1 row in a cold month, 2 recent rows : every
+    # month in between is empty
+    rows = [
+        {"id": 1, "createAt": month_ago(14)},
+        {"id": 2, "createAt": month_ago(14)},
+        {"id": 3, "createAt": month_ago(5)},
+        {"id": 4, "createAt": month_ago(1)},
+        {"id": 5, "createAt": month_ago(0)},
+    ]
+    rows = [dict(row, userID=1, description=f"entrée {row['id']}", typeOperation="creation") for row in rows]
+    with engine.begin() as connection:
+        connection.execute(insert(models.Historique), rows)
+    return rows
+
+
+def table_names():
+    with engine.connect() as connection:
+        return sorted(connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'historique_%'")).scalars())
+
+
+def test_archive_only_the_months_with_rows(run, entries):
+    summary = run(archive_historique, TODAY)
+    retention = add_months(month_start(TODAY), -14)
+    cold = add_months(month_start(TODAY), -5)
+
+    assert summary["moved"] == {f"{retention:%Y-%m}": 2, f"{cold:%Y-%m}": 1}
+    assert list(summary["archived"]) == [f"{retention:%Y-%m}"]
+    assert summary["archived"][f"{retention:%Y-%m}"]["rows"] == 2
+    # No monthly table / archive file for the empty months
+    assert table_names() == [f"historique_{cold:%Y_%m}"]
+    assert os.listdir(config.ARCHIVE_DIR) == [f"historique_{retention:%Y_%m}.ndjson.gz"]
+    with gzip.open(summary["archived"][f"{retention:%Y-%m}"]["file"], "rt", encoding="utf-8") as archive:
+        assert [json.loads(line)["id"] for line in archive] == [1, 2]
+
+    # Nothing left to move : nothing created
+    assert run(archive_historique, TODAY) == {"moved": {}, "archived": {}}
+    assert table_names() == [f"historique_{cold:%Y_%m}"]
+
+
+def test_by_id_in_the_monthly_tables(client, run, entries):
+    run(archive_historique, TODAY)
+    # Entry 3 is in a monthly table, entry 5 still in historique
+    assert client.get("/historiques/3/").json()["description"] == "entrée 3"
+    assert client.get("/historiques/5/").json()["description"] == "entrée 5"
+    assert client.get("/historiques/1/").status_code == 404
+
+    response = client.put("/history/3/", data={"description": "modifiée"})
+    assert response.status_code == 200 and response.json()["description"] == "modifiée"
+    assert response.json()["updatedAt"] is not None
+    assert client.get("/historiques/3/").json()["description"] == "modifiée"
+    assert client.put("/history/1/", data={"description": "archivée"}).status_code == 404
+
+    assert client.delete("/history/3/").status_code == 200
+    assert client.get("/historiques/3/").status_code == 404
+    assert client.delete("/history/3/").status_code == 404
+
+
+def test_export_reads_the_monthly_tables(client, run, entries):
+    run(archive_historique, TODAY)
+    response = client.get("/historiques/export/")
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [3, 4, 5]
+
+    lines = client.get("/historiques/export/?export_format=csv").text.splitlines()
+    assert lines[0].startswith("id,userID") and [line.split(",")[0] for line in lines[1:]] == ["3", "4", "5"]
+
+
+def pages(client, limit=2):
+    ids, params = [], {"limit": limit}
+    while True:
+        response = client.get("/historiques/", params=params)
+        ids += [row["id"] for row in response.json()]
+        if "x-next-cursor" not in response.headers:
+            return ids
+        params["after"] = response.headers["x-next-cursor"]
+
+
+def test_ids_are_not_reused_once_historique_is_empty(client, run, entries):
+    # Four months later every row has left historique : 1, 2 archived to files, 3 to 5 in monthly tables
+    summary = run(archive_historique, add_months(TODAY, 4))
+    assert sum(summary["moved"].values()) == len(entries)
+    with engine.connect() as connection:
+        assert connection.scalar(text("SELECT count(*) FROM historique")) == 0
+
+    created = client.post("/historiques/", data={"userID": 1, "description": "nouvelle", "typeOperation": "creation"}).json()
+    assert created["id"] > max(row["id"] for row in entries)
+    assert pages(client) == [3, 4, 5, created["id"]]
+    assert client.get(f"/historiques/{created['id']}/").json()["description"] == "nouvelle"
+
+
+def test_table_without_autoincrement_is_rebuilt(client, entries):
+    # historique created before AUTOINCREMENT, an archived month holding the largest id
+    month = add_months(month_start(TODAY), -5)
+    with engine.begin() as connection:
+        monthly_table(partition_name(month)).create(connection)
+        connection.execute(text(f'INSERT INTO "{partition_name(month)}" SELECT * FROM historique WHERE id = 3'))
+        connection.execute(text("UPDATE \"%s\" SET id = 9" % partition_name(month)))
+        connection.execute(text("ALTER TABLE historique RENAME TO historique_old"))
+        connection.execute(text("DROP INDEX historique_userid_index"))
+        connection.execute(text("DROP INDEX historique_createat_index"))
+        connection.execute(text(
+            'CREATE TABLE historique (id INTEGER NOT NULL PRIMARY KEY, "userID" INTEGER NOT NULL REFERENCES user (id), '
+            'description VARCHAR NOT NULL, "typeOperation" VARCHAR NOT NULL, "createAt" DATETIME NOT NULL, "updatedAt" DATETIME)'
+        ))
+        connection.execute(text("INSERT INTO historique SELECT * FROM historique_old WHERE id != 3"))
+        connection.execute(text("DROP TABLE historique_old"))
+
+    create_historique_partitions(engine)
+    create_historique_partitions(engine)
+    with engine.connect() as connection:
+        assert "AUTOINCREMENT" in connection.scalar(text("SELECT sql FROM sqlite_master WHERE name = 'historique'"))
+        assert sorted(connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'historique'")).scalars()) == [
+            "historique_createat_index", "historique_userid_index",
+        ]
+        assert list(connection.execute(text("SELECT id FROM historique ORDER BY id")).scalars()) == [1, 2, 4, 5]
+    assert client.post("/historiques/", data={"userID": 1, "description": "nouvelle", "typeOperation": "creation"}).json()["id"] == 10
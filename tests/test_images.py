@@ -0,0 +1,103 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from PIL import Image
+from settings import config
+from utils import images
+
+
+@pytest.fixture
+def executor():
+    # Threads instead of the spawned processes : same settings.config as the tests
+    pool = ThreadPoolExecutor(max_workers=2)
+    previous = images.set_executor(pool)
+    yield pool
+    images.set_executor(previous)
+    pool.shutdown()
+
+
+def png(width, height, color=(200, 30, 30, 128)):
+    content = io.BytesIO()
+    Image.new("RGBA", (width, height), color).save(content, format="PNG")
+    return content.getvalue()
+
+
+def create_cours(client, content, libelle="Python"):
+    response = client.post(
+        "/cours/",
+        data={"libelle": libelle, "description": "Les bases", "status": 1, "categorieID": 1},
+        files={"imageUrl": ("image.png", content, "image/png")},
+    )
+    return response.json()["data"]["imageUrl"]
+
+
+def variant_path(url, width, extension):
+    return os.path.join(config.MEDIA_ROOT, images.variant_relative_path(images.media_path(url), width, extension))
+
+
+def job_results(client):
+    return [job["result"] for job in client.get("/jobs/", params={"sort": "id"}).json()]
+
+
+def test_one_variant_per_width(client, run_jobs, executor):
+    url = create_cours(client, png(1500, 750))
+    assert run_jobs() == 1
+    for width in config.IMAGE_VARIANT_WIDTHS:
+        for extension, (image_format, _) in images.VARIANT_FORMATS.items():
+            with Image.open(variant_path(url, width, extension)) as variant:
+                assert (variant.format, variant.size) == (image_format, (width, width // 2))
+    # JPEG has no transparency : on white
+    with Image.open(variant_path(url, 160, "jpg")) as variant:
+        assert variant.mode == "RGB"
+
+    # Same content uploaded again : nothing rendered
+    mtime = os.path.getmtime(variant_path(url, 160, "webp"))
+    assert create_cours(client, png(1500, 750), "Python avancé") == url
+    assert run_jobs() == 1
+    assert job_results(client) == ['{"%s": 8}' % url, '{"%s": 0}' % url]
+    assert os.path.getmtime(variant_path(url, 160, "webp")) == mtime
+
+
+def test_no_variant_wider_than_the_original(client, run_jobs, executor):
+    url = create_cours(client, png(500, 100))
+    run_jobs()
+    assert [os.path.exists(variant_path(url, width, "webp")) for width in config.IMAGE_VARIANT_WIDTHS] == [True, True, False, False]
+
+
+def test_width_and_format_of_the_answer(client, run_jobs, executor):
+    url = create_cours(client, png(1500, 750))
+    run_jobs()
+    digest = os.path.splitext(os.path.basename(url))[0]
+
+    def get(w, accept):
+        response = client.get(f"/{url}", params={"w": w}, headers={"Accept": accept})
+        assert response.status_code == 200
+        return response
+
+    # Smallest width at least as large as asked
+    for w, width in ((1, 160), (160, 160), (161, 320), (300, 320), (1280, 1280)):
+        response = get(w, "image/avif,image/webp,*/*")
+        assert response.headers["etag"] == f'"{digest}-{width}.webp"' and response.headers["content-type"] == "image/webp"
+        assert "immutable" in response.headers["cache-control"] and response.headers["vary"] == "Accept"
+    for accept in ("image/jpeg,*/*", "image/webp;q=0,*/*", ""):
+        response = get(300, accept)
+        assert response.headers["etag"] == f'"{digest}-320.jpg"' and response.headers["content-type"] == "image/jpeg"
+
+    # Wider than every variant : the original, not cached as immutable
+    response = get(2000, "image/webp")
+    assert response.headers["etag"] == f'"{os.path.basename(url)}"' and response.headers["content-type"] == "image/png"
+    assert response.headers["cache-control"] == "no-cache"
+    # /images/ takes the imageUrl with or without "medias/"
+    assert client.get(f"/images/{images.media_path(url)}", params={"w": 300}, headers={"Accept": "image/webp"}).headers["etag"] == f'"{digest}-320.webp"'
+
+
+def test_original_until_the_variants_are_rendered(client, run_jobs, executor):
+    url = create_cours(client, png(800, 400))
+    response = client.get(f"/{url}", params={"w": 300}, headers={"Accept": "image/webp"})
+    assert response.headers["content-type"] == "image/png" and "immutable" not in response.headers["cache-control"]
+    run_jobs()
+    response = client.get(f"/{url}", params={"w": 300}, headers={"Accept": "image/webp"})
+    assert response.headers["content-type"] == "image/webp" and "immutable" in response.headers["cache-control"]
+    # Without ?w= : always the original
+    assert client.get(f"/{url}").headers["content-type"] == "image/png"
@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from database_sys import models
+from database_sys.crud import claim_job, create_job, finish_job, requeue_stale_jobs
+from database_sys.database import AsyncSessionLocal, async_engine, engine
+from utils import jobs
+
+
+async def enqueue(job_type, payload=None):
+    async with AsyncSessionLocal() as db:
+        return (await create_job(db, job_type, payload or {})).id
+
+
+async def claim():
+    async with AsyncSessionLocal() as db:
+        return await claim_job(db)
+
+
+async def finish(db_job, **outcome):
+    async with AsyncSessionLocal() as db:
+        return await finish_job(db, db_job, **outcome)
+
+
+def get_job(client, job_id):
+    return client.get(f"/jobs/{job_id}/").json()
+
+
+def test_job_result_and_error(client, run, run_jobs, monkeypatch):
+    async def fails(payload):
+        raise ValueError(payload["message"])
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "echo", lambda payload: asyncio.sleep(0, payload))
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "fails", fails)
+    done = run(enqueue, "echo", {"value": 1})
+    failed = run(enqueue, "fails", {"message": "boom"})
+
+    assert run_jobs() == 2
+    assert get_job(client, done)["status"] == "termine" and get_job(client, done)["result"] == '{"value": 1}'
+    assert get_job(client, failed)["status"] == "erreur" and "boom" in get_job(client, failed)["error"]
+    assert run_jobs() == 0
+
+
+def test_handler_runs_without_the_claim_connection(run, run_jobs, monkeypatch):
+    checked_out = []
+    async def handler(payload):
+        checked_out.append(async_engine.pool.checkedout())
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "pool", handler)
+    run(enqueue, "pool")
+    run_jobs()
+    assert checked_out == [0]
+
+
+def test_heartbeat_keeps_a_long_job(client, run, run_jobs, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_INTERVAL", 0.02)
+    async def long_job(payload):
+        # The claim is old, the worker is alive : not requeued
+        with engine.begin() as connection:
+            connection.execute(update(models.Job).values(startedAt=datetime.now() - timedelta(hours=1)))
+        await asyncio.sleep(0.1)
+        async with AsyncSessionLocal() as db:
+            await requeue_stale_jobs(db, timeout=60, max_attempts=3)
+        return "fini"
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "long", long_job)
+    job_id = run(enqueue, "long")
+
+    run_jobs()
+    job = get_job(client, job_id)
+    assert (job["status"], job["attempts"], job["result"]) == ("termine", 1, '"fini"')
+
+
+def test_requeued_job_belongs_to_the_new_attempt(client, run):
+    job_id = run(enqueue, "export")
+    first = run(claim)
+    # The first worker is lost : its claim times out, another worker takes the job
+    with engine.begin() as connection:
+        connection.execute(update(models.Job).values(startedAt=datetime.now() - timedelta(hours=1)))
+    async def requeue():
+        async with AsyncSessionLocal() as db:
+            await requeue_stale_jobs(db, timeout=60, max_attempts=3)
+    run(requeue)
+    second = run(claim)
+    assert (first.id, second.id, second.attempts) == (job_id, job_id, 2)
+
+    assert not run(finish, first, error="trop tard")
+    assert run(finish, second, result={"url": "exports/historique.csv"})
+    job = get_job(client, job_id)
+    assert (job["status"], job["error"]) == ("termine", None)
@@ -0,0 +1,54 @@
+import os
+from settings import config
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+
+def test_content_addressed_file_is_immutable(client, create_fiche):
+    url = "/" + create_fiche(PNG).json()["data"]["signatureElectronique"]
+    response = client.get(url)
+    etag = response.headers["etag"]
+    assert response.content == PNG and response.headers["content-type"] == "image/png"
+    assert "immutable" in response.headers["cache-control"]
+    assert etag == '"%s"' % url.rsplit("/", 1)[1]
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(url, headers={"If-None-Match": f'"autre", W/{etag}'}).status_code == 304
+    # Part of an entity tag, or an entity tag containing it : not the same file
+    assert client.get(url, headers={"If-None-Match": etag[:10] + '"'}).status_code == 200
+    assert client.get(url, headers={"If-None-Match": '"x' + etag[1:-1] + 'x"'}).status_code == 200
+    assert client.get(url, headers={"If-None-Match": etag + "-gzip"}).status_code == 200
+
+
+def test_ranges(client):
+    os.makedirs(os.path.join(config.MEDIA_ROOT, config.EXPORT_DIR), exist_ok=True)
+    with open(os.path.join(config.MEDIA_ROOT, config.EXPORT_DIR, "historique.csv"), "wb") as export_file:
+        export_file.write(b"0123456789" * 10)
+    url = f"/medias/{config.EXPORT_DIR}/historique.csv"
+
+    response = client.get(url)
+    assert response.headers["cache-control"] == "no-cache" and len(response.content) == 100
+    etag = response.headers["etag"]
+
+    response = client.get(url, headers={"Range": "bytes=10-14"})
+    assert (response.status_code, response.content) == (206, b"01234")
+    assert response.headers["content-range"] == "bytes 10-14/100"
+    assert client.get(url, headers={"Range": "bytes=-3"}).content == b"789"
+    assert client.get(url, headers={"Range": "bytes=95-500"}).content == b"56789"
+    assert client.get(url, headers={"Range": "bytes=100-"}).status_code == 416
+    # Several ranges, or a stale If-Range : the whole file
+    assert client.get(url, headers={"Range": "bytes=0-1,5-6"}).status_code == 200
+    assert client.get(url, headers={"Range": "bytes=0-1", "If-Range": '"ancien"'}).status_code == 200
+    assert client.get(url, headers={"Range": "bytes=0-1", "If-Range": etag}).status_code == 206
+
+    response = client.head(url)
+    assert (response.status_code, response.content, response.headers["content-length"]) == (200, b"", "100")
+
+
+def test_private_and_missing_files(client):
+    os.makedirs(os.path.join(config.MEDIA_ROOT, config.MEDIA_TMP), exist_ok=True)
+    with open(os.path.join(config.MEDIA_ROOT, config.MEDIA_TMP, "upload"), "wb") as tmp_file:
+        tmp_file.write(b"en cours")
+    assert client.get(f"/medias/{config.MEDIA_TMP}/upload").status_code == 404
+    assert client.get("/medias/store/inconnu.png").status_code == 404
+    assert client.get("/medias/%2E%2E/settings/config.py").status_code == 404
@@ -0,0 +1,115 @@
+import os
+import time
+from datetime import datetime
+from sqlalchemy import func, insert, select, update
+from database_sys import models
+from database_sys.database import engine
+from settings import config
+from utils import media_gc
+from utils.media_gc import collect_media
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"signature" * 100
+OTHER_PNG = b"\x89PNG\r\n\x1a\n" + b"autre signature" * 100
+
+
+def upload(create_fiche, content):
+    # (fiche id, path of the signature relative to MEDIA_ROOT)
+    data = create_fiche(content).json()["data"]
+    return data["id"], data["signatureElectronique"][len(config.MEDIA_URL):]
+
+
+def write(relative_path, content=b"contenu"):
+    file_path = os.path.join(config.MEDIA_ROOT, relative_path)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "wb") as media_file:
+        media_file.write(content)
+    return relative_path
+
+
+def store_file(name, ref_count):
+    # Stored file with its media row, written without going through the API
+    relative_path = write(f"{config.MEDIA_STORE}/{name[:2]}/{name[2:4]}/{name}.png")
+    with engine.begin() as connection:
+        connection.execute(insert(models.Media), {
+            "path": config.MEDIA_URL + relative_path, "hash": name, "size": 7, "refCount": ref_count, "createAt": datetime.now(),
+        })
+    return relative_path
+
+
+def age_every_file(but=()):
+    old = time.time() - config.MEDIA_GC_GRACE_PERIOD - 60
+    for root, _, names in os.walk(config.MEDIA_ROOT):
+        for name in names:
+            file_path = os.path.join(root, name)
+            if os.path.relpath(file_path, config.MEDIA_ROOT) not in but:
+                os.utime(file_path, (old, old))
+
+
+def exists(relative_path):
+    return os.path.isfile(os.path.join(config.MEDIA_ROOT, relative_path))
+
+
+def ref_counts():
+    with engine.connect() as connection:
+        return {row.path[len(config.MEDIA_URL):]: row.refCount for row in connection.execute(select(models.Media))}
+
+
+def test_collect_every_kind_of_orphan(client, create_fiche, run):
+    _, kept = upload(create_fiche, PNG)
+    fiche_id, released = upload(create_fiche, OTHER_PNG)
+    client.delete(f"/fiche_presences/{fiche_id}/")
+    # refCount above the rows : corrected, the file waits for the next run
+    drifted = store_file("c" * 64, ref_count=1)
+    # Row written without taking the reference : corrected, kept
+    unaccounted = store_file("d" * 64, ref_count=0)
+    with engine.begin() as connection:
+        fiche = connection.scalar(select(func.min(models.FichePresence.id)).where(models.FichePresence.signatureElectronique==""))
+        connection.execute(update(models.FichePresence).where(models.FichePresence.id==fiche).values(signatureElectronique=config.MEDIA_URL + unaccounted))
+        connection.execute(insert(models.Formation), {"libelle": "Python", "imageUrl": "medias/formations/img-python.png", "formateurID": 1, "createdAt": datetime.now()})
+
+    digest, released_digest = os.path.basename(kept)[:64], os.path.basename(released)[:64]
+    legacy = [write("formations/img-python.png"), write("formations/6908646_img-python.png"), write("img-python.png")]
+    variants = [write(f"variants/ab/cd/{digest}-320.webp"), write(f"variants/ab/cd/{released_digest}-320.webp")]
+    skipped = [write("exports/historique.csv"), write("certificats/1/2.pdf")]
+    tmp = write("tmp/upload")
+    fresh = write("formations/nouveau.png")
+    age_every_file(but=[fresh])
+
+    summary = run(collect_media, mode="delete")
+    removed = [released, legacy[1], legacy[2], variants[1], tmp]
+    assert (summary["orphans"], summary["refcount_fixed"]) == (len(removed), 2)
+    assert not any(exists(relative_path) for relative_path in removed)
+    assert all(exists(relative_path) for relative_path in [kept, drifted, unaccounted, legacy[0], variants[0], *skipped, fresh])
+    assert ref_counts() == {kept: 1, drifted: 0, unaccounted: 1}
+
+    summary = run(collect_media, mode="delete")
+    assert (summary["orphans"], summary["refcount_fixed"]) == (1, 0)
+    assert not exists(drifted) and ref_counts() == {kept: 1, unaccounted: 1}
+
+
+def test_only_the_removed_files_lose_their_row(client, create_fiche, run, monkeypatch):
+    fiche_id, released = upload(create_fiche, PNG)
+    client.delete(f"/fiche_presences/{fiche_id}/")
+    fiche_id, reused = upload(create_fiche, OTHER_PNG)
+    client.delete(f"/fiche_presences/{fiche_id}/")
+    age_every_file()
+
+    # Uploaded again between the scan and the removal : kept, with its row
+    mtime = media_gc.storage.mtime
+    monkeypatch.setattr(media_gc.storage, "mtime", lambda relative_path: time.time() if relative_path == reused else mtime(relative_path))
+    summary = run(collect_media, mode="quarantine")
+    assert summary["orphans"] == 2
+    assert not exists(released) and exists(reused)
+    assert ref_counts() == {reused: 0}
+    assert any(name.endswith(os.path.basename(released)) for _, _, names in os.walk(os.path.join(config.MEDIA_ROOT, config.MEDIA_QUARANTINE)) for name in names)
+
+
+def test_dry_run_changes_nothing(client, create_fiche, run):
+    fiche_id, released = upload(create_fiche, PNG)
+    client.delete(f"/fiche_presences/{fiche_id}/")
+    drifted = store_file("c" * 64, ref_count=3)
+    age_every_file()
+
+    summary = run(collect_media, dry_run=True)
+    assert summary["files"] == [released] and summary["refcount_fixed"] == 1
+    assert exists(released) and ref_counts() == {released: 0, drifted: 3}
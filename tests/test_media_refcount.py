@@ -0,0 +1,46 @@
+import hashlib
+import os
+from sqlalchemy import select
+from database_sys import models
+from database_sys.database import engine
+from settings import config
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"signature" * 100
+OTHER_PNG = b"\x89PNG\r\n\x1a\n" + b"autre signature" * 100
+
+
+def media_rows():
+    with engine.connect() as connection:
+        return {row.path: row for row in connection.execute(select(models.Media))}
+
+
+def test_same_content_is_stored_once(client, create_fiche):
+    first = create_fiche(PNG).json()["data"]
+    second = create_fiche(PNG).json()["data"]
+
+    digest = hashlib.sha256(PNG).hexdigest()
+    url = f"{config.MEDIA_URL}{config.MEDIA_STORE}/{digest[:2]}/{digest[2:4]}/{digest}.png"
+    assert first["signatureElectronique"] == second["signatureElectronique"] == url
+    assert os.path.isfile(os.path.join(config.MEDIA_ROOT, url[len(config.MEDIA_URL):]))
+
+    media = media_rows()[url]
+    assert (media.hash, media.size, media.refCount) == (digest, len(PNG), 2)
+
+
+def test_replace_and_delete_release_the_reference(client, create_fiche):
+    first = create_fiche(PNG).json()["data"]
+    second = create_fiche(PNG).json()["data"]
+    url = first["signatureElectronique"]
+
+    response = client.put(f"/fiche_presences/{first['id']}/", files={"signatureElectronique": ("new.png", OTHER_PNG, "image/png")})
+    assert response.status_code == 200
+    new_url = response.json()["data"]["signatureElectronique"]
+    assert new_url != url
+    rows = media_rows()
+    assert rows[url].refCount == 1
+    assert rows[new_url].refCount == 1
+
+    client.delete(f"/fiche_presences/{second['id']}/")
+    assert media_rows()[url].refCount == 0
+    # The file itself is left to the media GC (utils/media_gc.py)
+    assert os.path.isfile(os.path.join(config.MEDIA_ROOT, url[len(config.MEDIA_URL):]))
@@ -0,0 +1,11 @@
+import logging
+from utils import metrics
+
+
+def test_n_plus_one_is_logged_and_counted(client, caplog, monkeypatch):
+    monkeypatch.setattr(metrics, "N_PLUS_ONE_THRESHOLD", 1)
+    with caplog.at_level(logging.WARNING, logger="utils.metrics"):
+        response = client.get("/tags/")
+    assert "db;dur=" in response.headers["server-timing"]
+    assert [record.getMessage().split(" : ")[:2] for record in caplog.records] == [["N+1", "GET /tags/ a exécuté 1 fois"]]
+    assert 'n_plus_one_total{method="GET",route="/tags/"}' in client.get("/metrics").text
@@ -0,0 +1,74 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import insert
+from database_sys import models
+from database_sys.database import engine
+
+
+@pytest.fixture
+def entreprises(client):
+    # 57 rows, the libelle repeat (ties on the sort column)
+    rows = [
+        {"id": i, "libelle": f"entreprise {i % 7}-{i}", "reference": f"REF{i}", "nom_responsable": "responsable", "createdAt": datetime.now()}
+        for i in range(1, 58)
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(models.Entreprise), rows)
+    return rows
+
+
+def walk(client, url):
+    # Every page of a list endpoint, following X-Next-Cursor
+    pages, after = [], None
+    while True:
+        response = client.get(url, params={"after": after} if after else {})
+        assert response.status_code == 200
+        pages.append(response.json())
+        after = response.headers.get("x-next-cursor")
+        if after is None:
+            return pages
+
+
+def test_pages_cover_every_row_once(client, entreprises):
+    pages = walk(client, "/entreprises/?limit=10")
+    assert [len(page) for page in pages] == [10, 10, 10, 10, 10, 7]
+    ids = [row["id"] for page in pages for row in page]
+    assert ids == list(range(1, 58))
+
+
+def test_exact_multiple_of_the_limit_has_no_empty_page(client, entreprises):
+    pages = walk(client, "/entreprises/?limit=57")
+    assert len(pages) == 1 and len(pages[0]) == 57
+
+
+def test_sort_on_an_indexed_column_with_ties(client, entreprises):
+    pages = walk(client, "/entreprises/?limit=8&sort=-libelle")
+    rows = [(row["libelle"], row["id"]) for page in pages for row in page]
+    expected = sorted(((row["libelle"], row["id"]) for row in entreprises), reverse=True)
+    assert rows == expected
+
+
+def test_total_only_when_asked(client, entreprises):
+    response = client.get("/entreprises/?limit=5")
+    assert "x-total-count" not in response.headers
+    response = client.get("/entreprises/?limit=5&with_total=true")
+    assert response.headers["x-total-count"] == "57"
+    assert response.headers["x-next-cursor"] == "5"
+
+
+def test_filter_and_pagination(client, entreprises):
+    response = client.get("/entreprises/", params={"libelle": "entreprise 3-10", "with_total": "true"})
+    assert response.headers["x-total-count"] == "1"
+    assert [row["id"] for row in response.json()] == [10]
+
+
+def test_invalid_parameters(client, entreprises):
+    assert client.get("/entreprises/?after=abc").status_code == 400
+    assert client.get("/entreprises/?sort=libelle&after=no-comma").status_code == 400
+    # Not indexed : refused instead of a full scan
+    assert client.get("/entreprises/?sort=reference").status_code == 400
+    assert client.get("/entreprises/?limit=100000").status_code == 422
+
+
+def test_empty_table(client):
+    assert client.get("/entreprises/").status_code == 404
@@ -0,0 +1,67 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import OperationalError
+import main
+from database_sys import models
+from database_sys.database import engine
+
+
+@pytest.fixture
+def rows(client):
+    now = datetime.now()
+    with engine.begin() as connection:
+        connection.execute(insert(models.Formation), [
+            {"id": 1, "libelle": "Python avancé", "description": "Décorateurs et générateurs", "formateurID": 1, "createdAt": now},
+            {"id": 2, "libelle": "Sécurité réseau", "description": None, "formateurID": 1, "createdAt": now},
+        ])
+        connection.execute(insert(models.Cours), [
+            {"id": 1, "libelle": "Introduction", "categorieID": 1, "description": "Les bases de python", "createdAt": now},
+        ])
+        connection.execute(insert(models.Entreprise), [
+            {"id": 1, "libelle": "Pythonia", "reference": "PY-01", "nom_responsable": "responsable", "createdAt": now},
+        ])
+
+
+def found(client, q, **params):
+    response = client.get("/search/", params=dict(params, q=q))
+    assert response.status_code == 200
+    return [(row["type"], row["id"]) for row in response.json()]
+
+
+def test_words_prefix_and_accents(client, rows):
+    # The title weighs more than the body
+    results = found(client, "python")
+    assert results.index(("formation", 1)) < results.index(("cours", 1))
+    assert found(client, "decorateurs") == [("formation", 1)]
+    # Last word as a prefix, accents ignored
+    assert set(found(client, "pyth")) == {("formation", 1), ("cours", 1), ("entreprise", 1)}
+    assert found(client, "securite res") == [("formation", 2)]
+    assert found(client, "python reseau") == []
+    assert found(client, "pyth", type="entreprise") == [("entreprise", 1)]
+    assert found(client, "  ,;  ") == []
+
+
+def test_triggers_follow_the_writes(client, rows):
+    with engine.begin() as connection:
+        connection.execute(update(models.Formation).where(models.Formation.id==2).values(libelle="Cryptographie"))
+        connection.execute(delete(models.Cours))
+    assert found(client, "securite") == []
+    assert found(client, "crypto") == [("formation", 2)]
+    assert found(client, "bases") == []
+
+
+def test_operators_are_plain_words(client, rows):
+    # FTS5 / tsquery syntax in q is taken as words, never a syntax error
+    assert found(client, 'python" OR NEAR(') == []
+    assert found(client, "pyth* AND -bases ^") == []
+    assert set(found(client, '"python"')) == {("formation", 1), ("cours", 1), ("entreprise", 1)}
+
+
+def test_database_errors_are_server_errors(client, rows, monkeypatch):
+    # A locked database or a missing index is not an invalid search
+    async def locked(*args):
+        raise OperationalError("SELECT", {}, Exception("database is locked"))
+    monkeypatch.setattr(main, "search", locked)
+    with pytest.raises(OperationalError):
+        client.get("/search/", params={"q": "python"})
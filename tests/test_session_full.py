@@ -0,0 +1,65 @@
+import re
+from datetime import date, datetime
+from sqlalchemy import insert, select
+from database_sys import models
+from database_sys.database import engine
+
+
+def get_full(client, session_id):
+    # (payload, number of SQL statements of the request from Server-Timing)
+    response = client.get(f"/sessions/{session_id}/full/")
+    assert response.status_code == 200
+    return response.json(), int(re.search(r'desc="(\d+) requetes SQL"', response.headers["server-timing"])[1])
+
+
+def add_rows(session_id, count):
+    # count participants, each with its session formation and two fiches
+    with engine.begin() as connection:
+        template = connection.execute(select(models.SessionFormation).where(models.SessionFormation.sessionID==session_id).limit(1)).mappings().one()
+        agent = connection.execute(select(models.AgentEntreprise.id).limit(1)).scalar()
+        for _ in range(count):
+            session_formation_id = connection.execute(insert(models.SessionFormation).values(dict(template, id=None))).inserted_primary_key[0]
+            connection.execute(insert(models.SessionParticipant), {
+                "agentEntrepriseID": agent, "sessionID": session_id, "sessionFormationID": session_formation_id, "isGroupe": True, "isPerso": False,
+            })
+            connection.execute(insert(models.FichePresence), [
+                {
+                    "agentEntrepriseID": agent, "sessionformationID": session_formation_id, "formateurID": 1,
+                    "dateDebut": date(2026, 1, day), "dateFin": date(2026, 1, day), "signatureElectronique": "", "createdAt": datetime.now(),
+                }
+                for day in (5, 6)
+            ])
+
+
+def test_nested_payload(client, dataset):
+    session_id = dataset.nth("session", 0)
+    add_rows(session_id, 1)
+    session, _ = get_full(client, session_id)
+    with engine.connect() as connection:
+        participants = connection.execute(select(models.SessionParticipant).where(models.SessionParticipant.sessionID==session_id)).all()
+        formations = connection.execute(select(models.SessionFormation).where(models.SessionFormation.sessionID==session_id)).all()
+        fiches = connection.execute(select(models.FichePresence).where(models.FichePresence.sessionformationID.in_([row.id for row in formations]))).all()
+
+    assert session["id"] == session_id
+    assert sorted(participant["id"] for participant in session["participants"]) == sorted(row.id for row in participants)
+    assert sorted(formation["id"] for formation in session["formations"]) == sorted(row.id for row in formations)
+    assert sorted(fiche["id"] for formation in session["formations"] for fiche in formation["fiches_presence"]) == sorted(row.id for row in fiches)
+    for formation in session["formations"]:
+        assert formation["formation"]["id"] == formation["formationID"]
+        assert all(fiche["sessionformationID"] == formation["id"] for fiche in formation["fiches_presence"])
+    for participant in session["participants"]:
+        agent = participant["agent"]
+        assert agent["id"] == participant["agentEntrepriseID"] and agent["entreprise"]["id"] == agent["entrepriseID"]
+
+    assert client.get("/sessions/999999/full/").status_code == 404
+
+
+def test_query_count_does_not_grow(client, dataset):
+    session_id = dataset.nth("session", 0)
+    session, queries = get_full(client, session_id)
+    add_rows(session_id, 5)
+    grown, grown_queries = get_full(client, session_id)
+    assert len(grown["participants"]) == len(session["participants"]) + 5
+    assert sum(len(formation["fiches_presence"]) for formation in grown["formations"]) >= 10
+    # One query per level of the graph : 7, whatever the number of rows
+    assert grown_queries == queries == 7
@@ -0,0 +1,81 @@
+from sqlalchemy import insert, select
+from database_sys import models
+from database_sys.database import engine
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"signature" * 100
+
+
+def session_stats(client, session_id):
+    return client.get(f"/sessions/{session_id}/stats/").json()
+
+
+def assert_stats_match_rebuild(client, run_jobs):
+    incremental = client.get("/sessions/stats/").json()
+    client.post("/sessions/stats/rebuild/")
+    assert run_jobs() == 1
+    assert client.get("/sessions/stats/").json() == incremental
+
+
+def session_formation(dataset, n):
+    with engine.connect() as connection:
+        return connection.execute(select(models.SessionFormation).where(models.SessionFormation.id==dataset.nth("session_formation", n))).one()
+
+
+def test_fiche_writes_update_the_stats(client, dataset, create_fiche, run_jobs):
+    first, other = session_formation(dataset, 0), session_formation(dataset, 1)
+    assert first.sessionID != other.sessionID
+    before = session_stats(client, first.sessionID)
+
+    response = create_fiche(PNG, sessionformationID=first.id, dateDebut="2026-03-02T08:00:00", dateFin="2026-03-04T17:00:00")
+    fiche_id = response.json()["data"]["id"]
+    after = session_stats(client, first.sessionID)
+    assert after["nbreFichesPresence"] == before["nbreFichesPresence"] + 1
+    assert after["nbreJoursPresence"] == before["nbreJoursPresence"] + 3
+    assert_stats_match_rebuild(client, run_jobs)
+
+    # Moved to another session : taken out of the first one
+    other_before = session_stats(client, other.sessionID)
+    client.put(f"/fiche_presences/{fiche_id}/", data={"sessionformationID": other.id, "dateFin": "2026-03-02T17:00:00"})
+    assert session_stats(client, first.sessionID) == before
+    assert session_stats(client, other.sessionID)["nbreJoursPresence"] == other_before["nbreJoursPresence"] + 1
+    assert_stats_match_rebuild(client, run_jobs)
+
+    client.delete(f"/fiche_presences/{fiche_id}/")
+    assert session_stats(client, other.sessionID)["nbreFichesPresence"] == other_before["nbreFichesPresence"]
+    assert_stats_match_rebuild(client, run_jobs)
+
+
+def test_participant_prices_with_reductions(client, dataset, run_jobs):
+    template = session_formation(dataset, 0)
+    prices = {
+        "prixGroupe": 1000, "isReductionGroupe": True, "pourcentageGroupe": 10, "valeurReductionGroupe": 5,
+        "prixPerso": 300, "isReductionPerso": False, "pourcentagePerso": 50, "valeurReductionPerso": 20,
+    }
+    with engine.begin() as connection:
+        ids = [
+            connection.execute(insert(models.SessionFormation).values(dict(template._mapping, id=None, **prices))).inserted_primary_key[0]
+            for _ in range(2)
+        ]
+    before = session_stats(client, template.sessionID)
+
+    agent = dataset.nth("agent_entreprise", 0)
+    rows = [
+        {"agentEntrepriseID": agent, "sessionID": template.sessionID, "sessionFormationID": ids[0], "isGroupe": True, "isPerso": False},
+        {"agentEntrepriseID": agent, "sessionID": template.sessionID, "sessionFormationID": ids[1], "isGroupe": False, "isPerso": True},
+    ]
+    assert client.post("/session_participants/bulk/", json=rows).json()["inserted"] == 2
+
+    after = session_stats(client, template.sessionID)
+    assert after["nbreParticipants"] == before["nbreParticipants"] + 2
+    assert after["nbreParticipantsGroupe"] == before["nbreParticipantsGroupe"] + 1
+    # 1000 - 10 % - 5, then 300 without reduction
+    assert after["chiffreAffaires"] == before["chiffreAffaires"] + 895 + 300
+    assert_stats_match_rebuild(client, run_jobs)
+
+
+def test_session_without_stats(client, dataset):
+    with engine.begin() as connection:
+        connection.execute(models.SessionStats.__table__.delete())
+    stats = session_stats(client, dataset.nth("session", 0))
+    assert stats["nbreParticipants"] == stats["chiffreAffaires"] == 0
+    assert client.get("/sessions/999999/stats/").status_code == 404
@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import io
+import os
+import pytest
+from fastapi import HTTPException, UploadFile
+from settings import config
+
+# Optional dependencies of the "s3" backend (requirements-dev.txt)
+moto = pytest.importorskip("moto")
+import moto.s3.models
+from utils import media, storage as storage_module
+from utils.storage import S3Storage, iter_upload, stored_path
+
+PART_SIZE = 1024
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    # In memory bucket, parts of 1 KB instead of the 5 MB of S3
+    monkeypatch.setattr(moto.s3.models, "S3_UPLOAD_PART_MIN_SIZE", 256)
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    with moto.mock_aws():
+        backend = S3Storage(dict(config.MEDIA_S3, ENDPOINT_URL=None, ACCESS_KEY="test", SECRET_KEY="test", PART_SIZE=PART_SIZE))
+        backend.client.create_bucket(Bucket=backend.bucket)
+        yield backend
+
+
+def keys(s3, prefix=""):
+    return sorted(item["Key"] for item in s3.client.list_objects_v2(Bucket=s3.bucket, Prefix=prefix).get("Contents", []))
+
+
+def upload_file(content, filename="photo.PNG"):
+    return UploadFile(io.BytesIO(content), filename=filename, size=len(content))
+
+
+def test_write_read_exists_delete(s3):
+    s3.write("store/ab/cd/abcd.png", b"image")
+    s3.write("exports/historique.csv", b"id\n")
+    assert s3.read("store/ab/cd/abcd.png") == b"image"
+    assert s3.exists("store/ab/cd/abcd.png") and not s3.exists("store/ab/cd/autre.png")
+    assert s3.client.head_object(Bucket=s3.bucket, Key="store/ab/cd/abcd.png")["ContentType"] == "image/png"
+    assert s3.mtime("store/ab/cd/abcd.png") > 0 and s3.mtime("inconnu") is None
+    with pytest.raises(FileNotFoundError):
+        s3.read("inconnu")
+
+    # "store" is not a prefix of "storefront"
+    s3.write("storefront/x", b"x")
+    assert [relative_path for relative_path, _, _ in s3.iter_files("store")] == ["store/ab/cd/abcd.png"]
+    assert len(list(s3.iter_files(""))) == 3
+
+    assert s3.delete("store/ab/cd/abcd.png") == 5
+    assert s3.delete("store/ab/cd/abcd.png") == 0
+    assert s3.delete_prefix("exports") == 3
+    assert keys(s3) == ["storefront/x"]
+
+
+def test_copy_and_move(s3, tmp_path):
+    local_path = tmp_path / "export.csv"
+    local_path.write_bytes(b"a,b\n")
+    s3.write_file("exports/export.csv", str(local_path))
+    assert not local_path.exists() and s3.read("exports/export.csv") == b"a,b\n"
+
+    s3.move("exports/export.csv", "quarantine/20260101_000000/exports/export.csv")
+    assert keys(s3) == ["quarantine/20260101_000000/exports/export.csv"]
+    head = s3.client.head_object(Bucket=s3.bucket, Key="quarantine/20260101_000000/exports/export.csv")
+    assert head["ContentType"] == "text/csv"
+
+
+def test_multipart_upload_and_dedup(s3, monkeypatch):
+    content = os.urandom(PART_SIZE * 2 + 100)
+    parts = []
+    upload_part = s3._upload_part
+    async def counted(key, upload_id, number, data):
+        parts.append(len(data))
+        return await upload_part(key, upload_id, number, data)
+    monkeypatch.setattr(s3, "_upload_part", counted)
+    # Read by chunks of 256 bytes : a part is sent as soon as PART_SIZE bytes are buffered
+    monkeypatch.setattr(storage_module, "iter_upload", lambda upload: iter_upload(upload, chunk_size=256))
+
+    relative_path, digest, size = asyncio.run(s3.save_upload(upload_file(content)))
+    assert (digest, size) == (hashlib.sha256(content).hexdigest(), len(content))
+    assert relative_path == stored_path(digest, ".png")
+    assert parts == [PART_SIZE, PART_SIZE, 100]
+    assert s3.read(relative_path) == content and keys(s3) == [relative_path]
+
+    # Same content : copied onto itself (refreshes LastModified), the temporary key is removed
+    copies = []
+    copy = s3._copy
+    monkeypatch.setattr(s3, "_copy", lambda source, target: copies.append(source) or copy(source, target))
+    assert asyncio.run(s3.save_upload(upload_file(content)))[0] == relative_path
+    assert copies == [relative_path] and keys(s3) == [relative_path]
+
+    # Empty file : one empty part
+    relative_path, _, size = asyncio.run(s3.save_upload(upload_file(b"", "vide.txt")))
+    assert size == 0 and s3.read(relative_path) == b""
+
+
+def test_upload_too_large(s3, monkeypatch):
+    async def read_all(upload, **options):
+        return [chunk async for chunk in iter_upload(upload, **options)]
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(read_all(upload_file(b"x" * 100), max_size=99))
+    assert error.value.status_code == 413
+    # Size unknown (no Content-Length) : stopped while reading
+    upload = upload_file(b"x" * 100)
+    upload.size = None
+    with pytest.raises(HTTPException):
+        asyncio.run(read_all(upload, max_size=99, chunk_size=10))
+
+    # The multipart upload is aborted, nothing is left in the bucket
+    monkeypatch.setattr(storage_module, "iter_upload", lambda upload: iter_upload(upload, max_size=PART_SIZE + 10, chunk_size=100))
+    with pytest.raises(HTTPException):
+        asyncio.run(s3.save_upload(upload_file(b"x" * PART_SIZE * 2, "gros.bin")))
+    assert keys(s3) == []
+    assert s3.client.list_multipart_uploads(Bucket=s3.bucket).get("Uploads", []) == []
+
+
+def test_medias_redirect_to_a_presigned_url(client, s3, monkeypatch):
+    s3.write("store/ab/cd/abcd.png", b"image")
+    monkeypatch.setattr(media, "storage", s3)
+    response = client.get("/medias/store/ab/cd/abcd.png", follow_redirects=False)
+    assert response.status_code == 307
+    location = response.headers["location"]
+    assert f"/{s3.bucket}/store/ab/cd/abcd.png?" in location and "X-Amz-Signature=" in location
+    assert response.headers["cache-control"] == f"private, max-age={s3.expiry // 2}"
+    # The private directories are not signed
+    assert client.get("/medias/tmp/upload", follow_redirects=False).status_code == 404
@@ -0,0 +1,47 @@
+import asyncio
+import io
+import os
+import pytest
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import func, select
+from database_sys import models
+from database_sys.database import engine
+from settings import config
+from utils import storage as storage_module
+from utils.storage import FileSystemStorage
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"signature" * 100
+
+
+def tmp_files():
+    tmp_dir = os.path.join(config.MEDIA_ROOT, config.MEDIA_TMP)
+    return os.listdir(tmp_dir) if os.path.isdir(tmp_dir) else []
+
+
+def count(model):
+    with engine.connect() as connection:
+        return connection.scalar(select(func.count()).select_from(model))
+
+
+def test_upload_over_the_cap(client, create_fiche, monkeypatch):
+    monkeypatch.setattr(storage_module, "MAX_UPLOAD_SIZE", len(PNG) - 1)
+    fiches = count(models.FichePresence)
+    response = create_fiche(PNG)
+    assert response.status_code == 413
+    assert tmp_files() == []
+    assert count(models.Media) == 0 and count(models.FichePresence) == fiches
+
+
+def test_size_unknown_stops_while_reading(client, monkeypatch):
+    # No Content-Length : the cap is checked on the bytes read, the temporary file is removed
+    monkeypatch.setattr(storage_module, "MAX_UPLOAD_SIZE", 1000)
+    upload = UploadFile(io.BytesIO(b"x" * 1001), filename="gros.bin")
+    assert upload.size is None
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(FileSystemStorage(config.MEDIA_ROOT).save_upload(upload))
+    assert error.value.status_code == 413
+    assert tmp_files() == []
+
+    # At the cap : stored
+    relative_path, _, size = asyncio.run(FileSystemStorage(config.MEDIA_ROOT).save_upload(UploadFile(io.BytesIO(b"x" * 1000), filename="juste.bin")))
+    assert size == 1000 and os.path.isfile(os.path.join(config.MEDIA_ROOT, relative_path)) and tmp_files() == []
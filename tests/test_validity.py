@@ -0,0 +1,130 @@
+import json
+from datetime import date, datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import insert, select
+from database_sys import models
+from database_sys.database import engine
+from database_sys.validity import compute_date_validite
+
+NOW = datetime.now()
+
+
+def test_compute_date_validite():
+    assert compute_date_validite(date(2025, 1, 31), "jour", 30) == date(2025, 3, 2)
+    # The 31st plus one month : the last day of the shorter month
+    assert compute_date_validite(date(2025, 1, 31), "mois", 1) == date(2025, 2, 28)
+    assert compute_date_validite(date(2024, 1, 31), "mois", 1) == date(2024, 2, 29)
+    assert compute_date_validite(date(2024, 8, 31), "mois", 13) == date(2025, 9, 30)
+    assert compute_date_validite(date(2024, 2, 29), "Année", 1) == date(2025, 2, 28)
+    assert compute_date_validite(date(2024, 2, 29), "ANS", 4) == date(2028, 2, 29)
+    for type_validite, delai in (("semaine", 1), ("mois", -1)):
+        with pytest.raises(HTTPException) as error:
+            compute_date_validite(date(2025, 1, 1), type_validite, delai)
+        assert error.value.status_code == 400
+
+
+def session_row(date_fin, type_validite, delai, **values):
+    return dict({
+        "libelle": f"{type_validite} {delai}", "dateDebut": date_fin, "dateFin": date_fin,
+        "typeValidite": type_validite, "delaiValidite": delai, "dateValidite": date(2000, 1, 1),
+        "nbreMaxEtudiant": 10, "createdAt": NOW,
+    }, **values)
+
+
+def test_sql_rule_is_the_python_rule(client, run_jobs):
+    # The recompute job (one UPDATE) gives the dates of compute_date_validite
+    cases = [
+        (date_fin, type_validite, delai)
+        for date_fin in (date(2024, 1, 31), date(2024, 2, 29), date(2023, 12, 30), date(2025, 8, 31))
+        for type_validite, delai in (("jour", 0), ("jour", 45), ("mois", 1), ("mois", 13), ("annee", 1), ("Années", 2))
+    ]
+    rows = [session_row(*case) for case in cases] + [session_row(date(2024, 1, 31), "trimestre", 1)]
+    with engine.begin() as connection:
+        connection.execute(insert(models.Session), rows)
+
+    job_id = client.post("/sessions/validite/recompute/").json()["data"]["id"]
+    assert run_jobs() == 1
+    result = json.loads(client.get(f"/jobs/{job_id}/").json()["result"])
+    assert result == {"updated": len(cases), "invalid": ["trimestre"]}
+
+    with engine.connect() as connection:
+        sessions = connection.execute(select(models.Session).order_by(models.Session.id)).all()
+    assert [session.dateValidite for session in sessions[:-1]] == [compute_date_validite(*case) for case in cases]
+    assert {session.typeValidite for session in sessions} == {"jour", "mois", "annee", "trimestre"}
+    assert sessions[-1].dateValidite == date(2000, 1, 1)
+
+
+def test_created_session_gets_its_date(client):
+    data = {
+        "libelle": "Habilitation", "dateDebut": "2024-01-29", "dateFin": "2024-01-31",
+        "session_status": 1, "typeValidite": "Mois", "delaiValidite": 1, "nbreMaxEtudiant": 10,
+    }
+    session = client.post("/sessions/", data=dict(data, dateValidite="2030-01-01")).json()["data"]
+    assert (session["typeValidite"], session["dateValidite"]) == ("mois", "2024-02-29")
+    assert client.post("/sessions/", data=dict(data, typeValidite="semaine")).status_code == 400
+
+
+@pytest.fixture
+def certificates(client):
+    # Agent 1 took the formation twice (renewed), agent 2 once : expired yesterday.
+    # Agent 3 : another entreprise
+    today = date.today()
+    with engine.begin() as connection:
+        connection.execute(insert(models.Entreprise), [
+            {"id": 1, "libelle": "Acme", "reference": "AC", "nom_responsable": "responsable", "createdAt": NOW},
+            {"id": 2, "libelle": "Globex", "reference": "GL", "nom_responsable": "responsable", "createdAt": NOW},
+        ])
+        connection.execute(insert(models.AgentEntreprise), [
+            {"id": agent_id, "entrepriseID": entreprise_id, "nom": f"Nom {agent_id}", "prenom": "Prénom", "telephone": f"0{agent_id}", "createdAt": NOW}
+            for agent_id, entreprise_id in ((1, 1), (2, 1), (3, 2))
+        ])
+        connection.execute(insert(models.Formation), {"id": 1, "libelle": "Habilitation électrique", "formateurID": 1, "createdAt": NOW})
+        connection.execute(insert(models.Session), [
+            session_row(today, "jour", 0, id=1, libelle="Ancienne", dateValidite=today - timedelta(days=1)),
+            session_row(today, "jour", 0, id=2, libelle="Nouvelle", dateValidite=today + timedelta(days=10)),
+        ])
+        participants = [(1, 1, 1), (2, 1, 2), (3, 2, 1), (4, 1, 3)]  # (id, session, agent)
+        connection.execute(insert(models.SessionFormation), [
+            {
+                "id": participant_id, "sessionID": session_id, "formationID": 1, "createdAt": NOW,
+                "isGroupe": True, "prixGroupe": 100, "isPerso": False, "prixPerso": 0,
+                "isReductionGroupe": False, "pourcentageGroupe": 0, "valeurReductionGroupe": 0,
+                "isReductionPerso": False, "pourcentagePerso": 0, "valeurReductionPerso": 0,
+            }
+            for participant_id, session_id, _ in participants
+        ])
+        connection.execute(insert(models.SessionParticipant), [
+            {"id": participant_id, "agentEntrepriseID": agent_id, "sessionID": session_id, "sessionFormationID": participant_id, "isGroupe": True, "isPerso": False}
+            for participant_id, session_id, agent_id in participants
+        ])
+
+
+def test_expired_certificates_of_an_entreprise(client, certificates):
+    rows = client.get("/entreprises/1/certificats/expires/").json()
+    # Agent 1 renewed it : only agent 2
+    assert [(row["agentEntrepriseID"], row["sessionID"], row["joursRestants"]) for row in rows] == [(2, 1, -1)]
+    assert client.get("/entreprises/2/certificats/expires/").json()[0]["agentEntrepriseID"] == 3
+    assert client.get("/entreprises/99/certificats/expires/").status_code == 404
+
+
+def test_expirations_window_and_pages(client, certificates):
+    assert client.get("/certificats/expirations/?days=5").json() == []
+    rows = client.get("/certificats/expirations/?days=30").json()
+    assert [(row["agentEntrepriseID"], row["joursRestants"], row["formation"]) for row in rows] == [(1, 10, "Habilitation électrique")]
+
+    # Agent 3 renews in session 2 : two rows on the same dateValidite, one per page
+    with engine.begin() as connection:
+        template = connection.execute(select(models.SessionFormation).where(models.SessionFormation.id==3)).one()
+        connection.execute(insert(models.SessionFormation), dict(template._mapping, id=5))
+        connection.execute(insert(models.SessionParticipant), {"id": 5, "agentEntrepriseID": 3, "sessionID": 2, "sessionFormationID": 5, "isGroupe": True, "isPerso": False})
+    pages, params = [], {"days": 30, "limit": 1, "with_total": "true"}
+    while True:
+        response = client.get("/certificats/expirations/", params=params)
+        pages += [row["participantID"] for row in response.json()]
+        if "x-next-cursor" not in response.headers:
+            break
+        params["after"] = response.headers["x-next-cursor"]
+    assert pages == [3, 5] and response.headers["x-total-count"] == "2"
+    assert client.get("/entreprises/2/certificats/expires/").json() == []
+    assert client.get("/certificats/expirations/?after=pas-un-curseur").status_code == 400
@@ -0,0 +1,140 @@
+import asyncio
+import json
+from datetime import datetime
+from fastapi import Request, Response
+from sqlalchemy import insert
+from database_sys import models
+from database_sys.database import AsyncSessionLocal
+from settings.config import AUDIT_FLUSH_INTERVAL, AUDIT_BATCH_SIZE, AUDIT_MAX_BUFFER, AUDIT_DEFAULT_USER_ID
+
+# Audit trail of the writes, stored in the "historique" table.
+# The entries are kept in memory and inserted by batches (one executemany) by a
+# background task, every AUDIT_FLUSH_INTERVAL seconds or as soon as
+# AUDIT_BATCH_SIZE entries are waiting : a write only appends to a list.
+# The entries of the last interval are lost if the process is killed.
+
+OPERATIONS = {"POST": "creation", "PUT": "modification", "PATCH": "modification", "DELETE": "suppression"}
+
+# Not audited : the manual entries of POST /historiques/ are already in the table
+EXCLUDED_PREFIXES = ("/historiques/", "/history/")
+
+
+class AuditLog:
+    def __init__(self, flush_interval=AUDIT_FLUSH_INTERVAL, batch_size=AUDIT_BATCH_SIZE, max_buffer=AUDIT_MAX_BUFFER):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self.buffer = []
+        # Created by start() : an asyncio.Event belongs to the loop that runs it
+        self._wakeup = None
+        self._task = None
+        self._stopping = False
+
+    def record(self, user_id: int, type_operation: str, description: str):
+        self.buffer.append({
+            "userID": user_id,
+            "typeOperation": type_operation,
+            "description": description,
+            "createAt": datetime.now(),
+        })
+        if len(self.buffer) > self.max_buffer:
+            # The database is not reachable for a while : keep the most recent entries
+            dropped = len(self.buffer) - self.max_buffer
+            del self.buffer[:dropped]
+            print(f"audit : {dropped} entrées perdues (tampon plein)")
+        if len(self.buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self):
+        # One insert for the whole buffer, the entries go back in the buffer on error
+        rows, self.buffer = self.buffer, []
+        if not rows:
+            return 0
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(models.Historique), rows)
+                await db.commit()
+        except Exception as e:
+            print(e)
+            self.buffer[:0] = rows
+            return 0
+        return len(rows)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Writes what is left, called at shutdown before the engine is disposed
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._wakeup = None
+        await self.flush()
+
+
+audit_log = AuditLog()
+
+
+def request_user_id(request: Request):
+    # No authentication yet : the client sends its user id in X-User-ID
+    try:
+        return int(request.headers["x-user-id"])
+    except (KeyError, ValueError):
+        return AUDIT_DEFAULT_USER_ID
+
+
+def describe(request: Request, status_code: int, created_id=None):
+    # "formations formation_id=3 (PUT /formations/{formation_id}/, 200)" : the
+    # resource is the first fixed part of the route template, the row its path parameters.
+    # A create : "tags id=4 (POST /tags/, 200)", the id of the new row
+    route = request.scope.get("route")
+    if route is None:
+        return f"{request.method} {request.url.path} ({status_code})"
+    resource = next((part for part in route.path.split("/") if part and not part.startswith("{")), "/")
+    row = [f"{name}={value}" for name, value in request.path_params.items()]
+    if created_id is not None:
+        row.append(f"id={created_id}")
+    return f"{resource}{' ' + ' '.join(row) if row else ''} ({request.method} {route.path}, {status_code})"
+
+
+def _created_id(body: bytes):
+    # The handlers answer the new row ({"id": ..}) or {"data": {"id": ..}}.
+    # None for the other answers (bulk imports, exports)
+    try:
+        content = json.loads(body)
+    except ValueError:
+        return None
+    if isinstance(content, dict) and isinstance(content.get("data"), dict):
+        content = content["data"]
+    return content.get("id") if isinstance(content, dict) else None
+
+
+async def audit_middleware(request: Request, call_next):
+    response = await call_next(request)
+    type_operation = OPERATIONS.get(request.method)
+    if not type_operation or response.status_code >= 400 or request.url.path.startswith(EXCLUDED_PREFIXES):
+        return response
+    created_id = None
+    if request.method == "POST" and response.headers.get("content-type", "").startswith("application/json"):
+        # The JSON answer of a create is a single row : read to find its id, then sent as is
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        created_id = _created_id(body)
+        answer = Response(body, status_code=response.status_code, background=response.background)
+        answer.raw_headers = response.raw_headers
+        response = answer
+    audit_log.record(request_user_id(request), type_operation, describe(request, response.status_code, created_id))
+    return response
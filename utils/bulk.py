@@ -0,0 +1,142 @@
+import csv
+import io
+from datetime import datetime
+from itertools import islice
+from fastapi import HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from database_sys.crud import add_media_references, bulk_insert, bulk_update, check_media, check_references, get_rows_by_id
+from settings.config import BULK_MAX_ROWS
+
+
+def _too_many_rows():
+    return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"{BULK_MAX_ROWS} lignes maximum par import !")
+
+
+def _read_csv(upload):
+    # Read line by line from the uploaded file, stopped at the first row past
+    # BULK_MAX_ROWS : the rest of the file is never parsed
+    text = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    try:
+        rows = list(islice(csv.DictReader(text), BULK_MAX_ROWS + 1))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Le fichier CSV doit être encodé en UTF-8 !")
+    finally:
+        # The upload is closed by starlette, not by the wrapper
+        text.detach()
+    if len(rows) > BULK_MAX_ROWS:
+        raise _too_many_rows()
+    # Empty "id" cell : a new row
+    return [{name: value for name, value in row.items() if not (name == "id" and value == "")} for row in rows]
+
+
+async def read_bulk_rows(request: Request):
+    # The rows come either as a JSON array or as a CSV file uploaded in the
+    # "file" field of a multipart form (first line = column names)
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Le fichier CSV est manquant (champ 'file') !")
+        await upload.seek(0)
+        rows = _read_csv(upload)
+    else:
+        try:
+            rows = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Le corps de la requête n'est pas un JSON valide !")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Une liste de lignes est attendue !")
+
+    if not rows:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Aucune ligne à importer !")
+    if len(rows) > BULK_MAX_ROWS:
+        raise _too_many_rows()
+    return rows
+
+
+def validate_rows(schema, rows):
+    # Validate every row, returns the valid rows as {row number: values}
+    # and the errors as a list of {"row": number, "errors": [...]}
+    valid = {}
+    errors = []
+    for index, row in enumerate(rows):
+        try:
+            valid[index] = schema.model_validate(row).model_dump()
+        except ValidationError as e:
+            errors.append({
+                "row": index,
+                "errors": [f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors()],
+            })
+    return valid, errors
+
+
+async def _check_ids(db: AsyncSession, model, valid: dict, errors: list):
+    # Rows with an "id" update that row : returns {row number: existing object},
+    # the unknown ids are moved from valid to errors
+    ids = {index: values["id"] for index, values in valid.items() if values.get("id") is not None}
+    existing = await get_rows_by_id(db, model, ids.values()) if ids else {}
+    seen = set()
+    for index, row_id in ids.items():
+        if row_id not in existing:
+            del valid[index]
+            errors.append({"row": index, "errors": [f"id: {model.__tablename__} {row_id} n'existe pas"]})
+        elif row_id in seen:
+            del valid[index]
+            errors.append({"row": index, "errors": [f"id: {row_id} est déjà modifié par une autre ligne"]})
+        seen.add(row_id)
+    errors.sort(key=lambda error: error["row"])
+    return {index: existing[row_id] for index, row_id in ids.items() if index in valid}
+
+
+async def bulk_import(db: AsyncSession, request: Request, schema, model, references: dict, partial: bool, update_stats=None, media_columns=(), **defaults):
+    # Validate the whole batch first (schema, ids, foreign keys, media urls), then
+    # write it in one transaction : one insert for the new rows, one update by
+    # primary key for the rows with an "id".
+    # partial=False : nothing is written when a row is invalid
+    # partial=True  : the valid rows are written, the others are reported
+    # update_stats(db, rows, sign) : awaited in the same transaction (session stats)
+    # media_columns : urls of uploaded files, their media.refCount follows the rows
+    # defaults : values of the new rows only (createdAt)
+    rows = await read_bulk_rows(request)
+    valid, errors = validate_rows(schema, rows)
+    existing = {}
+    if valid:
+        existing = await _check_ids(db, model, valid, errors)
+        await check_references(db, valid, references, errors)
+        await check_media(db, valid, media_columns, errors)
+        existing = {index: row for index, row in existing.items() if index in valid}
+
+    if errors and not partial:
+        return JSONResponse(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, content={"inserted": 0, "updated": 0, "errors": errors})
+
+    inserted = [dict({name: value for name, value in values.items() if name != "id"}, **defaults) for index, values in valid.items() if index not in existing]
+    updated = [values for index, values in valid.items() if index in existing]
+    if valid:
+        try:
+            if existing:
+                # The old values are taken out first (stats, media references)
+                previous = list(existing.values())
+                if update_stats is not None:
+                    await update_stats(db, previous, sign=-1)
+                for column in media_columns:
+                    await add_media_references(db, [getattr(row, column) for row in previous], sign=-1)
+                if "updatedAt" in model.__table__.c:
+                    updated = [dict(values, updatedAt=datetime.now()) for values in updated]
+                await bulk_update(db, model, updated)
+            if inserted:
+                await bulk_insert(db, model, inserted)
+            for column in media_columns:
+                await add_media_references(db, [values[column] for values in inserted + updated])
+            if update_stats is not None:
+                await update_stats(db, inserted + updated)
+            await db.commit()
+        except IntegrityError as e:
+            print(e)
+            await db.rollback()
+            return JSONResponse(status_code=status.HTTP_409_CONFLICT, content={"inserted": 0, "updated": 0, "errors": errors, "detail": "L'import viole une contrainte d'unicité, aucune ligne n'a été écrite !"})
+
+    return JSONResponse(status_code=status.HTTP_201_CREATED, content={"inserted": len(inserted), "updated": len(updated), "errors": errors})
@@ -0,0 +1,76 @@
+import hashlib
+import time
+from collections import OrderedDict
+from fastapi import Request, Response, status
+from pydantic import TypeAdapter
+from settings.config import REFERENCE_CACHE_TTL, REFERENCE_CACHE_SIZE
+
+
+class TTLCache:
+    # LRU cache with a time to live, keys are (namespace, key) tuples so that
+    # every entry of a table can be dropped at once with invalidate(namespace).
+    # It lives in the worker process : with several uvicorn workers an other
+    # worker can serve stale data for at most `ttl` seconds.
+    def __init__(self, ttl=REFERENCE_CACHE_TTL, maxsize=REFERENCE_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, namespace):
+        for key in [key for key in self.entries if key[0] == namespace]:
+            del self.entries[key]
+
+
+reference_cache = TTLCache()
+
+
+def etag_matches(if_none_match: str, etag: str):
+    # If-None-Match : "*" or a comma separated list of entity tags. The comparison is
+    # weak (W/"x" matches "x", RFC 9110) but exact : "abc" does not match "abcd"
+    if not if_none_match:
+        return False
+    tags = {tag.strip() for tag in if_none_match.split(",")}
+    if "*" in tags:
+        return True
+    tags = {tag[2:] if tag.startswith("W/") else tag for tag in tags}
+    return (etag[2:] if etag.startswith("W/") else etag) in tags
+
+
+async def cached_json_response(request: Request, namespace: str, key, loader, schema):
+    # Read-through : the loader (a coroutine function) only runs on a cache miss.
+    # schema : output type of the route (ex: List[TagOut]), the body is rendered once by pydantic-core.
+    # Returns None when the loader finds nothing, the caller answers the 404.
+    cache_key = (namespace, key)
+    entry = reference_cache.get(cache_key)
+    if entry is None:
+        data = await loader()
+        if not data:
+            return None
+        adapter = TypeAdapter(schema)
+        body = adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        entry = (body, etag)
+        reference_cache.set(cache_key, entry)
+
+    body, etag = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,90 @@
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.pdfgen import canvas
+from settings.config import MEDIA_URL, CERTIFICATE_DIR, CERTIFICATE_WORKERS, CERTIFICATE_BATCH_SIZE
+from utils.storage import storage
+
+_executor = None
+
+
+def _get_executor():
+    # Created on first use and kept for the life of the worker.
+    # "spawn" : the children do not inherit the event loop / database threads
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=CERTIFICATE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def set_executor(executor):
+    # Renders with another executor (a thread pool in the tests : the spawned
+    # children re-import settings.config and would write to the default MEDIA_ROOT).
+    # Returns the previous one, None when the pool was never created
+    global _executor
+    previous, _executor = _executor, executor
+    return previous
+
+
+def _format_date(value):
+    return value.strftime("%d/%m/%Y") if value else ""
+
+
+def certificate_relative_path(session_id, participant_id):
+    return os.path.join(CERTIFICATE_DIR, str(session_id), f"{participant_id}.pdf")
+
+
+def render_certificate(row: dict):
+    # row : one line of crud.get_certificate_rows, returns the url of the PDF
+    relative_path = certificate_relative_path(row["sessionID"], row["participantID"])
+    content = io.BytesIO()
+
+    width, height = landscape(A4)
+    pdf = canvas.Canvas(content, pagesize=(width, height))
+    pdf.setTitle(f"Certificat - {row['prenom']} {row['nom']}")
+
+    pdf.setLineWidth(3)
+    pdf.rect(30, 30, width - 60, height - 60)
+
+    pdf.setFont("Helvetica-Bold", 36)
+    pdf.drawCentredString(width / 2, height - 130, "CERTIFICAT DE FORMATION")
+
+    pdf.setFont("Helvetica", 16)
+    pdf.drawCentredString(width / 2, height - 200, "Décerné à")
+    pdf.setFont("Helvetica-Bold", 28)
+    pdf.drawCentredString(width / 2, height - 245, f"{row['prenom']} {row['nom']}")
+
+    pdf.setFont("Helvetica", 16)
+    pdf.drawCentredString(width / 2, height - 300, "pour avoir suivi la formation")
+    pdf.setFont("Helvetica-Bold", 22)
+    pdf.drawCentredString(width / 2, height - 340, row["formation"])
+
+    pdf.setFont("Helvetica", 14)
+    pdf.drawCentredString(width / 2, height - 390, f"Session : {row['session']}, du {_format_date(row['dateDebut'])} au {_format_date(row['dateFin'])}")
+    if row["dateValidite"]:
+        pdf.drawCentredString(width / 2, height - 415, f"Valable jusqu'au {_format_date(row['dateValidite'])}")
+
+    pdf.showPage()
+    pdf.save()
+    # Local disk or bucket (utils.storage)
+    storage.write(relative_path, content.getvalue())
+
+    return os.path.join(MEDIA_URL, relative_path).replace("\\", "/")
+
+
+def render_certificates(rows: list):
+    # Runs in a child process : one batch of certificates
+    return [{"participantID": row["participantID"], "url": render_certificate(row)} for row in rows]
+
+
+async def render_session_certificates(rows: list):
+    # The rows are split in batches of CERTIFICATE_BATCH_SIZE rendered in parallel
+    # by the process pool, the event loop is not blocked meanwhile.
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    batches = [rows[i:i + CERTIFICATE_BATCH_SIZE] for i in range(0, len(rows), CERTIFICATE_BATCH_SIZE)]
+    results = await asyncio.gather(*[loop.run_in_executor(executor, render_certificates, batch) for batch in batches])
+    return [certificate for batch in results for certificate in batch]
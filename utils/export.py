@@ -0,0 +1,106 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import date, datetime
+import aiofiles
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from database_sys import models
+from database_sys.database import AsyncSessionLocal
+from database_sys.partitions import adapt_clause, historique_tables
+from settings.config import EXPORT_CHUNK_SIZE, EXPORT_DIR, MEDIA_ROOT, MEDIA_TMP, MEDIA_URL
+from utils.filters import filtered_query
+from utils.storage import storage
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+async def _iter_rows(model, criteria=None):
+    # The generator opens its own session : the request session is already
+    # closed when StreamingResponse starts consuming it.
+    # yield_per keeps a server side cursor open and fetches EXPORT_CHUNK_SIZE rows
+    # at a time, the memory used does not depend on the size of the table.
+    # historique : the SQLite monthly tables too (database_sys/partitions.py)
+    async with AsyncSessionLocal() as db:
+        tables = [model.__table__]
+        if model is models.Historique:
+            tables = await historique_tables(await db.connection())
+        for table in tables:
+            query = select(table)
+            if criteria is not None:
+                query = query.where(adapt_clause(criteria, table))
+            query = query.order_by(table.c.id).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+            result = await db.stream(query)
+            async for rows in result.mappings().partitions():
+                yield rows
+
+
+async def _iter_ndjson(model, criteria=None):
+    async for rows in _iter_rows(model, criteria):
+        yield "".join(json.dumps(dict(row), default=_json_default) + "\n" for row in rows)
+
+
+async def _iter_csv(model, criteria=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.name for column in model.__table__.columns])
+    async for rows in _iter_rows(model, criteria):
+        writer.writerows(row.values() for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    # Header only when the table is empty
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _iter_export(model, export_format: str, criteria=None):
+    if export_format == "csv":
+        return _iter_csv(model, criteria)
+    return _iter_ndjson(model, criteria)
+
+
+def export_table(model, export_format: str, request: Request = None):
+    # Same filters as the list endpoint (?column=value, utils/filters.py), checked
+    # before the response starts
+    criteria = filtered_query(model, request).whereclause if request is not None else None
+    content = _iter_export(model, export_format, criteria)
+    filename = f"{model.__tablename__}.{export_format}"
+    return StreamingResponse(
+        content,
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+async def export_table_to_file(model, export_format: str):
+    # Same content as export_table, written in EXPORT_DIR of the storage backend (export jobs).
+    # Streamed to a local temporary file first, then moved / uploaded in one go
+    filename = f"{model.__tablename__}_{datetime.now():%Y%m%d_%H%M%S}.{export_format}"
+    tmp_dir = os.path.join(MEDIA_ROOT, MEDIA_TMP)
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    os.close(fd)
+
+    try:
+        async with aiofiles.open(tmp_path, "w", encoding="utf-8", newline="") as out_file:
+            async for chunk in _iter_export(model, export_format):
+                await out_file.write(chunk)
+        await storage.run(storage.write_file, os.path.join(EXPORT_DIR, filename), tmp_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return os.path.join(MEDIA_URL, EXPORT_DIR, filename).replace("\\", "/")
@@ -0,0 +1,63 @@
+from fastapi import HTTPException, Request, status
+from sqlalchemy import UniqueConstraint, select
+from database_sys import models
+
+# Columns accepted as filters (?column=value or ?column=v1,v2) and as sort keys
+# (?sort=column or ?sort=-column) on the list endpoints. Only indexed columns
+# are allowed so that every filter is an index scan, checked at import below.
+FILTER_COLUMNS = {
+    models.Formation: ("formateurID", "libelle"),
+    models.Cours: ("categorieID", "libelle"),
+    models.Session: (),
+    models.FichePresence: ("agentEntrepriseID", "sessionformationID", "formateurID"),
+    models.User: ("roleID", "username", "email", "phone"),
+    models.Historique: ("userID",),
+    models.Entreprise: ("libelle",),
+    models.Job: ("status",),
+}
+
+# Query parameters of the list endpoints that are not filters
+RESERVED_PARAMS = {"limit", "after", "with_total", "sort", "since", "until", "export_format"}
+
+
+def is_indexed(model, column_name: str):
+    # Primary key, unique column or first column of an index
+    table = model.__table__
+    leading = {index.columns.values()[0].name for index in table.indexes}
+    leading |= {constraint.columns.values()[0].name for constraint in table.constraints if isinstance(constraint, UniqueConstraint)}
+    leading |= {column.name for column in table.columns if column.primary_key or column.unique}
+    return column_name in leading
+
+
+for _model, _columns in FILTER_COLUMNS.items():
+    for _column in _columns:
+        assert is_indexed(_model, _column), f"{_model.__tablename__}.{_column} n'est pas indexée"
+
+
+def check_column(model, column_name: str, usage: str):
+    if column_name == "id" or column_name in FILTER_COLUMNS.get(model, ()):
+        return getattr(model, column_name)
+    if column_name in model.__table__.c:
+        detail = f"Le {usage} sur '{column_name}' n'est pas autorisé (colonne non indexée) !"
+    else:
+        detail = f"La colonne '{column_name}' n'existe pas !"
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+def _convert(column, value: str):
+    try:
+        return column.type.python_type(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Valeur invalide pour '{column.key}' : {value}")
+
+
+def filtered_query(model, request: Request):
+    # select(model) restricted by the filters found in the query string
+    query = select(model)
+    for name, value in request.query_params.items():
+        if name in RESERVED_PARAMS:
+            continue
+        column = check_column(model, name, "filtre")
+        values = [_convert(column, v) for v in value.split(",")]
+        query = query.where(column==values[0] if len(values) == 1 else column.in_(values))
+    return query
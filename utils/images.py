@@ -0,0 +1,118 @@
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps, UnidentifiedImageError
+from settings.config import MEDIA_STORE, MEDIA_URL, IMAGE_VARIANT_DIR, IMAGE_VARIANT_WIDTHS, IMAGE_VARIANT_QUALITY, IMAGE_WORKERS
+from utils.media import media_cache
+from utils.storage import storage
+
+# Resized copies of the formation / cours images, rendered by the "image_variants"
+# job (utils/jobs.py) in a process pool, never during the upload request.
+# The originals are content addressed (utils.manage_file), a variant is named
+# after the hash of its original :
+#   IMAGE_VARIANT_DIR / ab / cd / <sha256>-<width>.webp (and .jpg), in the storage backend
+# No variant is made at a width larger than the original.
+
+# extension -> (Pillow format, content type)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpg": ("JPEG", "image/jpeg"),
+}
+
+_executor = None
+
+
+def _get_executor():
+    # Same as utils.certificate : created on first use, "spawn" children
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def set_executor(executor):
+    # Same as utils.certificate.set_executor, returns the previous one
+    global _executor
+    previous, _executor = _executor, executor
+    return previous
+
+
+def media_path(file_url: str):
+    # "medias/store/ab/cd/<sha256>.png" -> "store/ab/cd/<sha256>.png"
+    return file_url[len(MEDIA_URL):] if file_url.startswith(MEDIA_URL) else file_url
+
+
+def variant_relative_path(relative_path: str, width: int, extension: str):
+    digest = os.path.splitext(os.path.basename(relative_path))[0]
+    return os.path.join(IMAGE_VARIANT_DIR, digest[:2], digest[2:4], f"{digest}-{width}.{extension}")
+
+
+def render_variants(relative_path: str):
+    # Runs in a child process, returns the relative paths written (the existing
+    # variants are kept : the same content uploaded twice is rendered once)
+    try:
+        with Image.open(io.BytesIO(storage.read(relative_path))) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            written = []
+            for width in IMAGE_VARIANT_WIDTHS:
+                if width >= image.width:
+                    break
+                resized = image.resize((width, max(round(image.height * width / image.width), 1)), Image.LANCZOS)
+                for extension, (image_format, _) in VARIANT_FORMATS.items():
+                    variant = variant_relative_path(relative_path, width, extension)
+                    if storage.exists(variant):
+                        continue
+                    output = resized
+                    if image_format == "JPEG" and resized.mode == "RGBA":
+                        # No transparency in JPEG : white background
+                        output = Image.new("RGB", resized.size, (255, 255, 255))
+                        output.paste(resized, mask=resized.getchannel("A"))
+                    content = io.BytesIO()
+                    output.save(content, format=image_format, quality=IMAGE_VARIANT_QUALITY)
+                    storage.write(variant, content.getvalue())
+                    written.append(variant)
+            return written
+    except (FileNotFoundError, UnidentifiedImageError) as e:
+        print(e)
+        return []
+
+
+async def render_image_variants(file_urls: list):
+    # One task per image, the event loop is not blocked meanwhile
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    urls = [file_url for file_url in dict.fromkeys(file_urls) if file_url]
+    results = await asyncio.gather(*[loop.run_in_executor(executor, render_variants, media_path(file_url)) for file_url in urls])
+    return {file_url: len(written) for file_url, written in zip(urls, results)}
+
+
+def accepts_webp(accept: str):
+    # "image/avif,image/webp,*/*" : yes, "image/webp;q=0" : no
+    for media_range in accept.split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        if media_type.lower() == "image/webp":
+            return not any(param.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000") for param in params)
+    return False
+
+
+async def pick_variant(relative_path: str, width: int, accept: str):
+    # Smallest variant at least `width` pixels wide, WebP when the client takes it.
+    # None : no such variant (wider than the original or not rendered yet)
+    extension = "webp" if accepts_webp(accept) else "jpg"
+    for variant_width in IMAGE_VARIANT_WIDTHS:
+        if variant_width < width:
+            continue
+        variant = variant_relative_path(relative_path, variant_width, extension)
+        if variant in media_cache or await storage.run(storage.exists, variant):
+            return variant
+        return None
+    return None
+
+
+def is_stored_image(relative_path: str):
+    # Only the uploads have variants (not the certificates, exports...)
+    return relative_path.split(os.sep)[0] == MEDIA_STORE
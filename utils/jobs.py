@@ -0,0 +1,137 @@
+import asyncio
+import json
+import time
+import traceback
+from database_sys import models
+from database_sys.crud import claim_job, finish_job, get_certificate_rows, get_image_urls, heartbeat_job, rebuild_session_stats, requeue_stale_jobs
+from database_sys.database import AsyncSessionLocal, async_engine
+from database_sys.partitions import archive_historique, ensure_historique_partitions
+from database_sys.validity import recompute_dates_validite
+from settings.config import HISTORIQUE_PARTITIONS_INTERVAL, JOB_HEARTBEAT_INTERVAL, JOB_POLL_INTERVAL, JOB_TIMEOUT, JOB_MAX_ATTEMPTS
+from utils.certificate import render_session_certificates
+from utils.export import export_table_to_file
+from utils.images import render_image_variants
+from utils.media_gc import collect_media
+
+# typeJob -> coroutine function(payload) returning a JSON serializable result
+JOB_HANDLERS = {}
+
+EXPORTABLE_TABLES = {
+    "historique": models.Historique,
+    "fiche_presence": models.FichePresence,
+}
+
+
+def job_handler(job_type: str):
+    def register(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return register
+
+
+@job_handler("certificats")
+async def run_certificates_job(payload: dict):
+    async with AsyncSessionLocal() as db:
+        rows = await get_certificate_rows(db, payload["sessionID"])
+    return await render_session_certificates(rows)
+
+
+@job_handler("export")
+async def run_export_job(payload: dict):
+    url = await export_table_to_file(EXPORTABLE_TABLES[payload["table"]], payload["format"])
+    return {"url": url}
+
+
+@job_handler("archive_historique")
+async def run_archive_historique_job(payload: dict):
+    return await archive_historique()
+
+
+@job_handler("image_variants")
+async def run_image_variants_job(payload: dict):
+    # payload["urls"] : the uploaded images, missing : every formation / cours image
+    file_urls = payload.get("urls")
+    if file_urls is None:
+        async with AsyncSessionLocal() as db:
+            file_urls = await get_image_urls(db)
+    return await render_image_variants(file_urls)
+
+
+@job_handler("media_gc")
+async def run_media_gc_job(payload: dict):
+    return await collect_media(**payload)
+
+
+@job_handler("session_stats")
+async def run_session_stats_job(payload: dict):
+    async with AsyncSessionLocal() as db:
+        return {"sessions": await rebuild_session_stats(db)}
+
+
+@job_handler("session_validite")
+async def run_session_validite_job(payload: dict):
+    # payload["sessionIDs"] : the sessions to recompute, missing : every session
+    async with AsyncSessionLocal() as db:
+        return await recompute_dates_validite(db, payload.get("sessionIDs"))
+
+
+async def heartbeat(db_job):
+    # Refreshes startedAt while the handler runs : requeue_stale_jobs only takes
+    # the jobs of a worker that stopped, not the long ones
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        try:
+            async with AsyncSessionLocal() as db:
+                if not await heartbeat_job(db, db_job):
+                    return
+        except Exception:
+            traceback.print_exc()
+
+
+async def run_next_job():
+    # Runs one job, returns False when the queue is empty. The claim session is
+    # closed before the handler runs : no connection held for the whole job
+    async with AsyncSessionLocal() as db:
+        db_job = await claim_job(db)
+    if db_job is None:
+        return False
+
+    print(f"job {db_job.id} ({db_job.typeJob}) started")
+    beating = asyncio.create_task(heartbeat(db_job))
+    try:
+        handler = JOB_HANDLERS[db_job.typeJob]
+        outcome = {"result": await handler(json.loads(db_job.payload))}
+    except Exception as e:
+        traceback.print_exc()
+        outcome = {"error": repr(e)}
+    finally:
+        beating.cancel()
+
+    async with AsyncSessionLocal() as db:
+        if not await finish_job(db, db_job, **outcome):
+            print(f"job {db_job.id} was requeued meanwhile, result dropped")
+        elif "result" in outcome:
+            print(f"job {db_job.id} done")
+    return True
+
+
+async def run_worker():
+    print("worker started")
+    partitions_checked = None
+    try:
+        while True:
+            # The monthly partitions of historique do not wait for a restart or an archive job
+            if partitions_checked is None or time.monotonic() - partitions_checked >= HISTORIQUE_PARTITIONS_INTERVAL:
+                try:
+                    await ensure_historique_partitions()
+                except Exception:
+                    traceback.print_exc()
+                partitions_checked = time.monotonic()
+            async with AsyncSessionLocal() as db:
+                await requeue_stale_jobs(db, JOB_TIMEOUT, JOB_MAX_ATTEMPTS)
+            # Empty the queue before sleeping
+            while await run_next_job():
+                pass
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+    finally:
+        await async_engine.dispose()
@@ -1,57 +1,31 @@
 import os
-import random
-import aiofiles
-from fastapi import UploadFile
+from fastapi import HTTPException, UploadFile
 from settings.config import *
+from utils.storage import storage
 
-async def save_upload_file(upload_file: UploadFile, upload_to: str):
-    try:
-        # Create a unique filename
-        filename = upload_file.filename
-        # print(filename)
-        file_path = os.path.join(MEDIA_ROOT, upload_to, filename)
-        base_path = os.path.join(MEDIA_ROOT, upload_to)
-        # print("file_path before while loop", file_path)
-        # print("file_path before while loop exist", os.path.exists(file_path))
-        # Check if the file already exists
-        while os.path.exists(file_path):
-            # Generate a random 7-digit number
-            random_number = random.randint(1000000, 9999999)
-            # Append the random number to the filename
-            file_path = os.path.join(MEDIA_ROOT, upload_to, f"{random_number}_{filename}")
-            # print("file_path in while loop", file_path)
-        
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        print("after check the dir")
-        
-        # Save the file
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            content = await upload_file.read()  # read the file
-            print("out_file", out_file)
-            # print("content", content)
-            await out_file.write(content)  # write the file
 
-        file_url = os.path.join(MEDIA_URL, upload_to, os.path.basename(file_path)).replace("\\", "/")
+async def save_upload_file(upload_file: UploadFile):
+    # The file is stored under the sha256 of its content : uploading the same
+    # image twice reuses the existing file instead of writing a copy.
+    # Written by the storage backend of MEDIA_STORAGE (utils.storage).
+    # Returns (file_url, sha256, size), file_url is "" when the file could not be saved
+    try:
+        relative_path, digest, size = await storage.save_upload(upload_file)
+        file_url = os.path.join(MEDIA_URL, relative_path).replace("\\", "/")
 
-        return file_url
+        return file_url, digest, size
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(e)
-        return ""
+        return "", None, 0
 
 
-# async 
 def delete_file(file_path):
-    base_path = BASE_DIR
-    list_path = str(file_path).split('/')
-    
-    # try:
-    #     async with aiofiles.open(file_path, 'wb') as file:
-    #         content = ""
-    #         await content 
-    # except Exception as e:
-    #     print(e)
-    #     return e
-    
-delete_file(file_path="medias/formations/ebook-bg.png")
\ No newline at end of file
+    # file_path : url ("medias/...") or path relative to MEDIA_ROOT.
+    # Returns the number of bytes freed, 0 when the file does not exist
+    relative_path = str(file_path)
+    if relative_path.startswith(MEDIA_URL):
+        relative_path = relative_path[len(MEDIA_URL):]
+    return storage.delete(relative_path)
@@ -0,0 +1,175 @@
+import mimetypes
+import os
+from collections import OrderedDict, namedtuple
+from stat import S_ISREG
+import aiofiles
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import RedirectResponse, StreamingResponse
+from settings.config import (
+    MEDIA_ROOT, MEDIA_STORE, MEDIA_TMP, MEDIA_QUARANTINE, IMAGE_VARIANT_DIR, UPLOAD_CHUNK_SIZE,
+    MEDIA_CACHE_SIZE, MEDIA_CACHE_MAX_FILE_SIZE, MEDIA_CACHE_MAX_AGE,
+)
+from utils.cache import etag_matches
+from utils.storage import storage
+
+# Serving of the files of MEDIA_ROOT (GET / HEAD /medias/...), in place of StaticFiles.
+#   - content addressed files (MEDIA_STORE, IMAGE_VARIANT_DIR) : the file name is the
+#     sha256 of the content, it is the ETag and the URL never changes of content :
+#     "Cache-Control: immutable", the browsers do not even revalidate
+#   - other files (certificates, exports) : rewritten in place, ETag from the
+#     modification time and size, revalidated on every use (If-None-Match -> 304)
+#   - Range requests (one range) for the large files : video, exports
+#   - the small content addressed files are kept in memory (LRU, MEDIA_CACHE_SIZE
+#     bytes per worker) : a hot image is served without touching the disk
+# With the "s3" storage backend (utils.storage) the response is a redirect to a
+# presigned URL of the bucket, which handles the ETag, Range and caching itself.
+
+HASHED_DIRS = (MEDIA_STORE, IMAGE_VARIANT_DIR)
+# Never served : uploads in progress, files removed by the media GC
+PRIVATE_DIRS = (MEDIA_TMP, MEDIA_QUARANTINE)
+
+MediaFile = namedtuple("MediaFile", ["etag", "media_type", "size", "immutable", "content"])
+
+
+class MediaCache:
+    # LRU bounded by the total size of the contents
+    def __init__(self, maxbytes=MEDIA_CACHE_SIZE, max_file_size=MEDIA_CACHE_MAX_FILE_SIZE):
+        self.maxbytes = maxbytes
+        self.max_file_size = max_file_size
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def __contains__(self, relative_path):
+        return relative_path in self.entries
+
+    def get(self, relative_path):
+        entry = self.entries.get(relative_path)
+        if entry is not None:
+            self.entries.move_to_end(relative_path)
+        return entry
+
+    def set(self, relative_path, entry: MediaFile):
+        if entry.size > self.max_file_size:
+            return
+        self.discard(relative_path)
+        self.entries[relative_path] = entry
+        self.size += entry.size
+        while self.size > self.maxbytes:
+            _, removed = self.entries.popitem(last=False)
+            self.size -= removed.size
+
+    def discard(self, relative_path):
+        # To call when a file is deleted
+        entry = self.entries.pop(relative_path, None)
+        if entry is not None:
+            self.size -= entry.size
+
+
+media_cache = MediaCache()
+
+
+def safe_media_path(file_path: str):
+    # URL path -> path relative to MEDIA_ROOT, None outside of it or in PRIVATE_DIRS
+    relative_path = os.path.normpath(file_path)
+    if relative_path.startswith(("..", os.sep)) or relative_path == "." or relative_path.split(os.sep)[0] in PRIVATE_DIRS:
+        return None
+    return relative_path
+
+
+def _media_file(relative_path: str, file_stat):
+    immutable = relative_path.split(os.sep)[0] in HASHED_DIRS
+    if immutable:
+        # File name : sha256 of the original (+ width for the variants) and extension
+        etag = '"%s"' % os.path.basename(relative_path)
+    else:
+        etag = '"%x-%x"' % (file_stat.st_mtime_ns, file_stat.st_size)
+    media_type = mimetypes.guess_type(relative_path)[0] or "application/octet-stream"
+    return MediaFile(etag, media_type, file_stat.st_size, immutable, None)
+
+
+def _parse_range(header: str, size: int):
+    # "bytes=0-99", "bytes=100-", "bytes=-100" -> (start, end) inclusive.
+    # None : no range or several ranges (the whole file is sent)
+    unit, _, ranges = header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+    start, _, end = ranges.strip().partition("-")
+    try:
+        if not start:
+            length = int(end)
+            if length <= 0:
+                raise ValueError
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Plage demandée invalide !",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+async def _read_file(file_path, start: int, end: int):
+    async with aiofiles.open(file_path, "rb") as media_file:
+        await media_file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await media_file.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def media_response(request: Request, relative_path: str, headers: dict = None):
+    # relative_path : checked by safe_media_path
+    if storage.presigned:
+        headers = dict(headers or {})
+        # The redirect itself can be cached, less long than the signature is valid
+        headers.setdefault("Cache-Control", f"private, max-age={storage.expiry // 2}")
+        url = await storage.run(storage.presigned_url, relative_path)
+        return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT, headers=headers)
+
+    entry = media_cache.get(relative_path)
+    file_path = os.path.join(MEDIA_ROOT, relative_path)
+    if entry is None:
+        try:
+            file_stat = os.stat(file_path)
+        except (FileNotFoundError, NotADirectoryError):
+            file_stat = None
+        if file_stat is None or not S_ISREG(file_stat.st_mode):
+            raise HTTPException(status_code=404, detail="Le fichier n'existe pas !")
+        entry = _media_file(relative_path, file_stat)
+        if entry.immutable and entry.size <= media_cache.max_file_size:
+            async with aiofiles.open(file_path, "rb") as media_file:
+                entry = entry._replace(content=await media_file.read())
+            media_cache.set(relative_path, entry)
+
+    headers = dict(headers or {})
+    headers["ETag"] = entry.etag
+    headers["Accept-Ranges"] = "bytes"
+    headers.setdefault("Cache-Control", f"public, max-age={MEDIA_CACHE_MAX_AGE}, immutable" if entry.immutable else "no-cache")
+
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    start, end = 0, entry.size - 1
+    status_code = status.HTTP_200_OK
+    range_header = request.headers.get("range")
+    if range_header and entry.size and request.headers.get("if-range", entry.etag) == entry.etag:
+        byte_range = _parse_range(range_header, entry.size)
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = status.HTTP_206_PARTIAL_CONTENT
+            headers["Content-Range"] = f"bytes {start}-{end}/{entry.size}"
+
+    headers["Content-Length"] = str(max(end - start + 1, 0))
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=entry.media_type)
+    if entry.content is not None:
+        return Response(content=entry.content[start:end + 1], status_code=status_code, headers=headers, media_type=entry.media_type)
+    return StreamingResponse(_read_file(file_path, start, end), status_code=status_code, headers=headers, media_type=entry.media_type)
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from database_sys.crud import delete_media_rows, fix_media_ref_counts, get_media_ref_counts, get_referenced_media
+from database_sys.database import AsyncSessionLocal
+from settings.config import (
+    MEDIA_URL, MEDIA_STORE, MEDIA_TMP, IMAGE_VARIANT_DIR, EXPORT_DIR, CERTIFICATE_DIR,
+    MEDIA_QUARANTINE, MEDIA_GC_MODE, MEDIA_GC_GRACE_PERIOD, MEDIA_GC_QUARANTINE_DAYS,
+)
+from utils.images import media_path
+from utils.manage_file import delete_file
+from utils.storage import storage
+
+# Orphan files collector ("media_gc" job, utils/jobs.py), one pass over MEDIA_ROOT.
+# A stored upload is an orphan when no imageUrl / signatureElectronique points
+# to it anymore (replaced or deleted rows) and its media.refCount is 0, a variant
+# when its original is not referenced, a tmp file when it is left by an interrupted
+# upload, any other file (uploads of the first versions, MEDIA_ROOT/formations/...)
+# when no row points to it. A refCount that does not match the rows is corrected
+# and its file kept until the next run (refcount_fixed).
+# The exports, certificates and the quarantine are not collected.
+# The files younger than MEDIA_GC_GRACE_PERIOD are kept : save_media writes the
+# file before the row is committed.
+#   mode "quarantine" : moved to MEDIA_QUARANTINE / <date of the run>,
+#                       removed MEDIA_GC_QUARANTINE_DAYS days later
+#   mode "delete"     : removed at once
+# The files are listed / moved through the storage backend (utils.storage), local
+# disk or bucket. reclaimed_bytes : size of the orphans removed (moved in quarantine
+# or deleted). The API workers may still serve a removed file from their memory cache (utils.media).
+
+
+def _digest(relative_path: str):
+    # "store/ab/cd/<sha256>.png" and "variants/ab/cd/<sha256>-320.webp" -> <sha256>
+    return os.path.splitext(os.path.basename(relative_path))[0].split("-")[0]
+
+
+# Files written by the jobs (no row points to them) or already collected
+SKIPPED_DIRS = (EXPORT_DIR, CERTIFICATE_DIR, MEDIA_QUARANTINE)
+
+
+def find_orphans(referenced: set, ref_counts: dict, now: float):
+    # referenced : relative paths found in the rows, ref_counts : {relative path: refCount}
+    referenced_digests = {_digest(relative_path) for relative_path in referenced if relative_path.startswith(MEDIA_STORE + os.sep)}
+    limit = now - MEDIA_GC_GRACE_PERIOD
+    orphans = []
+    scanned = 0
+    for relative_path, size, mtime in storage.iter_files(""):
+        parts = relative_path.split(os.sep)
+        directory = parts[0] if len(parts) > 1 else ""
+        if directory in SKIPPED_DIRS:
+            continue
+        scanned += 1
+        if mtime >= limit:
+            continue
+        if directory == MEDIA_STORE:
+            is_orphan = relative_path not in referenced and not ref_counts.get(relative_path)
+        elif directory == IMAGE_VARIANT_DIR:
+            is_orphan = _digest(relative_path) not in referenced_digests
+        elif directory == MEDIA_TMP:
+            is_orphan = True
+        else:
+            is_orphan = relative_path not in referenced
+        if is_orphan:
+            orphans.append((relative_path, size))
+    return scanned, orphans
+
+
+BATCH_FORMAT = "%Y%m%d_%H%M%S"
+
+
+def _purge_quarantine(now: float):
+    # Quarantine batches (named after the date of their run) older than MEDIA_GC_QUARANTINE_DAYS
+    batches = {relative_path.split(os.sep)[1] for relative_path, _, _ in storage.iter_files(MEDIA_QUARANTINE)}
+    purged = 0
+    for batch in batches:
+        try:
+            created = datetime.strptime(batch, BATCH_FORMAT).timestamp()
+        except ValueError:
+            continue
+        if created < now - MEDIA_GC_QUARANTINE_DAYS * 86400:
+            purged += storage.delete_prefix(os.path.join(MEDIA_QUARANTINE, batch))
+    return purged
+
+
+def remove_orphans(orphans: list, mode: str, now: float):
+    # Returns (bytes reclaimed, relative paths removed)
+    batch = datetime.fromtimestamp(now).strftime(BATCH_FORMAT)
+    reclaimed = 0
+    removed = []
+    for relative_path, size in orphans:
+        try:
+            mtime = storage.mtime(relative_path)
+            if mtime is None or mtime >= now - MEDIA_GC_GRACE_PERIOD:
+                # Removed or uploaded again since the scan
+                continue
+            if mode == "delete":
+                reclaimed += delete_file(relative_path)
+            else:
+                storage.move(relative_path, os.path.join(MEDIA_QUARANTINE, batch, relative_path))
+                reclaimed += size
+        except FileNotFoundError:
+            continue
+        removed.append(relative_path)
+    return reclaimed, removed
+
+
+async def collect_media(mode: str = MEDIA_GC_MODE, dry_run: bool = False):
+    if mode not in ("quarantine", "delete"):
+        raise ValueError(f"mode inconnu : {mode}")
+    async with AsyncSessionLocal() as db:
+        # refCount read before the rows : a write made in between changes refCount
+        # and the correction below is skipped
+        ref_counts = await get_media_ref_counts(db)
+        references = await get_referenced_media(db)
+    referenced = {media_path(file_url) for file_url in references}
+    fixes = [(file_url, seen, references[file_url]) for file_url, seen in ref_counts.items() if seen != references[file_url]]
+
+    # Storage work in a thread (blocking calls), the worker loop stays responsive
+    now = time.time()
+    scanned, orphans = await asyncio.to_thread(
+        find_orphans, referenced, {media_path(file_url): seen for file_url, seen in ref_counts.items()}, now,
+    )
+    summary = {
+        "mode": mode,
+        "dry_run": dry_run,
+        "scanned": scanned,
+        "orphans": len(orphans),
+        "orphan_bytes": sum(size for _, size in orphans),
+        "reclaimed_bytes": 0,
+        "refcount_fixed": len(fixes),
+    }
+    if dry_run:
+        summary["files"] = [relative_path for relative_path, _ in orphans[:1000]]
+        return summary
+
+    async with AsyncSessionLocal() as db:
+        await fix_media_ref_counts(db, fixes)
+    summary["reclaimed_bytes"], removed = await asyncio.to_thread(remove_orphans, orphans, mode, now)
+    summary["purged_quarantine_bytes"] = await asyncio.to_thread(_purge_quarantine, now)
+
+    # Only the rows of the files actually removed
+    stored = [os.path.join(MEDIA_URL, relative_path).replace("\\", "/") for relative_path in removed if relative_path.startswith(MEDIA_STORE + os.sep)]
+    if stored:
+        async with AsyncSessionLocal() as db:
+            await delete_media_rows(db, stored)
+    return summary
@@ -0,0 +1,134 @@
+import bisect
+import logging
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from fastapi import Request
+from sqlalchemy import event
+from settings.config import METRICS_BUCKETS, N_PLUS_ONE_THRESHOLD
+
+# Per request latency, number of SQL statements and time spent in the database.
+#   - Server-Timing header on every response (visible in the browser dev tools)
+#   - GET /metrics : Prometheus text format, totals since the start of the process.
+#     With several uvicorn workers every worker has its own totals.
+#   - a statement run N_PLUS_ONE_THRESHOLD times or more in one request is
+#     reported as a N+1 (logged as a warning and counted in n_plus_one_total)
+
+# Stats of the request being handled, None outside of a request (startup, worker.py)
+_current_request = ContextVar("current_request", default=None)
+logger = logging.getLogger(__name__)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+
+
+class Metrics:
+    # Counters and histograms labelled by (method, route)
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self.requests = Counter()  # (method, route, status) -> count
+        self.duration_buckets = defaultdict(lambda: [0] * (len(buckets) + 1))
+        self.duration_sum = Counter()
+        self.duration_count = Counter()
+        self.queries = Counter()
+        self.db_time = Counter()
+        self.n_plus_one = Counter()
+
+    def observe(self, method: str, route: str, status_code: int, duration: float, stats: RequestStats, n_plus_one: bool):
+        key = (method, route)
+        self.requests[(method, route, status_code)] += 1
+        self.duration_buckets[key][bisect.bisect_left(self.buckets, duration)] += 1
+        self.duration_sum[key] += duration
+        self.duration_count[key] += 1
+        self.queries[key] += stats.queries
+        self.db_time[key] += stats.db_time
+        if n_plus_one:
+            self.n_plus_one[key] += 1
+
+    def render(self):
+        def labels(method, route, **extra):
+            pairs = {"method": method, "route": route, **extra}
+            return "{" + ",".join(f'{name}="{value}"' for name, value in pairs.items()) + "}"
+
+        lines = [
+            "# HELP http_requests_total Requests handled.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status_code), count in sorted(self.requests.items()):
+            lines.append(f"http_requests_total{labels(method, route, status=status_code)} {count}")
+
+        lines += [
+            "# HELP http_request_duration_seconds Request latency.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), counts in sorted(self.duration_buckets.items()):
+            cumulated = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulated += count
+                lines.append(f"http_request_duration_seconds_bucket{labels(method, route, le=bound)} {cumulated}")
+            lines.append(f"http_request_duration_seconds_sum{labels(method, route)} {self.duration_sum[(method, route)]:.6f}")
+            lines.append(f"http_request_duration_seconds_count{labels(method, route)} {self.duration_count[(method, route)]}")
+
+        for name, help_text, values, fmt in (
+            ("db_queries_total", "SQL statements run by the requests.", self.queries, "{}"),
+            ("db_query_duration_seconds_total", "Time spent in the database by the requests.", self.db_time, "{:.6f}"),
+            ("n_plus_one_total", f"Requests running a statement {N_PLUS_ONE_THRESHOLD} times or more.", self.n_plus_one, "{}"),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (method, route), value in sorted(values.items()):
+                lines.append(f"{name}{labels(method, route)} {fmt.format(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+        stats.statements[statement] += 1
+
+
+def instrument_engine(engine):
+    # engine : sync engine, for an AsyncEngine pass async_engine.sync_engine
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+async def metrics_middleware(request: Request, call_next):
+    stats = RequestStats()
+    token = _current_request.set(stats)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _current_request.reset(token)
+    duration = time.perf_counter() - start
+
+    # Route template ("/formations/{formation_id}/") : one serie per route, not per id
+    route = request.scope.get("route")
+    route = route.path if route is not None else "<aucune>"
+
+    statement, repeated = stats.statements.most_common(1)[0] if stats.statements else ("", 0)
+    n_plus_one = repeated >= N_PLUS_ONE_THRESHOLD
+    if n_plus_one:
+        logger.warning("N+1 : %s %s a exécuté %d fois : %s", request.method, route, repeated, " ".join(statement.split()))
+
+    metrics.observe(request.method, route, response.status_code, duration, stats, n_plus_one)
+    # Streamed bodies (exports) run their queries after this point, they are not counted
+    response.headers["Server-Timing"] = (
+        f'app;dur={duration * 1000:.1f}, db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} requetes SQL"'
+    )
+    return response
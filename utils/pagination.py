@@ -0,0 +1,73 @@
+from typing import Optional
+from fastapi import HTTPException, Query, Response, status
+from sqlalchemy import and_, or_, select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from settings.config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from utils.filters import check_column
+
+
+class Page:
+    # Query parameters shared by every list endpoint :
+    #   limit      : max number of rows returned
+    #   after      : X-Next-Cursor of the previous page (keyset cursor)
+    #   with_total : also count the whole table (X-Total-Count), off by default
+    #   sort       : indexed column to sort on, "-column" for descending (default "id")
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = Query(None),
+        with_total: bool = Query(False),
+        sort: Optional[str] = Query(None),
+    ):
+        self.limit = limit
+        self.after = after
+        self.with_total = with_total
+        self.sort = sort
+
+
+def _parse_cursor(model, column, cursor: str):
+    # "id" when sorted on the primary key, "value,id" otherwise
+    try:
+        if column is model.id:
+            return None, int(cursor)
+        value, last_id = cursor.rsplit(",", 1)
+        return column.type.python_type(value), int(last_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Curseur de pagination invalide !")
+
+
+async def paginate(db: AsyncSession, model, page: Page, response: Response, query=None):
+    # Keyset pagination : "WHERE (column, id) > (:value, :id) ORDER BY column, id LIMIT n"
+    # walks an index, so every page costs the same whatever its position.
+    if query is None:
+        query = select(model)
+
+    descending = bool(page.sort) and page.sort.startswith("-")
+    column = check_column(model, page.sort.lstrip("-") if page.sort else "id", "tri")
+
+    if page.with_total:
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
+        response.headers["X-Total-Count"] = str(total)
+
+    if page.after is not None:
+        value, last_id = _parse_cursor(model, column, page.after)
+        if column is model.id:
+            query = query.where(model.id < last_id if descending else model.id > last_id)
+        elif descending:
+            query = query.where(or_(column < value, and_(column==value, model.id < last_id)))
+        else:
+            query = query.where(or_(column > value, and_(column==value, model.id > last_id)))
+
+    order = [column] if column is model.id else [column, model.id]
+    if descending:
+        order = [key.desc() for key in order]
+
+    # One extra row tells if there is a next page without counting
+    result = (await db.scalars(query.order_by(*order).limit(page.limit + 1))).all()
+    if len(result) > page.limit:
+        result = result[:page.limit]
+        last = result[-1]
+        cursor = str(last.id) if column is model.id else f"{getattr(last, column.key)},{last.id}"
+        response.headers["X-Next-Cursor"] = cursor
+
+    return result
@@ -0,0 +1,316 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+import uuid
+import aiofiles
+from fastapi import HTTPException, UploadFile, status
+from settings.config import MEDIA_ROOT, MEDIA_STORE, MEDIA_TMP, MEDIA_STORAGE, MEDIA_S3, MAX_UPLOAD_SIZE, UPLOAD_CHUNK_SIZE
+
+# Where the media files are kept (MEDIA_STORAGE) :
+#   "filesystem" : under MEDIA_ROOT, served by GET /medias/ (utils.media)
+#   "s3"         : in the bucket MEDIA_S3 of any S3 API (AWS, MinIO, moto server...).
+#                  GET /medias/ redirects to a presigned URL : the bytes go from the
+#                  bucket to the client, not through the API workers. Every replica
+#                  of the API sees the same files.
+# The files are named by their path relative to MEDIA_ROOT ("store/ab/cd/<sha256>.png"),
+# the same string is the key in the bucket.
+# Except save_upload, the methods are blocking (boto3 is synchronous) : from the
+# event loop call them with `await storage.run(method, ...)`, the process pools
+# (images, certificates) call them directly.
+
+
+async def iter_upload(upload_file: UploadFile, max_size=None, chunk_size=UPLOAD_CHUNK_SIZE):
+    # Chunks of the upload, only one is held in memory at a time.
+    # 413 as soon as max_size (MAX_UPLOAD_SIZE by default) is exceeded
+    if max_size is None:
+        max_size = MAX_UPLOAD_SIZE
+    if upload_file.size is not None and upload_file.size > max_size:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Le fichier est trop volumineux !")
+    size = 0
+    while chunk := await upload_file.read(chunk_size):
+        size += len(chunk)
+        if size > max_size:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Le fichier est trop volumineux !")
+        yield chunk
+
+
+def stored_path(digest: str, extension: str):
+    # Content addressed layout : <MEDIA_STORE>/ab/cd/abcd...<extension>
+    # two levels of sharding keep every directory small
+    return os.path.join(MEDIA_STORE, digest[:2], digest[2:4], f"{digest}{extension.lower()}")
+
+
+class FileSystemStorage:
+    presigned = False
+
+    def __init__(self, root=MEDIA_ROOT):
+        self.root = root
+
+    async def run(self, func, *args):
+        # Local disk : called inline like the rest of the file handling
+        return func(*args)
+
+    def path(self, relative_path: str):
+        return os.path.join(self.root, relative_path)
+
+    async def save_upload(self, upload_file: UploadFile):
+        # Copied into a temporary file while hashed (the name is only known once
+        # hashed), then renamed. Returns (relative path, sha256, size)
+        tmp_dir = self.path(MEDIA_TMP)
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        os.close(fd)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as out_file:
+                async for chunk in iter_upload(upload_file):
+                    size += len(chunk)
+                    digest.update(chunk)
+                    await out_file.write(chunk)
+
+            relative_path = stored_path(digest.hexdigest(), os.path.splitext(upload_file.filename or "")[1])
+            file_path = self.path(relative_path)
+            if os.path.exists(file_path):
+                # Same content already stored. Touched : the media GC keeps the recent files
+                os.remove(tmp_path)
+                os.utime(file_path)
+            else:
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                # Atomic : two concurrent uploads of the same content write the same bytes
+                os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return relative_path, digest.hexdigest(), size
+
+    def read(self, relative_path: str):
+        with open(self.path(relative_path), "rb") as media_file:
+            return media_file.read()
+
+    def write(self, relative_path: str, data: bytes):
+        file_path = self.path(relative_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(f"{file_path}.tmp", "wb") as media_file:
+            media_file.write(data)
+        os.replace(f"{file_path}.tmp", file_path)
+
+    def write_file(self, relative_path: str, local_path: str):
+        # local_path : file written by the caller (exports), moved in place
+        file_path = self.path(relative_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        shutil.move(local_path, file_path)
+
+    def exists(self, relative_path: str):
+        return os.path.isfile(self.path(relative_path))
+
+    def mtime(self, relative_path: str):
+        try:
+            return os.path.getmtime(self.path(relative_path))
+        except FileNotFoundError:
+            return None
+
+    def delete(self, relative_path: str):
+        # Returns the number of bytes freed, 0 when the file does not exist
+        file_path = self.path(relative_path)
+        try:
+            size = os.path.getsize(file_path)
+            os.remove(file_path)
+        except FileNotFoundError:
+            return 0
+        return size
+
+    def delete_prefix(self, directory: str):
+        freed = sum(size for _, size, _ in self.iter_files(directory))
+        shutil.rmtree(self.path(directory), ignore_errors=True)
+        return freed
+
+    def move(self, relative_path: str, target: str):
+        target_path = self.path(target)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        os.replace(self.path(relative_path), target_path)
+
+    def iter_files(self, directory: str):
+        # (relative path, size, mtime) of every file under directory
+        for root, _, names in os.walk(self.path(directory)):
+            for name in names:
+                full_path = os.path.join(root, name)
+                try:
+                    file_stat = os.stat(full_path)
+                except FileNotFoundError:
+                    continue
+                yield os.path.relpath(full_path, self.root), file_stat.st_size, file_stat.st_mtime
+
+    def presigned_url(self, relative_path: str):
+        return None
+
+
+class S3Storage:
+    presigned = True
+
+    def __init__(self, settings=MEDIA_S3):
+        # Optional dependency, only needed with MEDIA_STORAGE = "s3"
+        import boto3
+        from botocore.config import Config
+        self.bucket = settings["BUCKET"]
+        self.part_size = settings["PART_SIZE"]
+        self.expiry = settings["PRESIGNED_EXPIRY"]
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=settings["ENDPOINT_URL"],
+            aws_access_key_id=settings["ACCESS_KEY"],
+            aws_secret_access_key=settings["SECRET_KEY"],
+            region_name=settings["REGION"],
+            config=Config(signature_version="s3v4", s3={"addressing_style": "path"}),
+        )
+
+    async def run(self, func, *args):
+        # Network calls : in a thread, the event loop is not blocked
+        return await asyncio.to_thread(func, *args)
+
+    def key(self, relative_path: str):
+        return relative_path.replace("\\", "/")
+
+    async def _upload_part(self, key: str, upload_id: str, number: int, data: bytes):
+        part = await asyncio.to_thread(
+            self.client.upload_part, Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=data,
+        )
+        return {"ETag": part["ETag"], "PartNumber": number}
+
+    async def save_upload(self, upload_file: UploadFile):
+        # Multipart upload to a temporary key while hashed, one part of PART_SIZE
+        # bytes in memory at a time, then copied to its content addressed key by
+        # the server (the bytes are not sent twice). Returns (relative path, sha256, size)
+        tmp_key = f"{MEDIA_TMP}/{uuid.uuid4().hex}"
+        multipart = await asyncio.to_thread(self.client.create_multipart_upload, Bucket=self.bucket, Key=tmp_key)
+        upload_id = multipart["UploadId"]
+        digest = hashlib.sha256()
+        size = 0
+        parts = []
+        buffer = bytearray()
+        try:
+            async for chunk in iter_upload(upload_file):
+                size += len(chunk)
+                digest.update(chunk)
+                buffer += chunk
+                if len(buffer) >= self.part_size:
+                    parts.append(await self._upload_part(tmp_key, upload_id, len(parts) + 1, bytes(buffer)))
+                    buffer.clear()
+            if buffer or not parts:
+                parts.append(await self._upload_part(tmp_key, upload_id, len(parts) + 1, bytes(buffer)))
+            await asyncio.to_thread(
+                self.client.complete_multipart_upload,
+                Bucket=self.bucket, Key=tmp_key, UploadId=upload_id, MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            await asyncio.to_thread(self.client.abort_multipart_upload, Bucket=self.bucket, Key=tmp_key, UploadId=upload_id)
+            raise
+
+        relative_path = stored_path(digest.hexdigest(), os.path.splitext(upload_file.filename or "")[1])
+        try:
+            # Same content already stored : copied onto itself, it only refreshes
+            # LastModified (the media GC keeps the recent files)
+            source = relative_path if await asyncio.to_thread(self.exists, relative_path) else tmp_key
+            await asyncio.to_thread(self._copy, source, relative_path)
+        finally:
+            await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=tmp_key)
+        return relative_path, digest.hexdigest(), size
+
+    def _copy(self, source: str, relative_path: str):
+        self.client.copy_object(
+            Bucket=self.bucket,
+            Key=self.key(relative_path),
+            CopySource={"Bucket": self.bucket, "Key": self.key(source)},
+            ContentType=mimetypes.guess_type(relative_path)[0] or "application/octet-stream",
+            MetadataDirective="REPLACE",
+        )
+
+    def _head(self, relative_path: str):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.key(relative_path))
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def read(self, relative_path: str):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.key(relative_path))["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            # Same as the filesystem backend
+            raise FileNotFoundError(relative_path)
+
+    def write(self, relative_path: str, data: bytes):
+        self.client.put_object(
+            Bucket=self.bucket, Key=self.key(relative_path), Body=data,
+            ContentType=mimetypes.guess_type(relative_path)[0] or "application/octet-stream",
+        )
+
+    def write_file(self, relative_path: str, local_path: str):
+        # upload_file switches to a multipart upload for the large files
+        try:
+            self.client.upload_file(
+                local_path, self.bucket, self.key(relative_path),
+                ExtraArgs={"ContentType": mimetypes.guess_type(relative_path)[0] or "application/octet-stream"},
+            )
+        finally:
+            os.remove(local_path)
+
+    def exists(self, relative_path: str):
+        return self._head(relative_path) is not None
+
+    def mtime(self, relative_path: str):
+        head = self._head(relative_path)
+        return head["LastModified"].timestamp() if head else None
+
+    def delete(self, relative_path: str):
+        head = self._head(relative_path)
+        if head is None:
+            return 0
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(relative_path))
+        return head["ContentLength"]
+
+    def delete_prefix(self, directory: str):
+        # delete_objects takes up to 1000 keys
+        freed = 0
+        batch = []
+        for relative_path, size, _ in list(self.iter_files(directory)):
+            freed += size
+            batch.append({"Key": self.key(relative_path)})
+            if len(batch) == 1000:
+                self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": batch, "Quiet": True})
+                batch = []
+        if batch:
+            self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": batch, "Quiet": True})
+        return freed
+
+    def move(self, relative_path: str, target: str):
+        self._copy(relative_path, target)
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(relative_path))
+
+    def iter_files(self, directory: str):
+        # directory "" : the whole bucket
+        prefix = self.key(directory).rstrip("/")
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix + "/" if prefix else ""):
+            for item in page.get("Contents", []):
+                yield item["Key"], item["Size"], item["LastModified"].timestamp()
+
+    def presigned_url(self, relative_path: str):
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self.key(relative_path)}, ExpiresIn=self.expiry,
+        )
+
+
+def create_storage():
+    if MEDIA_STORAGE == "s3":
+        return S3Storage()
+    return FileSystemStorage()
+
+
+storage = create_storage()
@@ -0,0 +1,10 @@
+import asyncio
+from database_sys import models
+from database_sys.database import engine
+from utils.jobs import run_worker
+
+# Background jobs worker (certificates, exports...) : python worker.py
+# Several workers can run at the same time, next to uvicorn.
+if __name__ == "__main__":
+    models.Base.metadata.create_all(bind=engine)
+    asyncio.run(run_worker())